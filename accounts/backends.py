@@ -53,6 +53,7 @@ class AuthWithUsernameOrEmailBackend(ModelBackend):
         """
         if action == 'view':
             return True
-        if action in ('change', 'delete') and hasattr(obj, 'created_by') and obj.created_by == user_obj:
+        # Compare the ids to avoid loading `obj.created_by` from the database.
+        if action in ('change', 'delete') and getattr(obj, 'created_by_id', None) == user_obj.pk:
             return True
         return False
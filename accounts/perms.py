@@ -0,0 +1,43 @@
+from .visibility import SCOPE_SELF, get_visible_user_ids
+
+OBJ_PERMS_ATTR = '_obj_perms'
+
+
+def prefetch_obj_perms(user, objects, actions=('change', 'delete', 'comment')):
+    """
+    Compute the object permissions of `user` on a whole page of `objects` at once and
+    attach them to every object, so that the `can_change`, `can_delete` and
+    `can_comment` template filters don't need to hit the database for each row.
+    The rules are the same as `AuthWithUsernameOrEmailBackend.has_obj_perm` and
+    `Profile.is_supervisor_of`. Return the objects as a list.
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+    is_superuser = user.is_active and user.is_superuser
+    supervised_user_ids = set()
+    if 'comment' in actions:
+        supervised_user_ids = set(get_visible_user_ids(user, fallback=SCOPE_SELF))
+        supervised_user_ids.discard(user.pk)
+    for obj in objects:
+        creator_id = getattr(obj, 'created_by_id', None)
+        is_creator = creator_id is not None and creator_id == user.pk
+        perms = {'user_id': user.pk, 'view': True}
+        if 'change' in actions:
+            perms['change'] = is_superuser or is_creator
+        if 'delete' in actions:
+            perms['delete'] = is_superuser or is_creator
+        if 'comment' in actions:
+            perms['comment'] = creator_id in supervised_user_ids
+        setattr(obj, OBJ_PERMS_ATTR, perms)
+    return objects
+
+
+def get_prefetched_obj_perm(user, obj, action):
+    """
+    Return the prefetched permission of `action`, or None if it was not prefetched for `user`.
+    """
+    perms = getattr(obj, OBJ_PERMS_ATTR, None)
+    if perms is None or perms['user_id'] != user.pk:
+        return None
+    return perms.get(action)
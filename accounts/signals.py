@@ -1,8 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
+from . import visibility
 from .models import GroupProfile, Profile
 
 User = get_user_model()
@@ -24,3 +25,22 @@ def put_group_profile(sender, instance, created, **kwargs):
     if created:
         GroupProfile.objects.create(group=instance)
     instance.groupprofile.save()
+
+
+# Visibility scopes (see accounts/visibility.py)
+@receiver(post_save, sender=Profile, dispatch_uid='invalidate_profile_visibility')
+def invalidate_profile_visibility(sender, instance, **kwargs):
+    visibility.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=GroupProfile, dispatch_uid='invalidate_groupprofile_visibility')
+@receiver(post_delete, sender=Group, dispatch_uid='invalidate_group_visibility')
+def invalidate_group_visibility(sender, instance, **kwargs):
+    visibility.bump_version()
+
+
+@receiver(m2m_changed, sender=GroupProfile.supervise_roles.through, dispatch_uid='invalidate_supervise_roles_visibility')
+@receiver(m2m_changed, sender=User.groups.through, dispatch_uid='invalidate_user_groups_visibility')
+def invalidate_membership_visibility(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        visibility.bump_version()
@@ -1,3 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache, caches
 from django.test import TestCase
 
-# Create your tests here.
+from diary.models import Diary
+
+from core.templatetags.custom_templatetags import can_change, can_comment, can_delete
+
+from . import visibility
+from .perms import prefetch_obj_perms
+from .visibility import SCOPE_DEPARTMENTS, SCOPE_SELF, filter_visible, get_visible_user_ids
+
+User = get_user_model()
+
+
+class VisibilityScopeTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.supervisor = User.objects.create_user(username='supervisor', password='password')
+        self.member = User.objects.create_user(username='member', password='password')
+        self.outsider = User.objects.create_user(username='outsider', password='password')
+        self.role = Group.objects.create(name='manager')
+        self.team = Group.objects.create(name='team')
+        self.department = Group.objects.create(name='department')
+        self.department.groupprofile.is_department = True
+        self.department.groupprofile.save()
+        self.supervisor.groups.add(self.role, self.department)
+        self.outsider.groups.add(self.department)
+        self.member.groups.add(self.team)
+
+    def activate_role(self):
+        self.role.groupprofile.supervise_roles.add(self.team)
+        self.supervisor.profile.activated_role = self.role
+        self.supervisor.profile.save()
+
+    def test_fallbacks_without_role(self):
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.supervisor.pk])
+        self.assertEqual(
+            get_visible_user_ids(self.supervisor, SCOPE_DEPARTMENTS),
+            sorted([self.supervisor.pk, self.outsider.pk]),
+        )
+
+    def test_supervise_roles(self):
+        self.activate_role()
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.member.pk])
+
+    def test_scope_is_cached(self):
+        self.activate_role()
+        get_visible_user_ids(self.supervisor, SCOPE_SELF)
+        # Only the read of the versions shared by the workers.
+        with self.assertNumQueries(1):
+            get_visible_user_ids(self.supervisor, SCOPE_SELF)
+
+    def test_scope_is_invalidated_on_membership_change(self):
+        self.activate_role()
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.member.pk])
+        self.outsider.groups.add(self.team)
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), sorted([self.member.pk, self.outsider.pk]))
+        self.role.groupprofile.supervise_roles.remove(self.team)
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.supervisor.pk])
+
+    def test_scope_is_invalidated_by_another_process(self):
+        self.activate_role()
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.member.pk])
+        # Another worker changes the membership: only the shared cache is seen by both.
+        User.groups.through.objects.create(user=self.outsider, group=self.team)
+        caches['shared'].incr(visibility.VERSION_CACHE_KEY)
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), sorted([self.member.pk, self.outsider.pk]))
+
+    def test_scope_is_invalidated_on_role_change(self):
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.supervisor.pk])
+        self.activate_role()
+        self.assertEqual(get_visible_user_ids(self.supervisor, SCOPE_SELF), [self.member.pk])
+
+    def test_filter_has_no_distinct(self):
+        self.activate_role()
+        Diary.objects.create(daily_record='record', created_by=self.member)
+        Diary.objects.create(daily_record='record', created_by=self.outsider)
+        queryset = filter_visible(Diary.objects.all(), self.supervisor)
+        self.assertFalse(queryset.query.distinct)
+        self.assertEqual([diary.created_by_id for diary in queryset], [self.member.pk])
+
+
+class PrefetchObjPermsTestCase(VisibilityScopeTestCase):
+
+    def test_flags_match_per_object_checks(self):
+        self.activate_role()
+        diaries = [
+            Diary.objects.create(daily_record='record', created_by=self.supervisor),
+            Diary.objects.create(daily_record='record', created_by=self.member),
+            Diary.objects.create(daily_record='record', created_by=self.outsider),
+        ]
+        expected = [
+            (can_change(self.supervisor, diary), can_delete(self.supervisor, diary), can_comment(self.supervisor, diary))
+            for diary in Diary.objects.all()
+        ]
+        objects = prefetch_obj_perms(self.supervisor, Diary.objects.all())
+        with self.assertNumQueries(0):
+            flags = [
+                (can_change(self.supervisor, obj), can_delete(self.supervisor, obj), can_comment(self.supervisor, obj))
+                for obj in objects
+            ]
+        self.assertEqual(flags, expected)
+        self.assertEqual(len(flags), len(diaries))
+
+    def test_flags_are_ignored_for_another_user(self):
+        diary = Diary.objects.create(daily_record='record', created_by=self.member)
+        objects = prefetch_obj_perms(self.member, [diary])
+        self.assertTrue(can_change(self.member, objects[0]))
+        self.assertFalse(can_change(self.outsider, objects[0]))
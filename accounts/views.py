@@ -4,6 +4,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
+from . import visibility
 from .forms import ProfileForm, SignUpWithEmailForm
 from .models import Profile
 
@@ -90,5 +91,6 @@ def role_change(request, pk):
     queryset = request.user.groups.filter(groupprofile__is_role=True, groupprofile__is_displayed=True)
     role = get_object_or_404(klass=queryset, pk=pk)
     request.user.profile.activated_role = role
-    request.user.profile.save()
+    request.user.profile.save(update_fields=['activated_role'])
+    visibility.invalidate_user(request.user.pk)
     return redirect(request.META.get('HTTP_REFERER', '/'))
@@ -0,0 +1,99 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from core import versions
+
+from .models import GroupProfile
+
+User = get_user_model()
+
+# What a user sees when the activated role supervises nothing.
+# `SCOPE_SELF`: only the objects created by the user.
+# `SCOPE_DEPARTMENTS`: the objects created by anyone in the user's departments.
+SCOPE_SELF = 'self'
+SCOPE_DEPARTMENTS = 'departments'
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_CACHE_KEY = 'accounts:visibility:version'
+
+# Some backends (e.g. MSSQL) can not take more than ~2100 parameters in a query.
+# Above this size, a subquery on `auth_user_groups` is used instead of a literal list.
+MAX_IN_LIST_SIZE = 2000
+
+
+def get_user_version_key(user_id):
+    return f'{VERSION_CACHE_KEY}:{user_id}'
+
+
+def bump_version():
+    """
+    Invalidate the visibility scopes of every user. It is called when something
+    shared by many users changes, e.g. a group membership or the supervise roles of a role.
+    """
+    versions.bump_version(VERSION_CACHE_KEY)
+
+
+def get_cache_key(user_id, fallback):
+    # The versions are shared by the workers, so an invalidation is seen by all of them.
+    version, user_version = versions.get_versions(VERSION_CACHE_KEY, get_user_version_key(user_id))
+    return f'accounts:visibility:{version}:{user_version}:{user_id}:{fallback}'
+
+
+def invalidate_user(user_id):
+    """
+    Invalidate the visibility scopes of a single user, e.g. when the activated role changes.
+    """
+    versions.bump_version(get_user_version_key(user_id))
+
+
+def get_scope_group_ids(user, fallback):
+    """
+    Return the ids of the groups whose members' objects are visible to `user`,
+    or None if `user` could only see his own objects.
+    """
+    role_id = user.profile.activated_role_id
+    group_ids = []
+    if role_id:
+        through = GroupProfile.supervise_roles.through
+        group_ids = list(through.objects.filter(groupprofile__group_id=role_id).values_list('group_id', flat=True))
+    if group_ids:
+        return group_ids
+    if fallback == SCOPE_SELF:
+        return None
+    return list(user.groups.filter(groupprofile__is_department=True).values_list('pk', flat=True))
+
+
+def resolve_visible_user_ids(user, fallback):
+    group_ids = get_scope_group_ids(user, fallback=fallback)
+    if group_ids is None:
+        return [user.pk]
+    through = User.groups.through
+    user_ids = through.objects.filter(group_id__in=group_ids).values_list('user_id', flat=True)
+    return sorted(set(user_ids))
+
+
+def get_visible_user_ids(user, fallback=SCOPE_SELF):
+    """
+    Return a sorted list of the ids of the users whose objects are visible to `user`.
+    The list is resolved once and cached until the role/group settings change.
+    """
+    role_id = user.profile.activated_role_id
+    key = get_cache_key(user.pk, fallback)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == role_id:
+        return cached[1]
+    user_ids = resolve_visible_user_ids(user, fallback=fallback)
+    cache.set(key, (role_id, user_ids), timeout=CACHE_TIMEOUT)
+    return user_ids
+
+
+def filter_visible(queryset, user, fallback=SCOPE_SELF, field_name='created_by'):
+    """
+    Filter `queryset` with a plain `<field_name>_id IN (...)` so that no join or
+    DISTINCT is needed.
+    """
+    user_ids = get_visible_user_ids(user, fallback=fallback)
+    if len(user_ids) > MAX_IN_LIST_SIZE:
+        group_ids = get_scope_group_ids(user, fallback=fallback)
+        user_ids = User.groups.through.objects.filter(group_id__in=group_ids).values('user_id')
+    return queryset.filter(**{f'{field_name}_id__in': user_ids})
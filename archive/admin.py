@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Archive
+from .models import Archive, ArchiveConversion
 
 class ArchiveAdmin(admin.ModelAdmin):
     search_fields = ['name']
@@ -8,4 +8,10 @@ class ArchiveAdmin(admin.ModelAdmin):
     list_display = ['name', 'type', 'is_permanent', 'visible_at', 'visible_due', 'created_by']
     list_editable = ['is_permanent', 'visible_at', 'visible_due']
 
-admin.site.register(Archive, ArchiveAdmin)
\ No newline at end of file
+admin.site.register(Archive, ArchiveAdmin)
+
+class ArchiveConversionAdmin(admin.ModelAdmin):
+    list_display = ['archive', 'content_hash', 'created_count', 'created_by', 'created_at']
+    readonly_fields = ['subjects']
+
+admin.site.register(ArchiveConversion, ArchiveConversionAdmin)
@@ -4,13 +4,14 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 import os
 
-from .storage import UUIDFileSystemStorage
+from core.storage import ContentAddressedStorage
+from core.utils import now
 
-uuid_file_system_storage = UUIDFileSystemStorage()
+content_storage = ContentAddressedStorage()
 
 
 class Archive(models.Model):
-    archive = models.FileField(storage=uuid_file_system_storage, upload_to='archive')
+    archive = models.FileField(storage=content_storage, upload_to='archive')
     name = models.CharField(max_length=255)
     type = models.CharField(max_length=255)
     created_by = models.ForeignKey(to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -60,3 +61,22 @@ class Archive(models.Model):
         return (self.is_excel_file() and 
                 self.name and 
                 '網應處月會行事曆' in self.name)
+
+
+class ArchiveConversion(models.Model):
+    """
+    A conversion of an archive into reminders, with the hash of the converted content.
+    """
+    archive = models.ForeignKey(to=Archive, on_delete=models.CASCADE, related_name='conversions')
+    content_hash = models.CharField(max_length=64, db_index=True)
+    # The email subjects of the reminders of the content, which identify them on the next conversion.
+    subjects = models.JSONField(default=list, blank=True)
+    created_count = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=now)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.archive} ({self.content_hash[:12]})'
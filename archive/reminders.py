@@ -0,0 +1,232 @@
+"""
+The conversion of the meeting calendar Excel of an archive into reminders.
+
+The meetings are read with pandas and the reminders are computed column by column, then
+inserted with one `bulk_create` in a transaction.
+
+A conversion is recorded with the sha256 of the archive content. The same content is not
+converted twice, and a new content of the archive is diffed with the existing reminders:
+a reminder is identified by its email subject, which has the event and the meeting time,
+so only the new meetings are created, the reminders of the meetings no longer in the
+calendar are deactivated, and the ones of the meetings put back are reactivated.
+"""
+import hashlib
+from datetime import timedelta
+
+import pandas as pd
+from django.db import transaction
+
+from reminder import schedule
+from reminder.models import Reminder
+
+from .models import Archive, ArchiveConversion
+
+REMIND_BEFORE = timedelta(days=7)
+EMAIL_CONTENT = '''親愛的同仁，
+
+提醒您參加以下會議：
+
+• 會議名稱：{event}
+• 會議時間：{meeting_time}
+• 會議地點：{meeting_room}
+
+請準時參加，謝謝！'''
+
+
+def get_department_email(department_code):
+    """根據部門代碼取得群組郵件"""
+    # 部門郵箱對應表
+    department_emails = {
+        'I00': [
+            'i00@chief.com.tw',
+            'i00_manager@chief.com.tw',
+            'gino_kao@chief.com.tw',
+            'kenny_jan@chief.com.tw',
+            'morris_fu@chief.com.tw',
+            'aaron_lin@chief.com.tw',
+            'ryan_hsiao@chief.com.tw',
+            'eric_wu@chief.com.tw',
+            'hank_tsai@chief.com.tw',
+            'louis_wen@chief.com.tw',
+            'rico@chief.com.tw',
+            'brian_chiang@chief.com.tw',
+            'jenny_hung@chief.com.tw'
+        ],
+        'I01': [
+            'i00@chief.com.tw',
+            'i01@chief.com.tw'
+        ],
+        'I02': [
+            'i00@chief.com.tw',
+            'i02@chief.com.tw'
+        ],
+        'I03': [
+            'i00@chief.com.tw',
+            'i03@chief.com.tw'
+        ],
+        'I04': [
+            'i00@chief.com.tw',
+            'i04@chief.com.tw'
+        ],
+        '工程師大會': [
+            'i00@chief.com.tw',
+            'i01@chief.com.tw',
+            'i02@chief.com.tw',
+            'i03@chief.com.tw',
+            'i04@chief.com.tw'
+        ]
+    }
+    
+    # 返回對應的郵箱列表，如果找不到則返回空列表
+    return department_emails.get(department_code, [])
+
+
+def get_recipients(department):
+    return ';'.join(get_department_email(department)) or f'{department.lower()}@chief.com.tw'
+
+
+def get_content_hash(archive):
+    content_hash = hashlib.sha256()
+    with archive.archive.open('rb') as f:
+        for chunk in f.chunks():
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def read_meetings(file):
+    """
+    Return a DataFrame of department, meeting_time and meeting_room of the columns B to D of `file`,
+    without the rows missing a department or a valid meeting time.
+    """
+    df = pd.read_excel(file)
+    # The first row under the header is the column titles.
+    meetings = df.iloc[1:, 1:4]
+    meetings.columns = ['department', 'meeting_time', 'meeting_room']
+    meetings = meetings.assign(
+        department=meetings['department'].astype('string').str.strip(),
+        meeting_time=pd.to_datetime(meetings['meeting_time'], errors='coerce'),
+        meeting_room=meetings['meeting_room'].fillna('').astype(str).str.strip(),
+    )
+    meetings = meetings.dropna(subset=['department', 'meeting_time'])
+    return meetings[meetings['department'] != '']
+
+
+def build_reminders(meetings, user):
+    """
+    Return the unsaved reminders of `meetings`, one per distinct email subject.
+    """
+    department = meetings['department']
+    meeting_time = meetings['meeting_time']
+    event = department.where(department.str.contains('工程師大會', regex=False), department + ' 月會')
+    recipients = department.map({d: get_recipients(d) for d in department.unique()})
+    columns = pd.DataFrame({
+        'event': event,
+        'start_at': (meeting_time - REMIND_BEFORE).dt.date,
+        'email_subject': '提醒：' + event + ' (' + meeting_time.dt.strftime('%Y-%m-%d %H:%M') + ')',
+        'meeting_time': meeting_time.dt.strftime('%Y年%m月%d日 %H:%M'),
+        'meeting_room': meetings['meeting_room'],
+        'recipients': recipients,
+    }).drop_duplicates('email_subject', keep='last')
+    reminders = []
+    for row in columns.itertuples(index=False):
+        reminder = Reminder(
+            created_by=user,
+            event=row.event,
+            policy='once',
+            start_at=row.start_at,
+            end_at=row.start_at,
+            email_subject=row.email_subject,
+            email_content=EMAIL_CONTENT.format(event=row.event, meeting_time=row.meeting_time, meeting_room=row.meeting_room),
+            recipients=row.recipients,
+            is_active=True,
+        )
+        # `bulk_create` skips `Reminder.save`.
+        reminder.next_fire_at = schedule.get_next_fire_at(reminder)
+        reminders.append(reminder)
+    return reminders
+
+
+class ConversionPlan:
+    """
+    What a conversion of `archive` does: `to_create` are the unsaved reminders of the new
+    meetings, `existing` the active reminders of the meetings already converted, `reactivated`
+    the inactive ones, e.g. of a meeting removed then put back, and `obsolete` the active
+    reminders of the meetings no longer in the calendar. `converted` is the earlier conversion
+    of the same content, if any, in which case nothing is done.
+    """
+
+    def __init__(self, archive, content_hash, converted=None, to_create=(), existing=(), reactivated=(), obsolete=()):
+        self.archive = archive
+        self.content_hash = content_hash
+        self.converted = converted
+        self.to_create = list(to_create)
+        self.existing = list(existing)
+        self.reactivated = list(reactivated)
+        self.obsolete = list(obsolete)
+
+    def __repr__(self):
+        return (
+            f'<ConversionPlan create={len(self.to_create)} existing={len(self.existing)} '
+            f'reactivated={len(self.reactivated)} obsolete={len(self.obsolete)}>'
+        )
+
+    @property
+    def subjects(self):
+        return [reminder.email_subject for reminder in [*self.to_create, *self.existing, *self.reactivated]]
+
+
+def plan_conversion(archive, user):
+    """
+    Return the `ConversionPlan` of converting `archive` as `user`, without changing anything.
+    """
+    content_hash = get_content_hash(archive)
+    converted = ArchiveConversion.objects.filter(content_hash=content_hash).select_related('archive').first()
+    if converted is not None:
+        return ConversionPlan(archive, content_hash, converted=converted)
+    reminders = build_reminders(read_meetings(archive.archive.path), user)
+    subjects = [reminder.email_subject for reminder in reminders]
+    existing = {reminder.email_subject: reminder for reminder in Reminder.objects.filter(policy='once', email_subject__in=subjects).order_by('id')}
+    to_create = [reminder for reminder in reminders if reminder.email_subject not in existing]
+    last = archive.conversions.first()
+    obsolete = []
+    if last is not None:
+        removed = set(last.subjects) - set(subjects)
+        obsolete = list(Reminder.objects.filter(policy='once', is_active=True, email_subject__in=removed).order_by('id'))
+    return ConversionPlan(
+        archive,
+        content_hash,
+        to_create=to_create,
+        existing=[reminder for reminder in existing.values() if reminder.is_active],
+        reactivated=[reminder for reminder in existing.values() if not reminder.is_active],
+        obsolete=obsolete,
+    )
+
+
+def convert(archive, user, dry_run=False):
+    """
+    Convert `archive` into reminders as `user` and return the `ConversionPlan`, which is only computed with `dry_run`.
+    """
+    if dry_run:
+        return plan_conversion(archive, user)
+    with transaction.atomic():
+        # Serialize the conversions of the archive, so a double submit converts once.
+        Archive.objects.select_for_update().filter(pk=archive.pk).first()
+        plan = plan_conversion(archive, user)
+        if plan.converted is not None:
+            return plan
+        Reminder.objects.bulk_create(plan.to_create)
+        for reminder in plan.obsolete:
+            reminder.is_active = False
+            reminder.next_fire_at = None
+        for reminder in plan.reactivated:
+            reminder.is_active = True
+            reminder.next_fire_at = schedule.get_next_fire_at(reminder)
+        Reminder.objects.bulk_update([*plan.obsolete, *plan.reactivated], ['is_active', 'next_fire_at'])
+        ArchiveConversion.objects.create(
+            archive=archive,
+            content_hash=plan.content_hash,
+            subjects=plan.subjects,
+            created_count=len(plan.to_create),
+            created_by=user,
+        )
+    return plan
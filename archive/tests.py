@@ -1,3 +1,122 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.utils import today
+from reminder.models import Reminder
+
+from . import reminders
+from .models import Archive, ArchiveConversion
+
+User = get_user_model()
+
+
+class ConvertToRemindersTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='user')
+        self.user.user_permissions.add(Permission.objects.get(content_type__app_label='archive', codename='view_archive'))
+        self.client.force_login(self.user)
+        day = today() + timedelta(days=30)
+        self.meetings = [
+            ('I01', datetime(day.year, day.month, day.day, 10), '301'),
+            ('I02', datetime(day.year, day.month, day.day, 14), None),
+            ('工程師大會', datetime(day.year, day.month, day.day, 16), '大禮堂'),
+            (None, None, None),
+        ]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_workbook(self, meetings):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['', '網應處月會行事曆', '', ''])
+        sheet.append(['序號', '部門', '時間', '地點'])
+        for i, meeting in enumerate(meetings, start=1):
+            sheet.append([i, *meeting])
+        f = io.BytesIO()
+        workbook.save(f)
+        return f.getvalue()
+
+    def make_archive(self, meetings):
+        return self.make_archive_of(self.make_workbook(meetings))
+
+    def make_archive_of(self, content):
+        archive = Archive(name='網應處月會行事曆', type='announce', created_by=self.user)
+        archive.archive.save('calendar.xlsx', ContentFile(content))
+        return archive
+
+    def test_build_reminders(self):
+        archive = self.make_archive(self.meetings)
+        plan = reminders.convert(archive, self.user, dry_run=True)
+        self.assertEqual(Reminder.objects.count(), 0)
+        by_event = {reminder.event: reminder for reminder in plan.to_create}
+        self.assertEqual(set(by_event), {'I01 月會', 'I02 月會', '工程師大會'})
+        reminder = by_event['I01 月會']
+        self.assertEqual(reminder.start_at, today() + timedelta(days=23))
+        self.assertEqual(reminder.email_subject, f'提醒：I01 月會 ({self.meetings[0][1]:%Y-%m-%d} 10:00)')
+        self.assertIn('• 會議地點：301', reminder.email_content)
+        self.assertEqual(reminder.recipients, 'i00@chief.com.tw;i01@chief.com.tw')
+        self.assertIsNotNone(reminder.next_fire_at)
+        self.assertIn('• 會議地點：\n', by_event['I02 月會'].email_content)
+
+    def test_convert_once(self):
+        # The workbook has its creation time, so the same bytes are used for both archives.
+        content = self.make_workbook(self.meetings)
+        archive = self.make_archive_of(content)
+        url = reverse('archive:convert_to_reminders', kwargs={'pk': archive.pk})
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['plan'].to_create), 3)
+        self.assertEqual(Reminder.objects.count(), 0)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url)
+        # The reminders with one insert, and the record.
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('INSERT')]), 2)
+        self.assertRedirects(response, reverse('archive:announce_list'), fetch_redirect_response=False)
+        self.assertEqual(Reminder.objects.count(), 3)
+        conversion = ArchiveConversion.objects.get()
+        self.assertEqual((conversion.content_hash, conversion.created_count), (reminders.get_content_hash(archive), 3))
+        # The same content, even in another archive, is not converted again.
+        other = self.make_archive_of(content)
+        plan = reminders.convert(other, self.user)
+        self.assertEqual(plan.converted, conversion)
+        self.assertEqual((Reminder.objects.count(), ArchiveConversion.objects.count()), (3, 1))
+
+    def test_convert_changed_content(self):
+        archive = self.make_archive(self.meetings)
+        reminders.convert(archive, self.user)
+        day = self.meetings[0][1] + timedelta(days=1)
+        archive.archive.save('calendar.xlsx', ContentFile(self.make_workbook([*self.meetings[:2], ('I03', day, '302')])))
+        plan = reminders.convert(archive, self.user)
+        self.assertEqual([reminder.event for reminder in plan.to_create], ['I03 月會'])
+        self.assertEqual(len(plan.existing), 2)
+        self.assertEqual([reminder.event for reminder in plan.obsolete], ['工程師大會'])
+        self.assertEqual(Reminder.objects.count(), 4)
+        obsolete = Reminder.objects.get(event='工程師大會')
+        self.assertEqual((obsolete.is_active, obsolete.next_fire_at), (False, None))
+        self.assertEqual(ArchiveConversion.objects.filter(archive=archive).count(), 2)
+        # The meeting put back gets its reminder again.
+        archive.archive.save('calendar.xlsx', ContentFile(self.make_workbook(self.meetings[2::-1])))
+        plan = reminders.convert(archive, self.user)
+        self.assertEqual((plan.to_create, [reminder.event for reminder in plan.reactivated]), ([], ['工程師大會']))
+        self.assertEqual([reminder.event for reminder in plan.obsolete], ['I03 月會'])
+        obsolete.refresh_from_db()
+        self.assertTrue(obsolete.is_active)
+        self.assertIsNotNone(obsolete.next_fire_at)
+        self.assertEqual(Reminder.objects.count(), 4)
@@ -1,18 +1,17 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-import pandas as pd
-from datetime import timedelta
 from django.contrib import messages
 
 from django.utils import timezone
 from django.db.models import Q
 
+from accounts.perms import prefetch_obj_perms
 from core.decorators import permission_required
-from reminder.models import Reminder
+from core.pagination import KeysetPaginator, get_keyset_page
 
+from . import reminders
 from .forms import ArchiveModelForm
 from .models import Archive
 
@@ -72,69 +71,20 @@ def get_announce_queryset(request):
     return queryset
 
 
-def get_department_email(department_code):
-    """根據部門代碼取得群組郵件"""
-    # 部門郵箱對應表
-    department_emails = {
-        'I00': [
-            'i00@chief.com.tw',
-            'i00_manager@chief.com.tw',
-            'gino_kao@chief.com.tw',
-            'kenny_jan@chief.com.tw',
-            'morris_fu@chief.com.tw',
-            'aaron_lin@chief.com.tw',
-            'ryan_hsiao@chief.com.tw',
-            'eric_wu@chief.com.tw',
-            'hank_tsai@chief.com.tw',
-            'louis_wen@chief.com.tw',
-            'rico@chief.com.tw',
-            'brian_chiang@chief.com.tw',
-            'jenny_hung@chief.com.tw'
-        ],
-        'I01': [
-            'i00@chief.com.tw',
-            'i01@chief.com.tw'
-        ],
-        'I02': [
-            'i00@chief.com.tw',
-            'i02@chief.com.tw'
-        ],
-        'I03': [
-            'i00@chief.com.tw',
-            'i03@chief.com.tw'
-        ],
-        'I04': [
-            'i00@chief.com.tw',
-            'i04@chief.com.tw'
-        ],
-        '工程師大會': [
-            'i00@chief.com.tw',
-            'i01@chief.com.tw',
-            'i02@chief.com.tw',
-            'i03@chief.com.tw',
-            'i04@chief.com.tw'
-        ]
-    }
-    
-    # 返回對應的郵箱列表，如果找不到則返回空列表
-    return department_emails.get(department_code, [])
-
-
 @login_required
 @permission_required('archive.view_archive', raise_exception=True, exception=Http404)
 def archive_list(request):
     model = Archive
-    queryset = get_archive_queryset(request)
+    queryset = get_archive_queryset(request).select_related('created_by')
     paginate_by = 5
     template_name = 'archive/archive_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)
@@ -214,18 +164,18 @@ def archive_delete(request, pk):
 @permission_required('archive.view_archive', raise_exception=True, exception=Http404)
 def journals_list(request):
     model = Archive
-    queryset = get_journals_queryset(request)
+    queryset = get_journals_queryset(request).select_related('created_by')
     paginate_by = 12
     template_name = 'archive/journals_list.html'
-    page_number = request.GET.get('page', '')
-    page_number = 'all'
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    paginator = KeysetPaginator(queryset, paginate_by)
+    cursor = request.GET.get('cursor', '')
+    page_obj = paginator.get_page(cursor) if cursor else paginator.get_all()
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)
@@ -256,18 +206,18 @@ def journals_create(request):
 @permission_required('archive.view_archive', raise_exception=True, exception=Http404)
 def announce_list(request):
     model = Archive
-    queryset = get_announce_queryset(request)
+    queryset = get_announce_queryset(request).select_related('created_by')
     paginate_by = 12
     template_name = 'archive/announce_list.html'
-    page_number = request.GET.get('page', '')
-    page_number = 'all'
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    paginator = KeysetPaginator(queryset, paginate_by)
+    cursor = request.GET.get('cursor', '')
+    page_obj = paginator.get_page(cursor) if cursor else paginator.get_all()
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)
@@ -297,69 +247,32 @@ def announce_create(request):
 @login_required
 @permission_required('archive.view_archive', raise_exception=True, exception=Http404)
 def convert_to_reminders(request, pk):
-    """將 Excel 檔案轉換為多個 Reminder"""
+    """將 Excel 檔案轉換為多個 Reminder，GET 時預覽轉換結果"""
+    model = Archive
     archive = get_object_or_404(Archive, pk=pk)
     success_url = reverse('archive:announce_list')  # 轉換後返回 announce 列表
-    
+    template_name = 'archive/archive_confirm_convert.html'
+
     # 檢查是否可以轉換為 Reminder
     if not archive.can_convert_to_reminders():
         messages.error(request, '此檔案無法轉換為提醒（必須是包含「網應處月會行事曆」的 Excel 檔案）')
         return redirect(success_url)
-    
+
     try:
-        # 讀取 Excel 檔案
-        df = pd.read_excel(archive.archive.path)
-        
-        # 使用iloc選擇B、C、D欄位，並重新命名
-        selected_columns = df.iloc[:, 1:4]
-        selected_columns.columns = ['department', 'meeting_time', 'meeting_room']
-        
-        # 跳過標題列（第一列）
-        selected_columns = selected_columns.iloc[1:]
-        
-        # 轉換會議時間為datetime格式
-        selected_columns['meeting_time'] = pd.to_datetime(selected_columns['meeting_time'])
-        
-        # 新增提醒時間欄位（會議時間前一週）
-        selected_columns['reminder_time'] = selected_columns['meeting_time'] - timedelta(days=7)
-        
-        reminders_created = 0
-        for _, row in selected_columns.iterrows():
-            meeting_date = row['meeting_time']
-            reminder_date = row['reminder_time']
-            department = row['department']
-            meeting_room = row['meeting_room']
-            
-            # 取得參與者郵件
-            recipients_list = get_department_email(department)
-            recipients = ';'.join(recipients_list) if recipients_list else f'{department.lower()}@chief.com.tw'
-            
-            # 建立 Reminder
-            event_name = department if '工程師大會' in department else f'{department} 月會'
-            Reminder.objects.create(
-                created_by=request.user,
-                event=event_name,
-                policy='once',
-                start_at=reminder_date.date(),
-                end_at=reminder_date.date(),
-                email_subject=f'提醒：{event_name} ({meeting_date.strftime("%Y-%m-%d %H:%M")})',
-                email_content=f'''親愛的同仁，
-
-提醒您參加以下會議：
-
-• 會議名稱：{event_name}
-• 會議時間：{meeting_date.strftime("%Y年%m月%d日 %H:%M")}
-• 會議地點：{meeting_room}
-
-請準時參加，謝謝！''',
-                recipients=recipients,
-                is_active=True
-            )
-            reminders_created += 1
-            
-        messages.success(request, f'成功建立 {reminders_created} 個會議提醒')
-        
+        plan = reminders.convert(archive, request.user, dry_run=request.method != 'POST')
     except Exception as e:
         messages.error(request, f'轉換失敗：{str(e)}')
-    
-    return redirect(success_url)
\ No newline at end of file
+        return redirect(success_url)
+
+    if request.method == 'POST':
+        if plan.converted is not None:
+            messages.info(request, f'此檔案內容已於 {timezone.localtime(plan.converted.created_at):%Y-%m-%d %H:%M} 轉換過，未重複建立提醒')
+        else:
+            messages.success(
+                request,
+                f'成功建立 {len(plan.to_create)} 個會議提醒，略過 {len(plan.existing)} 個已存在的提醒，'
+                f'重新啟用 {len(plan.reactivated)} 個提醒，停用 {len(plan.obsolete)} 個已移除會議的提醒',
+            )
+        return redirect(success_url)
+    context = {'model': model, 'object': archive, 'plan': plan}
+    return render(request, template_name, context)
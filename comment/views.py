@@ -1,10 +1,11 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
+from accounts.perms import prefetch_obj_perms
 from core.decorators import permission_required
+from core.pagination import get_keyset_page
 from core.utils import today
 
 from .forms import CommentModelForm, CommentMessageModelForm
@@ -16,18 +17,17 @@ from .models import Comment, CommentMessage
 @permission_required('comment.view_comment', raise_exception=True, exception=Http404)
 def comment_list(request):
     model = Comment
-    queryset = model.objects.all()
+    queryset = model.objects.all().select_related('created_by')
     paginate_by = 20
     template_name = 'comment/comment_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
 
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
     }
 
     return render(request, template_name, context)
@@ -100,20 +100,19 @@ def comment_message_list(request,pk):
     model_comment = Comment
     comment = model_comment.objects.get(pk=pk)
     model = CommentMessage
-    queryset = model.objects.filter(message_post=pk)
+    queryset = model.objects.filter(message_post=pk).select_related('created_by')
     paginate_by = 5
     template_name = 'comment/comment_message_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     
 
     context = {
         'model': model,
         'comment': comment,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         "comment_pk": pk
     }
 
@@ -4,7 +4,16 @@ from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sessions.models import Session
 
+from .models import OutboxMessage
+
 admin.site.register(Permission)
 admin.site.register(ContentType)
 admin.site.register(LogEntry)
 admin.site.register(Session)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'priority', 'attempts', 'available_at', 'sent_at']
+    list_filter = ['status', 'priority']
+    search_fields = ['subject', 'to']
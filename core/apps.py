@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .signals import release_content_files
+        from .storage import iter_content_fields
+
+        # Only these models, so the others keep the fast-delete of `QuerySet.delete()`.
+        for model in {model for model, _ in iter_content_fields()}:
+            post_delete.connect(release_content_files, sender=model, dispatch_uid=f'release_content_files_{model._meta.label_lower}')
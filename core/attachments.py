@@ -0,0 +1,100 @@
+"""
+Pre-encoded MIME parts of the mail attachments.
+
+A file sent to many recipients, e.g. the LOA of a task mailed to every ISP, is read, typed and
+base64 encoded once into a MIME part, which is then attached as is to every message. The parts
+are kept in a process wide LRU cache keyed by the path, mtime, size and filename, so a
+`deliver_outbox --loop` worker reuses them across batches and a replaced file is encoded again.
+The cache holds at most `MAIL_ATTACHMENT_CACHE_BYTES` of encoded content; a part larger than
+that is encoded for every message and never cached.
+
+The files of `MAIL_ATTACHMENT_MMAP_BYTES` or more are memory-mapped and encoded from the map,
+without a copy of their content.
+"""
+import base64
+import mimetypes
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from email.header import Header
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def read_encoded(path, size):
+    """
+    Return the base64 content of the file `path` of `size` bytes, in lines of 76 characters.
+    """
+    with open(path, 'rb') as f:
+        if size and size >= get_setting('MAIL_ATTACHMENT_MMAP_BYTES', 1024 * 1024):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                return base64.encodebytes(content).decode('ascii')
+        return base64.encodebytes(f.read()).decode('ascii')
+
+
+def build_part(path, filename, size):
+    mime_type, _ = mimetypes.guess_type(path)
+    main_type, sub_type = (mime_type or 'application/octet-stream').split('/', 1)
+    part = MIMEBase(main_type, sub_type)
+    part.set_payload(read_encoded(path, size))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=Header(filename, 'utf-8').encode())
+    return part
+
+
+class AttachmentCache:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {(path, mtime, size, filename): (part, encoded size)}, the least recently used first.
+        self.parts = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = 0
+
+    def get(self, path, filename):
+        """
+        Return the MIME part attaching the file `path` as `filename`, encoding it if it is not cached.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, filename)
+        # Encoding under the lock lets the threads sending a batch share the part of a file.
+        with self.lock:
+            cached = self.parts.get(key)
+            if cached is not None:
+                self.parts.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            part = build_part(path, filename, stat.st_size)
+            size = len(part.get_payload())
+            max_size = get_setting('MAIL_ATTACHMENT_CACHE_BYTES', 64 * 1024 * 1024)
+            if size > max_size:
+                return part
+            self.parts[key] = (part, size)
+            self.size += size
+            while self.size > max_size:
+                _, (_, evicted_size) = self.parts.popitem(last=False)
+                self.size -= evicted_size
+            return part
+
+    def clear(self):
+        with self.lock:
+            self.parts.clear()
+            self.size = 0
+            self.hits = self.misses = 0
+
+
+cache = AttachmentCache()
+
+
+def attach(message, path, filename):
+    """
+    Attach the file `path` as `filename` to the `EmailMessage` `message`.
+    """
+    message.attach(cache.get(path, filename))
@@ -1,11 +1,190 @@
-from django.core.mail import EmailMultiAlternatives
+"""
+Mail dispatch over pooled connections.
+
+Every thread keeps one open connection of `settings.EMAIL_BACKEND`, which is reused until
+it has been idle for `MAIL_CONNECTION_MAX_IDLE` seconds or has sent `MAIL_CONNECTION_MAX_MESSAGES`
+messages. `MailDispatcher` groups messages into batches of `MAIL_BATCH_SIZE`, sleeps
+`MAIL_THROTTLE_SECONDS` between the batches and logs the timing of every batch. The messages
+of a batch are sent one by one over the connection, so a refused one does not stop the others.
+"""
+import atexit
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ConnectionPool:
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = set()
+
+    def get(self):
+        """
+        Return the open connection of this thread, opening a new one if needed.
+        """
+        state = getattr(self.local, 'state', None)
+        if state is not None:
+            idle = time.monotonic() - state['last_used']
+            if idle > get_setting('MAIL_CONNECTION_MAX_IDLE', 60) or state['sent'] >= get_setting('MAIL_CONNECTION_MAX_MESSAGES', 500):
+                self.close()
+                state = None
+        if state is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            state = {'connection': connection, 'sent': 0, 'last_used': time.monotonic()}
+            self.local.state = state
+            with self.lock:
+                self.connections.add(connection)
+        return state['connection']
+
+    def release(self, sent):
+        state = getattr(self.local, 'state', None)
+        if state is not None:
+            state['sent'] += sent
+            state['last_used'] = time.monotonic()
+
+    def close(self):
+        """
+        Close the connection of this thread.
+        """
+        state = getattr(self.local, 'state', None)
+        self.local.state = None
+        if state is not None:
+            with self.lock:
+                self.connections.discard(state['connection'])
+            try:
+                state['connection'].close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self.lock:
+            connections, self.connections = self.connections, set()
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+pool = ConnectionPool()
+atexit.register(pool.close_all)
+
+
+def send_batch(messages, fail_silently=False):
+    """
+    Send `messages` one by one over the pooled connection. Return the sent ones.
+
+    If the server hung up, it reconnects once and resends only the messages not sent yet.
+    A message refused by the server, e.g. for a bad recipient, raises the `SMTPException`,
+    or is logged and skipped with `fail_silently`, so the messages after it are still sent.
+    """
+    sent = []
+    pending = list(messages)
+    reconnected = False
+    while pending:
+        connection = pool.get()
+        try:
+            if connection.send_messages(pending[:1]):
+                sent.append(pending[0])
+                pool.release(1)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            pool.close()
+            if reconnected:
+                raise
+            reconnected = True
+            continue
+        except smtplib.SMTPException:
+            if not fail_silently:
+                raise
+            logger.exception(f'Failed to send the mail to {", ".join(pending[0].recipients())}.')
+        pending.pop(0)
+    return sent
+
+
+class MailDispatcher:
+    """
+    Collect messages with `add` and send them in batches on `flush`, e.g.
+
+        with MailDispatcher() as dispatcher:
+            for message in messages:
+                dispatcher.add(message)
+
+    `batches` records (size, sent, seconds) of every batch sent.
+    """
+
+    def __init__(self, batch_size=None, throttle=None, fail_silently=False):
+        self.batch_size = batch_size or get_setting('MAIL_BATCH_SIZE', 50)
+        self.throttle = get_setting('MAIL_THROTTLE_SECONDS', 0) if throttle is None else throttle
+        self.fail_silently = fail_silently
+        self.queue = []
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, message):
+        self.queue.append(message)
+        if len(self.queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the queued messages. Return the number of the sent ones.
+        """
+        count = 0
+        while self.queue:
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            if self.batches and self.throttle:
+                time.sleep(self.throttle)
+            started_at = time.perf_counter()
+            try:
+                sent = len(send_batch(batch, self.fail_silently))
+            except Exception:
+                if not self.fail_silently:
+                    raise
+                logger.exception(f'Failed to send a batch of {len(batch)} mails.')
+                sent = 0
+            duration = time.perf_counter() - started_at
+            self.batches.append((len(batch), sent, duration))
+            logger.info(f'Sent {sent}/{len(batch)} mails in {duration * 1000:.1f} ms.')
+            count += sent
+        return count
+
+
+def send_messages(messages, fail_silently=False):
+    """
+    Send `messages` in batches over the pooled connection. Return the number of the sent ones.
+    """
+    dispatcher = MailDispatcher(fail_silently=fail_silently)
+    for message in messages:
+        dispatcher.add(message)
+    return dispatcher.flush()
 
 
 def send_mail(subject='', body='', from_email=None, to=None, bcc=None,
               connection=None, attachments=None, headers=None, alternatives=None,
-              cc=None, reply_to=None, attach_alternative_content=None, attach_alternative_mimetype=None):
+              cc=None, reply_to=None, attach_alternative_content=None, attach_alternative_mimetype=None,
+              fail_silently=False):
     """
-    Send a django.core.mail.EmailMultiAlternatives to `to`.
+    Send a django.core.mail.EmailMultiAlternatives to `to`, over the pooled connection
+    unless `connection` is given.
     """
     # Email subject must not contain newlines.
     subject = ''.join(subject.splitlines())
@@ -14,4 +193,6 @@ def send_mail(subject='', body='', from_email=None, to=None, bcc=None,
     )
     if attach_alternative_content is not None and attach_alternative_mimetype is not None:
         email_message.attach_alternative(attach_alternative_content, attach_alternative_mimetype)
-    email_message.send()
+    if connection is not None:
+        return email_message.send(fail_silently=fail_silently)
+    return send_messages([email_message], fail_silently=fail_silently)
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Send the due mails of the outbox. '
+        'With `--loop` it keeps running as a worker, otherwise it returns once the outbox is drained.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='The mails locked at a time.')
+        parser.add_argument('--workers', type=int, default=None, help='The threads sending the mails, `OUTBOX_WORKERS` by default.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox.')
+        parser.add_argument('--interval', type=float, default=5, help='The seconds between the polls with `--loop`.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = outbox.deliver_outbox(limit=options['limit'], workers=options['workers'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(f'{sent} mail(s) sent, {failed} failed.')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
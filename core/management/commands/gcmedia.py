@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core import storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove the uploaded files which no row refers to any more. '
+        'The files modified within `--grace` seconds are kept, as their rows may not be committed yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None, help='The seconds an orphaned file is kept, `MEDIA_GC_GRACE_SECONDS` by default.')
+        parser.add_argument('--workers', type=int, default=4, help='The threads scanning the media directories.')
+        parser.add_argument('--dry-run', action='store_true', help='List the orphaned files without removing them.')
+
+    def handle(self, *args, **options):
+        removed, scanned = storage.collect_garbage(
+            grace=options['grace'], workers=options['workers'], dry_run=options['dry_run'],
+        )
+        for name in removed:
+            self.stdout.write(name)
+        action = 'would be removed' if options['dry_run'] else 'removed'
+        self.stdout.write(f'{scanned} file(s) scanned, {len(removed)} {action}.')
@@ -0,0 +1,225 @@
+import io
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import NoReverseMatch, reverse
+
+from comment.models import Comment
+from core.profiling import profile_queries
+
+User = get_user_model()
+
+# (name, url name, query string)
+VIEW_CASES = [
+    ('diary_list', 'diary:diary_list', ''),
+    ('diary_list_all', 'diary:diary_list', 'page=all'),
+    ('diary_search', 'diary:diary_list', 'search_input=record'),
+    ('diary_search_ranked', 'diary:diary_list', 'search_input=record&sort=relevance'),
+    ('diary_log_list', 'log:diary_log_list', ''),
+    ('reminder_list', 'reminder:reminder_list', ''),
+    ('news_list', 'news:news_list', ''),
+    ('dep_news_list', 'news:dep_news_list', ''),
+    ('comment_list', 'comment:comment_list', ''),
+    ('archive_list', 'archive:archive_list', ''),
+    ('journals_list', 'archive:journals_list', ''),
+    ('announce_list', 'archive:announce_list', ''),
+    ('tool_list', 'tool:tool_list', ''),
+    ('terms_list', 'terms:terms_list', ''),
+    ('terms_list_letter', 'terms:terms_list', 'letter=W'),
+    ('isp_list', 'telecom:isp_list', ''),
+    ('ispgroup_list', 'telecom:ispgroup_list', ''),
+    ('prefixlistupdatetask_list', 'telecom:prefixlistupdatetask_list', ''),
+    ('telecom_archive_list', 'telecom:archive_list', ''),
+    ('dep_calendar_events_json', 'dep_calendar:calendar_events_json', ''),
+    ('ext_calendar_events_json', 'ext_calendar:calendar_events_json', ''),
+    ('api_diaries', 'diary-list', ''),
+    ('api_news', 'news-list', ''),
+]
+
+# (name, command name, options)
+COMMAND_CASES = [
+    ('senddiaryuseremail', 'senddiaryuseremail', {'force': True, 'debug': False}),
+    ('sendreminderemail', 'sendreminderemail', {'force': True}),
+    ('check_news_signatures', 'check_news_signatures', {'force': True}),
+]
+
+# The models whose row counts are written in the report.
+COUNTED_MODELS = [
+    'auth.User', 'diary.Diary', 'log.Log', 'news.News', 'news.NewsReadRecord', 'reminder.Reminder',
+    'telecom.Isp', 'telecom.IspGroup', 'telecom.PrefixListUpdateTask', 'terms.Terms',
+    'dep_calendar.CalendarEvent', 'ext_calendar.CalendarEvent',
+]
+
+
+def percentile(values, p):
+    """
+    Return the `p`-th percentile of `values` with linear interpolation.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def summarize(durations, query_counts):
+    latencies = [duration * 1000 for duration in durations]
+    return {
+        'latency_ms': {
+            'min': round(min(latencies), 2),
+            'p50': round(percentile(latencies, 50), 2),
+            'p90': round(percentile(latencies, 90), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2),
+            'mean': round(sum(latencies) / len(latencies), 2),
+        },
+        'queries': {'min': min(query_counts), 'max': max(query_counts)},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the list views, the calendar feeds, the API endpoints and the scheduled commands, '
+        'and write a JSON report of the latency percentiles and the query counts. '
+        'Mails go to the locmem backend. Use `seedperfdata` to get some data first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='perf_0', help='The user to log in as. Default to "perf_0".')
+        parser.add_argument('--repeat', type=int, default=10, help='The runs of every view.')
+        parser.add_argument('--command-repeat', type=int, default=1, help='The runs of every command.')
+        parser.add_argument('--warmup', type=int, default=1, help='The runs not counted before the views.')
+        parser.add_argument('--only', nargs='*', default=[], help='Only run the cases with these names.')
+        parser.add_argument('--skip-commands', action='store_true')
+        parser.add_argument('-o', '--output', help='The path of the report. Default to logging/benchmarks/<timestamp>.json.')
+        parser.add_argument('--compare', help='The path of a previous report to compare with.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist, run `seedperfdata` first.')
+        self.options = options
+        results = []
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ALLOWED_HOSTS=['*'],
+            QUERY_PROFILING_PANEL=False,
+        ):
+            mail.outbox = []
+            client = Client()
+            client.force_login(user)
+            for name, url_name, query_string in self.get_view_cases():
+                result = self.run_view(client, name, url_name, query_string)
+                if result:
+                    results.append(result)
+            if not options['skip_commands']:
+                for name, command_name, command_options in COMMAND_CASES:
+                    if self.is_selected(name):
+                        results.append(self.run_command(name, command_name, command_options))
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'username': user.username,
+            'repeat': options['repeat'],
+            'row_counts': {label: apps.get_model(label).objects.count() for label in COUNTED_MODELS},
+            'results': results,
+        }
+        output = Path(options['output'] or settings.BASE_DIR / 'logging' / 'benchmarks' / f'{datetime.now():%Y%m%d-%H%M%S}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.print_results(results)
+        if options['compare']:
+            self.print_comparison(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f'The report is written to {output}.'))
+
+    def is_selected(self, name):
+        return not self.options['only'] or name in self.options['only']
+
+    def get_view_cases(self):
+        cases = [case for case in VIEW_CASES if self.is_selected(case[0])]
+        comment = Comment.objects.order_by('-pk').first()
+        if comment and self.is_selected('comment_message_list'):
+            cases.append(('comment_message_list', ('comment:comment_message_list', comment.pk), ''))
+        return cases
+
+    def run_view(self, client, name, url_name, query_string):
+        try:
+            if isinstance(url_name, tuple):
+                url = reverse(url_name[0], args=url_name[1:])
+            else:
+                url = reverse(url_name)
+        except NoReverseMatch:
+            self.stderr.write(f'Skip {name}: {url_name} is not found.')
+            return None
+        url = f'{url}?{query_string}' if query_string else url
+        for _ in range(self.options['warmup']):
+            client.get(url)
+        durations, query_counts = [], []
+        for _ in range(self.options['repeat']):
+            with profile_queries() as profile:
+                started_at = time.perf_counter()
+                response = client.get(url)
+                durations.append(time.perf_counter() - started_at)
+            query_counts.append(profile.count)
+        return {'name': name, 'kind': 'view', 'url': url, 'status': response.status_code, **summarize(durations, query_counts)}
+
+    def run_command(self, name, command_name, command_options):
+        """
+        Run a command in a transaction which is rolled back, so every run sees the same data.
+        """
+        durations, query_counts, mail_counts = [], [], []
+        for _ in range(self.options['command_repeat']):
+            mail.outbox = []
+            # The commands log every mail they send, which is just noise here.
+            logging.disable(logging.INFO)
+            try:
+                with transaction.atomic():
+                    with profile_queries() as profile:
+                        started_at = time.perf_counter()
+                        call_command(command_name, stdout=io.StringIO(), **command_options)
+                        durations.append(time.perf_counter() - started_at)
+                    transaction.set_rollback(True)
+            finally:
+                logging.disable(logging.NOTSET)
+            query_counts.append(profile.count)
+            mail_counts.append(len(mail.outbox))
+        return {'name': name, 'kind': 'command', 'mails': max(mail_counts), **summarize(durations, query_counts)}
+
+    def print_results(self, results):
+        self.stdout.write(f'{"name":<32}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"queries":>10}')
+        for result in results:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{result["name"]:<32}{latency["p50"]:>10}{latency["p90"]:>10}{latency["p99"]:>10}'
+                f'{result["queries"]["max"]:>10}'
+            )
+
+    def print_comparison(self, results, path):
+        with open(path, encoding='utf-8') as f:
+            previous = {result['name']: result for result in json.load(f)['results']}
+        self.stdout.write(f'\nCompared with {path}:')
+        self.stdout.write(f'{"name":<32}{"p50 ms":>20}{"queries":>16}')
+        for result in results:
+            before = previous.get(result['name'])
+            if not before:
+                continue
+            p50, p50_before = result['latency_ms']['p50'], before['latency_ms']['p50']
+            queries, queries_before = result['queries']['max'], before['queries']['max']
+            change = f'{(p50 - p50_before) / p50_before * 100:+.0f}%' if p50_before else '-'
+            self.stdout.write(f'{result["name"]:<32}{f"{p50_before} -> {p50} ({change})":>20}{f"{queries_before} -> {queries}":>16}')
@@ -0,0 +1,404 @@
+import json
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts import visibility
+from accounts.models import Profile
+from dep_calendar.models import CalendarEvent as DepCalendarEvent
+from diary import search
+from diary.models import Diary
+from ext_calendar.models import CalendarEvent as ExtCalendarEvent, SupportGroup
+from log.models import Log
+from news import readset
+from news.models import News, NewsReadRecord
+from news.views import SPECIAL_USERS
+from reminder import schedule
+from reminder.models import Reminder
+from telecom.models import File, Isp, IspGroup, LoaTaskFileISP, PrefixListUpdateTask, RoaTaskFileISP
+from terms.models import Terms
+
+from core import versions
+from core.utils import today
+
+User = get_user_model()
+
+PASSWORD = 'password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed the database with realistic volumes of data for performance tests. '
+        'Every seeded user is named `<prefix>_<n>` and has the password "password". '
+        'Do not run it against a production database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='perf', help='The prefix of the usernames. Default to "perf".')
+        parser.add_argument('--departments', type=int, default=10, help='The number of departments, named I00, I01, ...')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--years', type=int, default=2, help='The years of diaries to write for every user.')
+        parser.add_argument('--diary-missing-rate', type=float, default=0.03)
+        parser.add_argument('--logs', type=int, default=50000)
+        parser.add_argument('--news', type=int, default=300)
+        parser.add_argument('--read-rate', type=float, default=0.6, help='The fraction of users who read a news.')
+        parser.add_argument('--reminders', type=int, default=300)
+        parser.add_argument('--isps', type=int, default=300)
+        parser.add_argument('--isp-groups', type=int, default=50)
+        parser.add_argument('--tasks', type=int, default=300)
+        parser.add_argument('--files', type=int, default=20)
+        parser.add_argument('--events', type=int, default=1000)
+        parser.add_argument('--terms', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the random generator.')
+        parser.add_argument('--flush', action='store_true', help='Delete the users seeded before (and their data) first.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        self.today = today()
+        if options['flush']:
+            users = User.objects.filter(username__startswith=f'{self.prefix}_')
+            Log.objects.filter(created_by__in=users).delete()
+            Terms.objects.filter(created_by__in=users).delete()
+            deleted, _ = users.delete()
+            self.stdout.write(f'Deleted {deleted} objects.')
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'Users with prefix "{self.prefix}" already exist, use --flush or another --prefix.')
+        with transaction.atomic(), versions.snapshot():
+            self.seed_organization()
+            self.seed_diaries()
+            self.seed_logs()
+            self.seed_news()
+            self.seed_reminders()
+            self.seed_telecom()
+            self.seed_calendar_events()
+            self.seed_terms()
+        # The memberships were bulk created, so the signals were not sent.
+        visibility.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'Seeded. Log in as "{self.director.username}" / "{PASSWORD}".'))
+
+    def bulk_create(self, model, objs):
+        """
+        Bulk create `objs`, which could be a generator, in batches.
+        """
+        batch = []
+        count = 0
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            count += len(batch)
+        self.stdout.write(f'{model._meta.label}: {count}')
+        return count
+
+    def choice(self, model, field_name):
+        return self.random.choice([value for value, _ in model._meta.get_field(field_name).flatchoices])
+
+    def random_datetime(self, days_before=365, days_after=0):
+        date = self.today + timedelta(days=self.random.randint(-days_before, days_after))
+        return timezone.make_aware(datetime.combine(date, time(self.random.randint(8, 18), self.random.choice([0, 30]))))
+
+    # Users, departments and roles
+    def create_group(self, name, **profile):
+        group, _ = Group.objects.get_or_create(name=name)
+        for key, value in profile.items():
+            setattr(group.groupprofile, key, value)
+        group.groupprofile.save()
+        return group
+
+    def seed_organization(self):
+        """
+        Every department has a manager role supervising its member role, and a director
+        role supervises every manager role.
+        """
+        password = make_password(PASSWORD)
+        n_departments = max(self.options['departments'], 1)
+        n_users = max(self.options['users'], n_departments + 1)
+        start_date = self.today - timedelta(days=365 * self.options['years'])
+        director_role = self.create_group(f'{self.prefix}-director', is_role=True, is_displayed=True)
+        headquarter = self.create_group('I00', is_department=True, is_displayed=True)
+        departments = [headquarter] + [
+            self.create_group(f'I{i:02d}', is_department=True, is_displayed=True, parent_department=headquarter)
+            for i in range(1, n_departments)
+        ]
+        member_roles, manager_roles = [], []
+        for department in departments:
+            member_role = self.create_group(f'{self.prefix}-{department.name}-member', is_role=True)
+            manager_role = self.create_group(f'{self.prefix}-{department.name}-manager', is_role=True)
+            manager_role.groupprofile.supervise_roles.add(member_role)
+            member_roles.append(member_role)
+            manager_roles.append(manager_role)
+        director_role.groupprofile.supervise_roles.add(*manager_roles)
+
+        usernames = [f'{self.prefix}_{i}' for i in range(n_users)]
+        self.bulk_create(User, (
+            User(username=username, email=f'{username}@example.com', password=password, first_name=username)
+            for username in usernames
+        ))
+        users = list(User.objects.filter(username__startswith=f'{self.prefix}_').order_by('pk'))
+        for username in SPECIAL_USERS:
+            special_user, created = User.objects.get_or_create(username=username, defaults={'email': f'{username}@example.com'})
+            if created:
+                special_user.password = password
+                special_user.save()
+        self.special_users = list(User.objects.filter(username__in=SPECIAL_USERS))
+
+        memberships = []
+        activated_roles = {}
+        self.director = users[0]
+        memberships.append((self.director, director_role))
+        memberships.append((self.director, headquarter))
+        activated_roles[self.director.pk] = director_role.pk
+        for i, user in enumerate(users[1:]):
+            d = i % n_departments
+            memberships.append((user, departments[d]))
+            if i < n_departments:
+                memberships.append((user, manager_roles[d]))
+                activated_roles[user.pk] = manager_roles[d].pk
+            else:
+                memberships.append((user, member_roles[d]))
+        through = User.groups.through
+        self.bulk_create(through, (through(user_id=user.pk, group_id=group.pk) for user, group in memberships))
+        self.bulk_create(Profile, (
+            Profile(
+                user=user,
+                staff_code=f'{i:05d}',
+                job_title='Engineer',
+                keep_diary=True,
+                diary_starting_date=start_date,
+                activated_role_id=activated_roles.get(user.pk),
+            )
+            for i, user in enumerate(users)
+        ))
+        permissions = Permission.objects.filter(content_type__app_label__in=[
+            'diary', 'reminder', 'news', 'log', 'comment', 'archive', 'tool', 'terms',
+            'telecom', 'dep_calendar', 'ext_calendar', 'pilotadmin',
+        ])
+        for group in [director_role] + manager_roles + member_roles:
+            group.permissions.add(*permissions)
+        self.users = users
+        self.departments = departments
+        self.start_date = start_date
+
+    def seed_diaries(self):
+        missing_rate = self.options['diary_missing_rate']
+        days = (self.today - self.start_date).days
+        dates = [self.start_date + timedelta(days=n) for n in range(days)]
+        workdays = [date for date in dates if date.isoweekday() <= 5]
+        self.bulk_create(Diary, (
+            Diary(
+                date=date,
+                daily_check=self.random.choice(['yes', 'no']),
+                daily_record=f'Daily record of {user.username} on {date}.\n' * self.random.randint(1, 5),
+                todo='To do.' if self.random.random() < 0.5 else '',
+                created_by_id=user.pk,
+            )
+            for user in self.users
+            for date in workdays
+            if self.random.random() >= missing_rate
+        ))
+        # The diaries were bulk created, so the signals did not index them.
+        search.rebuild(batch_size=self.batch_size)
+
+    def seed_logs(self):
+        actions = ['CREATE', 'UPDATE', 'DELETE']
+        self.bulk_create(Log, (
+            Log(
+                action=self.random.choice(actions),
+                app_label='diary',
+                model_name='diary',
+                data=json.dumps({'id': i, 'date': str(self.today), 'daily_record': 'record'}, ensure_ascii=False),
+                created_by_id=self.random.choice(self.users).pk,
+                created_at=self.random_datetime(days_before=365 * self.options['years']),
+            )
+            for i in range(self.options['logs'])
+        ))
+
+    def seed_news(self):
+        authors = self.special_users + self.users[:len(self.departments) + 1]
+        news_list = []
+        for i in range(self.options['news']):
+            at = self.random_datetime(days_before=60)
+            is_permanent = self.random.random() < 0.5
+            news_list.append(News(
+                title=f'News {i}',
+                content='Content of the news.\n' * 10,
+                is_pinned=self.random.random() < 0.05,
+                at=at,
+                is_permanent=is_permanent,
+                visible_at=None if is_permanent else at,
+                visible_due=None if is_permanent else at + timedelta(days=self.random.choice([7, 14, 30])),
+                created_by_id=self.random.choice(authors).pk,
+            ))
+        self.bulk_create(News, news_list)
+        news_ids = list(News.objects.filter(created_by__in=authors).values_list('pk', flat=True))
+        read_rate = self.options['read_rate']
+        self.bulk_create(NewsReadRecord, (
+            NewsReadRecord(news_id=news_id, user_id=user.pk)
+            for news_id in news_ids
+            for user in self.users
+            if self.random.random() < read_rate
+        ))
+        # `bulk_create` skips the signals which keep the read sets.
+        readset.rebuild(News.objects.filter(pk__in=news_ids))
+
+    def seed_reminders(self):
+        policies = [value for value, _ in Reminder._meta.get_field('policy').flatchoices]
+        reminders = []
+        for i in range(self.options['reminders']):
+            policy = self.random.choice(policies)
+            start_at = self.today - timedelta(days=self.random.randint(0, 60))
+            specified_dates = ''
+            if policy == 'specified dates':
+                specified_dates = ','.join(str(self.today + timedelta(days=n)) for n in range(-2, 30, 7))
+            reminder = Reminder(
+                event=f'Event {i}',
+                policy=policy,
+                start_at=start_at,
+                end_at=start_at + timedelta(days=self.random.randint(1, 120)),
+                specified_dates=specified_dates,
+                email_subject=f'Reminder {i}',
+                email_content='Content of the reminder.',
+                recipients=';'.join(f'{user.username}@example.com' for user in self.random.sample(self.users, 3)),
+                created_by_id=self.random.choice(self.users).pk,
+            )
+            # `bulk_create` skips `save`, which keeps `next_fire_at`.
+            reminder.next_fire_at = schedule.get_next_fire_at(reminder)
+            reminders.append(reminder)
+        self.bulk_create(Reminder, reminders)
+
+    def seed_telecom(self):
+        owners = self.users[:len(self.departments) + 1]
+        isps = []
+        for i in range(self.options['isps']):
+            isps.append(Isp(
+                name=f'ISP {i}',
+                cname=f'ISP {i}',
+                upstream_as=f'AS{64512 + i}',
+                primary_contact=f'Contact {i}',
+                to=f'noc{i}@isp{i}.example.com',
+                cc=f'cc{i}@isp{i}.example.com;',
+                ip_version=self.choice(Isp, 'ip_version'),
+                upstream_session_ip=f'10.{i // 256}.{i % 256}.1/32',
+                chief_session_ip=f'10.{i // 256}.{i % 256}.2/32',
+                subject='Prefix-list update',
+                content='Please update the prefix-list.',
+                created_by_id=self.random.choice(owners).pk,
+            ))
+        self.bulk_create(Isp, isps)
+        isp_ids = list(Isp.objects.filter(created_by__in=owners).values_list('pk', flat=True))
+
+        self.bulk_create(IspGroup, (
+            IspGroup(name=f'ISP group {i}', created_by_id=self.random.choice(owners).pk)
+            for i in range(self.options['isp_groups'])
+        ))
+        group_ids = list(IspGroup.objects.filter(created_by__in=owners).values_list('pk', flat=True))
+        through = IspGroup.isps.through
+        self.bulk_create(through, (
+            through(ispgroup_id=group_id, isp_id=isp_id)
+            for group_id in group_ids
+            for isp_id in self.random.sample(isp_ids, min(len(isp_ids), 10))
+        ))
+
+        files = []
+        for i in range(self.options['files']):
+            file = File(file=ContentFile(b'%PDF-1.4\n' + b'0' * 1024 * self.random.randint(1, 512), name=f'roa-{i}.pdf'))
+            file.save()
+            files.append(file)
+
+        self.bulk_create(PrefixListUpdateTask, (
+            PrefixListUpdateTask(
+                update_type=self.choice(PrefixListUpdateTask, 'update_type'),
+                origin_as=f'AS{65000 + i}',
+                as_path=f'AS{65000 + i}',
+                ipv4_prefix_list=f'192.0.{i % 256}.0/24',
+                ipv6_prefix_list=f'2001:db8:{i:x}::/48',
+                created_by_id=self.random.choice(owners).pk,
+            )
+            for i in range(self.options['tasks'])
+        ))
+        tasks = list(PrefixListUpdateTask.objects.filter(created_by__in=owners).values_list('pk', flat=True))
+        task_isps = {task_id: self.random.sample(isp_ids, min(len(isp_ids), 5)) for task_id in tasks}
+        through = PrefixListUpdateTask.isps.through
+        self.bulk_create(through, (
+            through(prefixlistupdatetask_id=task_id, isp_id=isp_id)
+            for task_id, ids in task_isps.items()
+            for isp_id in ids
+        ))
+        through = PrefixListUpdateTask.isp_groups.through
+        self.bulk_create(through, (
+            through(prefixlistupdatetask_id=task_id, ispgroup_id=self.random.choice(group_ids))
+            for task_id in tasks
+        ))
+        if files:
+            for model in (RoaTaskFileISP, LoaTaskFileISP):
+                self.bulk_create(model, (
+                    model(task_id=task_id, isp_id=isp_id, file_id=self.random.choice(files).pk)
+                    for task_id, ids in task_isps.items()
+                    for isp_id in ids
+                ))
+
+    def seed_calendar_events(self):
+        support_groups = [SupportGroup.objects.get_or_create(name=f'S{i}')[0] for i in range(11, 16)]
+        for model in (DepCalendarEvent, ExtCalendarEvent):
+            events = []
+            for i in range(self.options['events']):
+                start_time = self.random_datetime(days_before=180, days_after=90)
+                event = model(
+                    title=f'Event {i}',
+                    product_type=self.choice(model, 'product_type'),
+                    description='Description of the event.',
+                    start_time=start_time,
+                    end_time=start_time + timedelta(hours=self.random.randint(1, 8)),
+                    created_by_id=self.random.choice(self.users).pk,
+                    department_id=self.random.choice(self.departments).pk,
+                )
+                if model is DepCalendarEvent:
+                    event.event_type = self.choice(model, 'event_type')
+                else:
+                    event.client_name = f'Client {i}'
+                    event.support_consultant = self.choice(model, 'support_consultant')
+                events.append(event)
+            self.bulk_create(model, events)
+        event_ids = ExtCalendarEvent.objects.filter(created_by__in=self.users).values_list('pk', flat=True)
+        through = ExtCalendarEvent.support_group.through
+        self.bulk_create(through, (
+            through(calendarevent_id=event_id, supportgroup_id=self.random.choice(support_groups).pk)
+            for event_id in event_ids
+        ))
+
+    def seed_terms(self):
+        syllables = ['網路', '機房', '電路', '路由', '交換', '頻寬', '備援', '監控', '中繼', '資安']
+        letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+        def generate():
+            for i in range(self.options['terms']):
+                if self.random.random() < 0.5:
+                    short_name = ''.join(self.random.choice(letters) for _ in range(self.random.randint(2, 5))) + str(i)
+                else:
+                    short_name = ''.join(self.random.choice(syllables) for _ in range(2)) + str(i)
+                terms = Terms(
+                    short_name=short_name,
+                    full_name=f'Full name of {short_name}',
+                    management_department=self.random.choice(self.departments).name,
+                    description='Description.',
+                    created_by_id=self.random.choice(self.users).pk,
+                )
+                terms.update_index_fields()
+                yield terms
+
+        self.bulk_create(Terms, generate())
@@ -0,0 +1,66 @@
+import logging
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .profiling import get_query_budget, profile_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfilingMiddleware:
+    """
+    Profile the SQL queries of every request. The numbers are
+    - sent in the `Server-Timing` header, to be seen in the network tab of the browser,
+    - logged in a single line, as a warning if the view is over its query budget or has N+1 queries,
+    - shown in a small panel at the bottom of the HTML pages if `QUERY_PROFILING_PANEL` and `DEBUG`,
+    - attached to the response as `response.query_profile`, for the tests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_PROFILING', True):
+            return self.get_response(request)
+        with profile_queries() as profile:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else ''
+        budget = get_query_budget(view_name)
+        duplicates = profile.get_duplicates()
+        response.query_profile = profile
+        response['Server-Timing'] = (
+            f'db;desc="SQL ({profile.count} queries)";dur={profile.db_time * 1000:.1f}, '
+            f'total;dur={profile.total_time * 1000:.1f}'
+        )
+        is_over_budget = budget is not None and profile.count > budget
+        level = logging.WARNING if is_over_budget or duplicates else logging.DEBUG
+        logger.log(
+            level,
+            'view=%s method=%s path=%s status=%s queries=%s budget=%s db_ms=%.1f total_ms=%.1f duplicates=%s',
+            view_name or '-', request.method, request.path, response.status_code, profile.count,
+            budget if budget is not None else '-', profile.db_time * 1000, profile.total_time * 1000,
+            '; '.join(f'{count}x {sql[:120]}' for sql, count in duplicates) or '-',
+        )
+        if settings.DEBUG and getattr(settings, 'QUERY_PROFILING_PANEL', False):
+            self.add_panel(response, profile, view_name, budget, duplicates)
+        return response
+
+    def add_panel(self, response, profile, view_name, budget, duplicates):
+        content_type = response.get('Content-Type', '')
+        if response.streaming or not content_type.startswith('text/html'):
+            return
+        content = response.content.decode(response.charset)
+        if '</body>' not in content:
+            return
+        panel = render_to_string('query_profile_panel.html', {
+            'profile': profile,
+            'view_name': view_name,
+            'budget': budget,
+            'duplicates': duplicates,
+        })
+        content = content.replace('</body>', panel + '</body>', 1)
+        response.content = content.encode(response.charset)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = len(response.content)
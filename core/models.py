@@ -0,0 +1,47 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class OutboxMessage(models.Model):
+    """
+    A mail waiting to be sent by `deliver_outbox`. See core/outbox.py.
+    """
+    PRIORITY = [
+        (0, _('High')),
+        (5, _('Normal')),
+        (9, _('Low')),
+    ]
+    STATUS = [
+        ('pending', _('Pending')),
+        ('sending', _('Sending')),
+        ('sent', _('Sent')),
+        ('dead', _('Dead')),
+    ]
+    subject = models.CharField(verbose_name=_('Subject'), max_length=255)
+    body = models.TextField(verbose_name=_('Body'), blank=True)
+    html_body = models.TextField(verbose_name=_('HTML body'), blank=True)
+    from_email = models.CharField(verbose_name=_('From'), max_length=255, blank=True)
+    to = models.TextField(verbose_name=_('To'), blank=True, help_text=_('Use ";" to seperate multiple recipient.'))
+    cc = models.TextField(verbose_name=_('CC'), blank=True, help_text=_('Use ";" to seperate multiple recipient.'))
+    bcc = models.TextField(verbose_name=_('BCC'), blank=True, help_text=_('Use ";" to seperate multiple recipient.'))
+    # A list of [path, filename], the files are read when the mail is sent.
+    attachments = models.JSONField(verbose_name=_('Attachments'), default=list, blank=True)
+    priority = models.PositiveSmallIntegerField(verbose_name=_('Priority'), choices=PRIORITY, default=5)
+    status = models.CharField(verbose_name=_('Status'), max_length=15, choices=STATUS, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=0)
+    last_error = models.TextField(verbose_name=_('Last error'), blank=True)
+    available_at = models.DateTimeField(verbose_name=_('Available at'), default=timezone.now)
+    locked_at = models.DateTimeField(verbose_name=_('Locked at'), blank=True, null=True)
+    lock_id = models.CharField(verbose_name=_('Lock ID'), max_length=32, blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created at'), auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name=_('Sent at'), blank=True, null=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [models.Index(fields=['status', 'priority', 'available_at'])]
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+
+    def __str__(self):
+        return f'{self.subject} ({self.status})'
@@ -0,0 +1,208 @@
+"""
+A database-backed mail outbox.
+
+The views `enqueue` a mail and return at once; `deliver_outbox` sends the pending ones over
+the pooled connection of core/mail.py. A failed mail is retried after
+`OUTBOX_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)` seconds, and is marked `dead` after
+`OUTBOX_MAX_ATTEMPTS` attempts. A mail locked by a worker which died is taken over after
+`OUTBOX_LOCK_TIMEOUT_SECONDS`.
+
+The mails locked at a time are sent by up to `OUTBOX_WORKERS` threads, each over its own
+pooled connection, which is closed when the batch is done. The threads only build and send
+the mails; the results are saved by the caller, so the workers never touch the database.
+The attachments are encoded once into the MIME parts cached by core/attachments.py.
+"""
+import logging
+import queue
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from . import attachments
+from .mail import pool, send_batch
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HIGH, NORMAL, LOW = 0, 5, 9
+
+
+def join_addresses(addresses):
+    if isinstance(addresses, str):
+        return addresses
+    return ';'.join(address for address in addresses or [] if address)
+
+
+def split_addresses(addresses):
+    return [address.strip() for address in addresses.split(';') if address.strip()]
+
+
+def enqueue(subject, body='', to=None, from_email=None, cc=None, bcc=None, html_body='', attachments=None, priority=NORMAL):
+    """
+    Add a mail to the outbox. `to`, `cc` and `bcc` are lists or ";" seperated strings,
+    `attachments` is a list of (path, filename).
+    """
+    return OutboxMessage.objects.create(
+        # Email subject must not contain newlines.
+        subject=''.join(subject.splitlines()),
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or '',
+        to=join_addresses(to),
+        cc=join_addresses(cc),
+        bcc=join_addresses(bcc),
+        attachments=[list(attachment) for attachment in attachments or []],
+        priority=priority,
+    )
+
+
+def build_message(outbox_message):
+    message = EmailMultiAlternatives(
+        outbox_message.subject,
+        outbox_message.body,
+        outbox_message.from_email or None,
+        split_addresses(outbox_message.to),
+        bcc=split_addresses(outbox_message.bcc),
+        cc=split_addresses(outbox_message.cc),
+    )
+    if outbox_message.html_body:
+        message.attach_alternative(outbox_message.html_body, 'text/html')
+    for path, filename in outbox_message.attachments:
+        attachments.attach(message, path, filename)
+    return message
+
+
+def get_retry_delay(attempts):
+    backoff = getattr(settings, 'OUTBOX_RETRY_BACKOFF_SECONDS', 60)
+    return timedelta(seconds=backoff * 2 ** (attempts - 1))
+
+
+def claim(limit):
+    """
+    Lock up to `limit` mails which are due, the most urgent first, and return them.
+    """
+    now = timezone.now()
+    lock_timeout = timedelta(seconds=getattr(settings, 'OUTBOX_LOCK_TIMEOUT_SECONDS', 600))
+    due = Q(status='pending', available_at__lte=now) | Q(status='sending', locked_at__lt=now - lock_timeout)
+    ids = list(
+        OutboxMessage.objects.filter(due).order_by('priority', 'available_at', 'id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    lock_id = uuid.uuid4().hex
+    # Only the ones still due are locked, in case another worker took some meanwhile.
+    OutboxMessage.objects.filter(due, id__in=ids).update(status='sending', locked_at=now, lock_id=lock_id)
+    return list(OutboxMessage.objects.filter(lock_id=lock_id, status='sending').order_by('priority', 'available_at', 'id'))
+
+
+def send(outbox_message):
+    """
+    Send `outbox_message` over the pooled connection of this thread. Return the exception if it failed.
+    """
+    try:
+        send_batch([build_message(outbox_message)])
+    except Exception as e:
+        return e
+    return None
+
+
+def send_all(outbox_messages, workers=1):
+    """
+    Send `outbox_messages` with up to `workers` threads. Return {id: exception or None}.
+    """
+    if workers <= 1 or len(outbox_messages) <= 1:
+        return {outbox_message.pk: send(outbox_message) for outbox_message in outbox_messages}
+    pending = queue.SimpleQueue()
+    for outbox_message in outbox_messages:
+        pending.put(outbox_message)
+    errors = {}
+
+    def work():
+        try:
+            while True:
+                try:
+                    outbox_message = pending.get_nowait()
+                except queue.Empty:
+                    return
+                errors[outbox_message.pk] = send(outbox_message)
+        finally:
+            pool.close()
+
+    threads = [
+        threading.Thread(target=work, name=f'outbox-worker-{i}', daemon=True)
+        for i in range(min(workers, len(outbox_messages)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def record(outbox_message, error):
+    """
+    Save the result of sending `outbox_message`. Return whether it was sent, or None if the
+    lock was taken over by another worker meanwhile, in which case nothing is saved.
+    """
+    outbox_message.attempts += 1
+    if error is not None:
+        outbox_message.last_error = f'{type(error).__name__}: {error}'
+        if outbox_message.attempts >= getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5):
+            outbox_message.status = 'dead'
+        else:
+            outbox_message.status = 'pending'
+            outbox_message.available_at = timezone.now() + get_retry_delay(outbox_message.attempts)
+    else:
+        outbox_message.status = 'sent'
+        outbox_message.sent_at = timezone.now()
+    lock_id, outbox_message.lock_id = outbox_message.lock_id, ''
+    fields = ['attempts', 'last_error', 'status', 'available_at', 'sent_at', 'lock_id']
+    updated = OutboxMessage.objects.filter(pk=outbox_message.pk, status='sending', lock_id=lock_id).update(
+        **{field: getattr(outbox_message, field) for field in fields}
+    )
+    if not updated:
+        logger.warning(f'Outbox message {outbox_message.pk} was taken over by another worker, its result is dropped.')
+        return None
+    if outbox_message.status == 'dead':
+        logger.error(f'Outbox message {outbox_message.pk} is dead after {outbox_message.attempts} attempts: {error}')
+    elif outbox_message.status == 'pending':
+        logger.warning(f'Outbox message {outbox_message.pk} failed, retry at {outbox_message.available_at}: {error}')
+    # `update` skips the signals, e.g. the one recording the task mails of telecom.
+    post_save.send(
+        sender=OutboxMessage, instance=outbox_message, created=False,
+        update_fields=frozenset(fields), raw=False, using=OutboxMessage.objects.db,
+    )
+    return outbox_message.status == 'sent'
+
+
+def deliver(outbox_message):
+    """
+    Send `outbox_message` and record the result. Return whether it was sent, see `record`.
+    """
+    return record(outbox_message, send(outbox_message))
+
+
+def deliver_outbox(limit=100, workers=None):
+    """
+    Send the due mails in batches of `limit` with up to `workers` threads until none is due. Return (sent, failed).
+    """
+    if workers is None:
+        workers = getattr(settings, 'OUTBOX_WORKERS', 4)
+    sent = failed = 0
+    while True:
+        batch = claim(limit)
+        if not batch:
+            return sent, failed
+        errors = send_all(batch, workers)
+        for outbox_message in batch:
+            result = record(outbox_message, errors[outbox_message.pk])
+            if result:
+                sent += 1
+            elif result is not None:
+                failed += 1
@@ -0,0 +1,204 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# The hard limit of rows shown by the "all" mode.
+ALL_MAX_ROWS = 500
+# The number of rows fetched by each query of the "all" mode.
+ALL_CHUNK_SIZE = 100
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage(Sequence):
+    """
+    A page of a `KeysetPaginator`. It acts like `django.core.paginator.Page` in templates
+    but it has cursors instead of page numbers.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous, is_all=False):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.is_all = is_all
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor(self.object_list[-1], reverse=False)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by "seeking" after the last row of the previous page instead
+    of using `OFFSET`, so page N costs the same as page 1 and no `COUNT(*)` is needed.
+
+    The rows are ordered by the explicit ordering of the queryset, or else the model's
+    `Meta.ordering`, plus the pk to make the order total. The ordering fields should
+    not be nullable. A cursor is an opaque url-safe string, e.g. `?cursor=...`.
+    """
+
+    def __init__(self, queryset, per_page, max_all=ALL_MAX_ROWS, chunk_size=ALL_CHUNK_SIZE):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.per_page = int(per_page)
+        self.max_all = max_all
+        self.chunk_size = chunk_size
+        self.ordering = self.get_ordering(queryset)
+
+    def get_ordering(self, queryset):
+        """
+        Return a list of (`field_name`, `descending`).
+        """
+        ordering = list(queryset.query.order_by) or list(self.model._meta.ordering)
+        fields = []
+        for item in ordering:
+            if not isinstance(item, str):
+                raise ValueError(f'KeysetPaginator only supports ordering by field names, got {item!r}.')
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            fields.append((name, descending))
+        pk_name = self.model._meta.pk.name
+        if pk_name not in [name for name, _ in fields]:
+            descending = fields[-1][1] if fields else False
+            fields.append((pk_name, descending))
+        return fields
+
+    def get_order_by(self, reverse=False):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.ordering
+        ]
+
+    def get_key(self, obj):
+        return [getattr(obj, name) for name, _ in self.ordering]
+
+    # Cursors
+    def encode_cursor(self, obj, reverse=False):
+        payload = {'r': reverse, 'k': self.get_key(obj)}
+        s = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(s.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(cursor + padding).decode('utf-8'))
+            reverse, values = bool(payload['r']), payload['k']
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            key = [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (ValueError, KeyError, TypeError, binascii.Error) as e:
+            raise InvalidCursor(cursor) from e
+        return reverse, key
+
+    def get_seek_filter(self, key, reverse=False):
+        """
+        Return a Q matching the rows after `key`, or before `key` if `reverse`.
+        """
+        q = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition = Q(**{f'{name}__{lookup}': key[i]})
+            for j, (previous_name, _) in enumerate(self.ordering[:i]):
+                condition &= Q(**{previous_name: key[j]})
+            q |= condition
+        return q
+
+    def fetch(self, key=None, reverse=False, limit=None):
+        queryset = self.queryset.order_by(*self.get_order_by(reverse=reverse))
+        if key is not None:
+            queryset = queryset.filter(self.get_seek_filter(key, reverse=reverse))
+        return list(queryset[:limit])
+
+    # Pages
+    def get_page(self, cursor=''):
+        """
+        Return the page after (or before) `cursor`. An invalid cursor gives the first page.
+        """
+        reverse, key = False, None
+        if cursor:
+            try:
+                reverse, key = self.decode_cursor(cursor)
+            except InvalidCursor:
+                reverse, key = False, None
+        rows = self.fetch(key=key, reverse=reverse, limit=self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=key is not None)
+
+    def get_all(self):
+        """
+        Return a page with every row, at most `max_all` of them. The rows are fetched
+        in chunks of `chunk_size` so no single query gets unbounded. If there are more
+        rows than `max_all`, the page has a next cursor to continue from.
+        """
+        rows = []
+        key = None
+        while len(rows) < self.max_all:
+            limit = min(self.chunk_size, self.max_all - len(rows))
+            chunk = self.fetch(key=key, limit=limit + 1)
+            rows.extend(chunk[:limit])
+            if len(chunk) <= limit:
+                return KeysetPage(rows, self, has_next=False, has_previous=False, is_all=True)
+            key = self.get_key(chunk[limit - 1])
+        return KeysetPage(rows, self, has_next=True, has_previous=False, is_all=True)
+
+    def get_count(self, cap=1000):
+        """
+        Return (`count`, `is_exact`). The count stops at `cap` so it never scans the
+        whole table; if there are more rows, `is_exact` is False.
+        """
+        count = self.queryset.order_by().values('pk')[:cap + 1].count()
+        if count > cap:
+            return cap, False
+        return count, True
+
+
+def get_keyset_page(request, queryset, per_page, **kwargs):
+    """
+    Return the page of `queryset` requested by `?page=all` or `?cursor=...`.
+    """
+    paginator = KeysetPaginator(queryset, per_page, **kwargs)
+    if request.GET.get('page', '').lower() == 'all':
+        return paginator.get_all()
+    return paginator.get_page(request.GET.get('cursor', ''))
@@ -0,0 +1,287 @@
+"""
+Prefix-lists compiled into radix tries.
+
+An entry of a prefix-list, e.g. `10.0.0.0/8 ge 16 le 24`, matches the routes inside its network
+whose length is in [ge, le]: without an operator only the network itself, with `le` the lengths
+from the network's up to `le`, with `ge` the lengths from `ge` up to the address width, and with
+`eq` exactly that length.
+
+`PrefixTrie` keeps the entries in a path compressed binary trie per IP version, keyed by the bits
+of their networks, so the entries containing a network are found in one walk of at most the
+prefix length, and the entries inside it in the subtree under that walk.
+
+`aggregate` collapses a prefix-list into the fewest entries matching the same routes, over the
+integer ranges of their networks.
+"""
+import ipaddress
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+WIDTHS = {4: 32, 6: 128}
+
+
+class Prefix(namedtuple('Prefix', ['version', 'network', 'prefixlen', 'ge', 'le'])):
+    """
+    An entry of a prefix-list, with its network as an integer.
+    """
+
+    __slots__ = ()
+
+    @property
+    def width(self):
+        return WIDTHS[self.version]
+
+    def __str__(self):
+        address = ipaddress.IPv4Address(self.network) if self.version == 4 else ipaddress.IPv6Address(self.network)
+        s = f'{address}/{self.prefixlen}'
+        if self.ge != self.prefixlen:
+            s = f'{s} ge {self.ge}'
+        if self.le != (self.width if self.ge != self.prefixlen else self.prefixlen):
+            s = f'{s} le {self.le}'
+        return s
+
+    def contains_network(self, other):
+        """
+        Return whether the network of `other` is inside the network of this entry.
+        """
+        if self.version != other.version or self.prefixlen > other.prefixlen:
+            return False
+        shift = self.width - self.prefixlen
+        return self.network >> shift == other.network >> shift
+
+    def covers(self, other):
+        """
+        Return whether every route matched by `other` is matched by this entry.
+        """
+        return self.contains_network(other) and self.ge <= other.ge and other.le <= self.le
+
+    def overlaps(self, other):
+        """
+        Return whether a route is matched by both this entry and `other`.
+        """
+        return (
+            (self.contains_network(other) or other.contains_network(self))
+            and max(self.ge, other.ge) <= min(self.le, other.le)
+        )
+
+
+@lru_cache(maxsize=65536)
+def parse_prefix(text):
+    """
+    Return the `Prefix` of an entry like `10.0.0.0/8 le 24`. Raise ValueError if it is invalid.
+    """
+    ip_network, *args = text.split()
+    network = ipaddress.ip_network(ip_network, strict=False)
+    if len(args) % 2:
+        raise ValueError(f'{text} has an operator without a length.')
+    operators = {}
+    for operator, length in zip(args[::2], args[1::2]):
+        if operator not in ('eq', 'le', 'ge') or operator in operators:
+            raise ValueError(f'{text} has an invalid operator.')
+        operators[operator] = int(length)
+    width = WIDTHS[network.version]
+    if 'eq' in operators:
+        ge = le = operators['eq']
+    else:
+        ge = operators.get('ge', network.prefixlen)
+        le = operators.get('le', width if 'ge' in operators else network.prefixlen)
+    if not network.prefixlen <= ge <= le <= width:
+        raise ValueError(f'{text} has invalid lengths.')
+    return Prefix(network.version, int(network.network_address), network.prefixlen, ge, le)
+
+
+def split_prefix_list(value):
+    """
+    Return the entries of a comma separated prefix-list string.
+    """
+    return [s for s in map(str.strip, value.split(',')) if s]
+
+
+def parse_prefix_list(value, ignore_invalid=False):
+    """
+    Return the `Prefix` of the entries of a comma separated prefix-list string.
+    """
+    prefixes = []
+    for text in split_prefix_list(value):
+        try:
+            prefixes.append(parse_prefix(text))
+        except ValueError:
+            if not ignore_invalid:
+                raise
+    return prefixes
+
+
+class _Node:
+
+    __slots__ = ('network', 'prefixlen', 'entries', 'children')
+
+    def __init__(self, network, prefixlen):
+        self.network = network
+        self.prefixlen = prefixlen
+        self.entries = []
+        self.children = [None, None]
+
+
+def _get_bit(network, index, width):
+    return (network >> (width - 1 - index)) & 1
+
+
+def _mask(network, prefixlen, width):
+    shift = width - prefixlen
+    return network >> shift << shift
+
+
+class PrefixTrie:
+    """
+    A radix trie of `Prefix`, each with a value, e.g. where it comes from.
+    """
+
+    def __init__(self, prefixes=()):
+        self.roots = {version: _Node(0, 0) for version in WIDTHS}
+        self.size = 0
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, prefix, value=None):
+        width = prefix.width
+        node = self.roots[prefix.version]
+        while node.prefixlen != prefix.prefixlen:
+            bit = _get_bit(prefix.network, node.prefixlen, width)
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _Node(prefix.network, prefix.prefixlen)
+                node = child
+                break
+            common = min(child.prefixlen, prefix.prefixlen, width - (child.network ^ prefix.network).bit_length())
+            if common == child.prefixlen:
+                node = child
+                continue
+            # Split the edge to the child at the common bits.
+            middle = node.children[bit] = _Node(_mask(prefix.network, common, width), common)
+            middle.children[_get_bit(child.network, common, width)] = child
+            node = middle
+        node.entries.append((prefix, value))
+        self.size += 1
+
+    def iter_containing(self, prefix):
+        """
+        Yield (entry, value) of the entries whose networks contain the network of `prefix`, shortest first.
+        """
+        width = prefix.width
+        node = self.roots[prefix.version]
+        while node is not None and node.prefixlen <= prefix.prefixlen:
+            if node.network != _mask(prefix.network, node.prefixlen, width):
+                return
+            yield from node.entries
+            if node.prefixlen == prefix.prefixlen:
+                return
+            node = node.children[_get_bit(prefix.network, node.prefixlen, width)]
+
+    def iter_contained(self, prefix):
+        """
+        Yield (entry, value) of the entries whose networks are strictly inside the network of `prefix`.
+        """
+        width = prefix.width
+        node = self.roots[prefix.version]
+        while node.prefixlen < prefix.prefixlen:
+            node = node.children[_get_bit(prefix.network, node.prefixlen, width)]
+            if node is None:
+                return
+        if _mask(node.network, prefix.prefixlen, width) != prefix.network:
+            return
+        nodes = [node] if node.prefixlen > prefix.prefixlen else [child for child in node.children if child is not None]
+        while nodes:
+            node = nodes.pop()
+            yield from node.entries
+            nodes.extend(child for child in node.children if child is not None)
+
+    def duplicates(self, prefix):
+        return [(entry, value) for entry, value in self.iter_containing(prefix) if entry == prefix]
+
+    def covering(self, prefix):
+        """
+        Return (entry, value) of the entries matching every route `prefix` matches.
+        """
+        return [(entry, value) for entry, value in self.iter_containing(prefix) if entry.covers(prefix)]
+
+    def covered(self, prefix):
+        """
+        Return (entry, value) of the entries whose routes are all matched by `prefix`.
+        """
+        return [
+            (entry, value)
+            for entries in (self.iter_containing(prefix), self.iter_contained(prefix))
+            for entry, value in entries
+            if prefix.covers(entry)
+        ]
+
+    def overlapping(self, prefix):
+        """
+        Return (entry, value) of the entries matching a route `prefix` also matches.
+        """
+        return [
+            (entry, value)
+            for entries in (self.iter_containing(prefix), self.iter_contained(prefix))
+            for entry, value in entries
+            if entry.overlaps(prefix)
+        ]
+
+    def intersecting(self, prefix):
+        """
+        Return (entry, value) of the entries whose networks contain or are inside the network of `prefix`, whatever the lengths.
+        """
+        return [*self.iter_containing(prefix), *self.iter_contained(prefix)]
+
+
+def iter_blocks(version, start, end, ge, le):
+    """
+    Yield the fewest `Prefix` with lengths `ge` and `le` whose networks are the range [start, end).
+    """
+    width = WIDTHS[version]
+    while start < end:
+        # The largest block aligned at `start` and within the range.
+        bits = min((start & -start).bit_length() - 1 if start else width, (end - start).bit_length() - 1)
+        yield Prefix(version, start, width - bits, ge, le)
+        start += 1 << bits
+
+
+def aggregate(prefixes):
+    """
+    Return the sorted entries matching the same routes as `prefixes` with adjacent and
+    overlapping networks of the same lengths merged, and the entries covered by others dropped.
+
+    Merging keeps the lengths, e.g. 10.0.0.0/24 and 10.0.1.0/24 become 10.0.0.0/23 ge 24 le 24.
+    """
+    # {(version, ge, le): [(start, end)]} of the merged networks.
+    groups = defaultdict(list)
+    for prefix in sorted(prefixes, key=lambda prefix: (prefix.version, prefix.ge, prefix.le, prefix.network)):
+        start = prefix.network
+        end = start + (1 << (prefix.width - prefix.prefixlen))
+        ranges = groups[(prefix.version, prefix.ge, prefix.le)]
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    starts = {key: [start for start, _ in ranges] for key, ranges in groups.items()}
+    result = []
+    for (version, ge, le), ranges in groups.items():
+        # The groups matching every length of this one may cover its blocks.
+        covering = [
+            key for key in groups
+            if key != (version, ge, le) and key[0] == version and key[1] <= ge and le <= key[2]
+        ]
+        for start, end in ranges:
+            for block in iter_blocks(version, start, end, ge, le):
+                block_end = block.network + (1 << (block.width - block.prefixlen))
+                for key in covering:
+                    i = bisect_right(starts[key], block.network) - 1
+                    if i >= 0 and groups[key][i][1] >= block_end:
+                        break
+                else:
+                    result.append(block)
+    return sorted(result)
+
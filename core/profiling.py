@@ -0,0 +1,107 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# A fingerprint seen at least this many times in one request is reported as a likely N+1.
+DUPLICATE_THRESHOLD = 3
+
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalize `sql` so that the same query with other parameters gets the same fingerprint,
+    e.g. `... WHERE id IN (%s, %s)` and `... WHERE id IN (%s)`.
+    """
+    sql = STRING_RE.sub('%s', sql)
+    sql = NUMBER_RE.sub('%s', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """
+    Record the queries run while it is installed as an execute wrapper of the connections.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started_at))
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def total_time(self):
+        finished_at = self.finished_at or time.perf_counter()
+        return finished_at - self.started_at
+
+    def get_duplicates(self, threshold=DUPLICATE_THRESHOLD):
+        """
+        Return a list of (`fingerprint`, `count`) seen at least `threshold` times, most frequent first.
+        """
+        counter = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counter.most_common() if count >= threshold]
+
+
+@contextmanager
+def profile_queries():
+    """
+    Profile the queries of every database connection within the block.
+    """
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        try:
+            yield profile
+        finally:
+            profile.finish()
+
+
+def get_query_budget(view_name):
+    """
+    Return the maximum number of queries of `view_name` from `settings.QUERY_BUDGETS`, or None.
+    """
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+
+class QueryBudgetTestMixin:
+    """
+    A mixin of `TestCase` to check the responses against `settings.QUERY_BUDGETS`.
+    The responses need to pass through `QueryProfilingMiddleware`.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        profile = getattr(response, 'query_profile', None)
+        self.assertIsNotNone(profile, 'The response was not profiled by QueryProfilingMiddleware.')
+        view_name = response.resolver_match.view_name if response.resolver_match else None
+        budget = get_query_budget(view_name) if budget is None else budget
+        self.assertIsNotNone(budget, f'No query budget for {view_name}.')
+        self.assertLessEqual(
+            profile.count, budget,
+            f'{view_name} ran {profile.count} queries, over its budget of {budget}.',
+        )
@@ -0,0 +1,40 @@
+from functools import partial
+
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from . import versions
+from .storage import get_content_fields, release
+
+
+def release_content_files(sender, instance, **kwargs):
+    """
+    Release the blobs of a deleted row once the deletion is committed, a rollback keeps them.
+    Connected to `post_delete` of the models with content `FileField`s by `CoreConfig.ready`.
+    """
+    for field in get_content_fields(sender):
+        name = getattr(instance, field.attname).name
+        if name:
+            transaction.on_commit(partial(release, field.storage, name))
+
+
+@receiver(post_migrate, dispatch_uid='create_cache_table')
+def create_cache_table(sender, using='default', **kwargs):
+    # The table of the DatabaseCache shared by the workers, see CACHES in the settings.
+    if sender.name != 'core':
+        return
+    call_command('createcachetable', database=using, verbosity=0)
+
+
+@receiver(request_started, dispatch_uid='start_versions_snapshot')
+def start_versions_snapshot(sender, **kwargs):
+    # The shared versions are read once per request, see core/versions.py.
+    versions.start_snapshot()
+
+
+@receiver(request_finished, dispatch_uid='end_versions_snapshot')
+def end_versions_snapshot(sender, **kwargs):
+    versions.end_snapshot()
@@ -0,0 +1,191 @@
+"""
+A content-addressed file storage.
+
+An upload is streamed to a temporary file while its SHA-256 is computed, then named after the
+digest in a sharded layout, e.g. `archive/ab/cd/abcd...ef.pdf`. So the same content uploaded
+again, e.g. the LOA of a cloned task, is stored once and every row refers to the same blob.
+
+The references of a blob are the rows of the `FileField`s stored here with its name; when a row
+is deleted, the blob is removed once the transaction commits if no other row refers to it.
+The blobs orphaned otherwise, e.g. replaced by an update or left by an aborted upload, are
+reclaimed by the `gcmedia` command.
+
+Both only remove the files not modified for `MEDIA_GC_GRACE_SECONDS`: an upload of the same
+content touches the blob, so a blob which may be referenced by a row not committed yet is kept,
+and left to `gcmedia`.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils.deconstruct import deconstructible
+
+# The directory of the uploads being written, under the storage location.
+TEMP_DIR = '.tmp'
+
+
+def get_grace():
+    return getattr(settings, 'MEDIA_GC_GRACE_SECONDS', 3600)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def get_blob_name(self, dirname, digest, extension):
+        return '/'.join(filter(None, [dirname, digest[:2], digest[2:4], f'{digest}{extension.lower()}']))
+
+    def get_available_name(self, name, max_length=None):
+        # The name is only known once the content is hashed, in `_save`.
+        return name
+
+    def _save(self, name, content):
+        dirname, filename = os.path.split(name)
+        temp_dir = self.path(TEMP_DIR)
+        self.makedirs(temp_dir)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = self.get_blob_name(dirname.replace('\\', '/'), digest.hexdigest(), os.path.splitext(filename)[1])
+            path = self.path(name)
+            self.makedirs(os.path.dirname(path))
+            if os.path.exists(path):
+                # Stored already. Touch it so `gcmedia` keeps it until the new row is committed.
+                os.remove(temp_path)
+                os.utime(path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+@lru_cache(maxsize=None)
+def get_content_fields(model):
+    """
+    Return the `FileField`s of `model` stored by a `ContentAddressedStorage`.
+    """
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def iter_content_fields():
+    for model in apps.get_models():
+        for field in get_content_fields(model):
+            yield model, field
+
+
+def count_references(name):
+    return sum(model._default_manager.filter(**{field.name: name}).count() for model, field in iter_content_fields())
+
+
+def get_referenced_names():
+    names = set()
+    for model, field in iter_content_fields():
+        names.update(model._default_manager.exclude(**{field.name: ''}).values_list(field.name, flat=True).iterator())
+    return names
+
+
+def release(storage, name):
+    """
+    Delete the blob `name` of `storage` if no row refers to it any more and it was not modified
+    within the grace period.
+    """
+    if count_references(name):
+        return
+    try:
+        mtime = os.stat(storage.path(name)).st_mtime
+    except FileNotFoundError:
+        return
+    if mtime < time.time() - get_grace():
+        storage.delete(name)
+
+
+def scan(directory):
+    """
+    Return [(path, mtime)] of the files under `directory`.
+    """
+    files = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                files.append((path, os.stat(path).st_mtime))
+            except FileNotFoundError:
+                pass
+    return files
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def collect_garbage(grace=None, workers=4, dry_run=False):
+    """
+    Remove the files under the directories of the content `FileField`s which no row refers to
+    and were not modified for `grace` seconds, `MEDIA_GC_GRACE_SECONDS` by default, scanning the
+    shards with `workers` threads. Return ([removed name], scanned count).
+    """
+    if grace is None:
+        grace = get_grace()
+    locations = {}
+    for _, field in iter_content_fields():
+        if isinstance(field.upload_to, str):
+            location = field.storage.location
+            locations.setdefault(location, {TEMP_DIR}).add(field.upload_to.strip('/').split('/')[0])
+    directories = []
+    files = []
+    for location, roots in locations.items():
+        for root in roots:
+            root = os.path.join(location, root)
+            if not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                # The blobs are in the shards, the files of the old layout right in the root.
+                if entry.is_dir():
+                    directories.append(entry.path)
+                else:
+                    files.append((entry.path, entry.stat().st_mtime))
+    deadline = time.time() - grace
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        files.extend(file for shard in executor.map(scan, directories) for file in shard)
+        # Read after the scan, so a blob committed meanwhile is referenced.
+        referenced = get_referenced_names()
+        removed = []
+        for path, mtime in sorted(files):
+            location = next(location for location in locations if path.startswith(location))
+            name = os.path.relpath(path, location).replace(os.sep, '/')
+            if mtime < deadline and name not in referenced:
+                removed.append(name)
+                if not dry_run:
+                    executor.submit(remove, path)
+    return removed, len(files)
@@ -2,6 +2,8 @@ from django import template
 from django.utils.html import conditional_escape
 from django.utils.safestring import mark_safe
 
+from accounts.perms import get_prefetched_obj_perm
+
 register = template.Library()
 
 
@@ -28,18 +30,29 @@ def get_perm_name(options, action):
     return perm_name
 
 
+# The `can_*` filters read the flags computed by `accounts.perms.prefetch_obj_perms`
+# if there are some, and fall back to a per-object check otherwise.
 @register.filter
 def can_view(user, obj):
+    perm = get_prefetched_obj_perm(user, obj, 'view')
+    if perm is not None:
+        return perm
     return user.has_perm(perm='view', obj=obj)
 
 
 @register.filter
 def can_change(user, obj):
+    perm = get_prefetched_obj_perm(user, obj, 'change')
+    if perm is not None:
+        return perm
     return user.has_perm(perm='change', obj=obj)
 
 
 @register.filter
 def can_comment(user, obj):
+    perm = get_prefetched_obj_perm(user, obj, 'comment')
+    if perm is not None:
+        return perm
     commenter = user
     creator = obj.created_by
     if commenter.profile.is_supervisor_of(creator):
@@ -49,6 +62,9 @@ def can_comment(user, obj):
 
 @register.filter
 def can_delete(user, obj):
+    perm = get_prefetched_obj_perm(user, obj, 'delete')
+    if perm is not None:
+        return perm
     return user.has_perm(perm='delete', obj=obj)
 
 
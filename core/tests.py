@@ -0,0 +1,551 @@
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+from email.header import decode_header, make_header
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db.models.deletion import Collector
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from archive.models import Archive
+from comment.models import Comment
+from dep_calendar.models import CalendarEvent
+from diary import search
+from diary.models import Diary
+from log.models import Log
+
+from . import attachments, export, outbox, storage
+from .mail import MailDispatcher, pool, send_batch, send_mail
+from .models import OutboxMessage
+from .pagination import KeysetPaginator
+from .prefixes import PrefixTrie, aggregate, parse_prefix, parse_prefix_list
+from .profiling import QueryBudgetTestMixin, fingerprint, profile_queries
+
+User = get_user_model()
+
+
+class KeysetPaginatorTestCase(TestCase):
+
+    def setUp(self):
+        users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(3)]
+        # Several diaries share a date, so the pk is needed to make the order total.
+        start = datetime.date(2024, 1, 1)
+        for day in range(5):
+            for user in users:
+                Diary.objects.create(date=start + datetime.timedelta(days=day), daily_record='record', created_by=user)
+        self.expected = list(Diary.objects.order_by('-date', '-id'))
+
+    def walk_forward(self, paginator):
+        page = paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        return pages
+
+    def test_pages_cover_every_row_once(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4)
+        self.assertEqual(paginator.get_order_by(), ['-date', '-id'])
+        pages = self.walk_forward(paginator)
+        self.assertEqual([obj for page in pages for obj in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_previous_cursor(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4)
+        pages = self.walk_forward(paginator)
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected))
+        self.assertFalse(page.has_previous())
+
+    def test_page_costs_one_query(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4)
+        page = paginator.get_page()
+        page = paginator.get_page(page.next_cursor)
+        with self.assertNumQueries(1):
+            paginator.get_page(page.next_cursor)
+
+    def test_invalid_cursor_gives_first_page(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4)
+        self.assertEqual(list(paginator.get_page('not-a-cursor')), self.expected[:4])
+
+    def test_get_all_is_bounded(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4, max_all=10, chunk_size=3)
+        with self.assertNumQueries(4):
+            page = paginator.get_all()
+        self.assertEqual(list(page), self.expected[:10])
+        self.assertTrue(page.has_next())
+        self.assertEqual(list(paginator.get_page(page.next_cursor)), self.expected[10:14])
+        page = KeysetPaginator(Diary.objects.all(), 4, max_all=100, chunk_size=3).get_all()
+        self.assertEqual(list(page), self.expected)
+        self.assertFalse(page.has_other_pages())
+
+    def test_get_count(self):
+        paginator = KeysetPaginator(Diary.objects.all(), 4)
+        self.assertEqual(paginator.get_count(cap=100), (15, True))
+        self.assertEqual(paginator.get_count(cap=10), (10, False))
+
+
+class QueryProfilingTestCase(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.user.user_permissions.set(Permission.objects.filter(codename__in=['view_diary', 'view_calendarevent']))
+        self.department = Group.objects.create(name='department')
+        self.user.groups.add(self.department)
+        self.user.profile.activated_role = self.department
+        self.user.profile.save()
+        self.client.force_login(self.user)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "a" = 1'),
+            fingerprint('SELECT  *  FROM "t" WHERE "id" IN (%s) AND "a" = 2'),
+        )
+
+    def test_duplicates(self):
+        with profile_queries() as profile:
+            for i in range(3):
+                list(Diary.objects.filter(pk=i))
+        self.assertEqual(profile.count, 3)
+        self.assertEqual(len(profile.get_duplicates()), 1)
+
+    def test_response_is_profiled(self):
+        response = self.client.get(reverse('diary:diary_list'))
+        self.assertIn('db;desc="SQL (', response['Server-Timing'])
+        self.assertWithinQueryBudget(response)
+
+    def test_calendar_events_json_budget(self):
+        now = timezone.now()
+        for i in range(10):
+            user = User.objects.create_user(username=f'creator{i}', password='password')
+            CalendarEvent.objects.create(
+                title='event', product_type='IDC', event_type='maintenance', start_time=now, end_time=now,
+                created_by=user, department=self.department,
+            )
+        response = self.client.get(reverse('dep_calendar:calendar_events_json'))
+        self.assertEqual(len(response.json()), 10)
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(response.query_profile.get_duplicates(), [])
+
+
+class QueryBudgetsTestCase(QueryBudgetTestMixin, TestCase):
+    # Every view of `QUERY_BUDGETS`, on the data of `seedperfdata`.
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.media_root = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=cls.media_root):
+            call_command(
+                'seedperfdata', users=12, departments=3, years=1, logs=50, news=8, reminders=8,
+                isps=5, isp_groups=2, tasks=8, files=1, events=8, terms=20, stdout=io.StringIO(),
+            )
+        cls.user = User.objects.get(username='perf_0')
+        cls.comment = Comment.objects.create(post_title='title', comment='comment', created_by=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def test_views_within_budget(self):
+        self.client.force_login(self.user)
+        for view_name in settings.QUERY_BUDGETS:
+            with self.subTest(view_name=view_name):
+                args = [self.comment.pk] if view_name == 'comment:comment_message_list' else []
+                url = reverse(view_name, args=args)
+                # After the caches are filled, e.g. the visibility scope, as `runbenchmark` does.
+                self.client.get(url)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+
+
+class BenchmarkCommandTestCase(TestCase):
+
+    def test_seed_and_benchmark(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            call_command(
+                'seedperfdata', users=12, departments=3, years=1, logs=50, news=5, reminders=5,
+                isps=5, isp_groups=2, tasks=3, files=1, events=5, terms=20, stdout=io.StringIO(),
+            )
+            output = os.path.join(directory, 'report.json')
+            call_command('runbenchmark', repeat=2, warmup=0, output=output, stdout=io.StringIO())
+            with open(output, encoding='utf-8') as f:
+                report = json.load(f)
+        self.assertEqual(report['row_counts']['auth.User'], 12 + 3)
+        results = {result['name']: result for result in report['results']}
+        self.assertEqual(results['diary_list']['status'], 200)
+        self.assertIn('p99', results['diary_list']['latency_ms'])
+        self.assertIn('senddiaryuseremail', results)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', MAIL_BATCH_SIZE=4)
+class MailDispatcherTestCase(TestCase):
+
+    def setUp(self):
+        pool.close()
+        self.addCleanup(pool.close)
+
+    def test_batches_share_one_connection(self):
+        messages = [EmailMessage(f'subject {i}', 'body', to=[f'user{i}@example.com']) for i in range(10)]
+        with mock.patch('core.mail.get_connection', wraps=get_connection) as connect:
+            with MailDispatcher() as dispatcher:
+                for message in messages:
+                    dispatcher.add(message)
+            send_mail(subject='one\nmore', body='body', to=['user@example.com'])
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual([batch[:2] for batch in dispatcher.batches], [(4, 4), (4, 4), (2, 2)])
+        self.assertEqual(len(mail.outbox), 11)
+        self.assertEqual(mail.outbox[-1].subject, 'onemore')
+
+    def test_reconnect_when_idle(self):
+        with mock.patch('core.mail.get_connection', wraps=get_connection) as connect:
+            send_mail(subject='subject', to=['user@example.com'])
+            with override_settings(MAIL_CONNECTION_MAX_IDLE=-1):
+                send_mail(subject='subject', to=['user@example.com'])
+        self.assertEqual(connect.call_count, 2)
+
+    def test_fail_silently(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            with self.assertRaises(OSError):
+                send_mail(subject='subject', to=['user@example.com'])
+            with self.assertLogs('core.mail', 'ERROR'):
+                self.assertEqual(send_mail(subject='subject', to=['user@example.com'], fail_silently=True), 0)
+
+    def test_send_batch_message_by_message(self):
+        messages = [EmailMessage(f'subject {i}', 'body', to=[f'user{i}@example.com']) for i in range(4)]
+        original = locmem.EmailBackend.send_messages
+        calls = []
+
+        def send_messages(backend, batch):
+            calls.append(batch[0].subject)
+            if batch[0] is messages[1]:
+                raise smtplib.SMTPRecipientsRefused({'user1@example.com': (550, b'No such user')})
+            if batch[0] is messages[2] and calls.count('subject 2') == 1:
+                raise smtplib.SMTPServerDisconnected('gone')
+            return original(backend, batch)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=send_messages):
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                send_batch(messages)
+            self.assertEqual(len(mail.outbox), 1)
+            mail.outbox = []
+            calls.clear()
+            with self.assertLogs('core.mail', 'ERROR'):
+                sent = send_batch(messages, fail_silently=True)
+        self.assertEqual(sent, [messages[0], messages[2], messages[3]])
+        # Only the message interrupted by the disconnect is resent.
+        self.assertEqual(calls, ['subject 0', 'subject 1', 'subject 2', 'subject 2', 'subject 3'])
+        self.assertEqual([message.subject for message in mail.outbox], ['subject 0', 'subject 2', 'subject 3'])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_MAX_ATTEMPTS=3,
+    OUTBOX_RETRY_BACKOFF_SECONDS=60,
+    OUTBOX_WORKERS=1,
+)
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        pool.close()
+        self.addCleanup(pool.close)
+        attachments.cache.clear()
+
+    def test_deliver_by_priority(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+            f.write(b'content')
+        self.addCleanup(os.remove, f.name)
+        outbox.enqueue('low', to='a@example.com;b@example.com;', priority=outbox.LOW)
+        outbox.enqueue('high\n', to=['a@example.com'], html_body='<p>high</p>', attachments=[(f.name, '附件.txt')], priority=outbox.HIGH)
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('deliver_outbox', stdout=io.StringIO())
+        self.assertEqual([message.subject for message in mail.outbox], ['high', 'low'])
+        self.assertEqual(mail.outbox[1].to, ['a@example.com', 'b@example.com'])
+        attachment = mail.outbox[0].attachments[0]
+        self.assertEqual(attachment.get_payload(decode=True), b'content')
+        self.assertEqual(attachment.get_content_type(), 'text/plain')
+        self.assertEqual(str(make_header(decode_header(attachment.get_filename()))), '附件.txt')
+        self.assertEqual(OutboxMessage.objects.filter(status='sent').count(), 2)
+        self.assertEqual(outbox.deliver_outbox(), (0, 0))
+
+    def test_retry_with_backoff_then_dead(self):
+        message = outbox.enqueue('subject', to=['a@example.com'])
+        send_messages = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        with mock.patch(send_messages, side_effect=OSError('down')), self.assertLogs('core.outbox', 'WARNING'):
+            self.assertEqual(outbox.deliver_outbox(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts, message.last_error), ('pending', 1, 'OSError: down'))
+            self.assertGreater(message.available_at, timezone.now() + datetime.timedelta(seconds=50))
+            # Not due yet.
+            self.assertEqual(outbox.deliver_outbox(), (0, 0))
+            for _ in range(2):
+                OutboxMessage.objects.update(available_at=timezone.now())
+                outbox.deliver_outbox()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', 3))
+
+    def test_deliver_with_workers(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+            f.write(b'content')
+        self.addCleanup(os.remove, f.name)
+        for i in range(10):
+            outbox.enqueue(f'subject {i}', to=['a@example.com'], attachments=[(f.name, 'file.txt')])
+        with mock.patch('core.attachments.open', create=True, wraps=open) as mock_open:
+            self.assertEqual(outbox.deliver_outbox(workers=4), (10, 0))
+        # The shared attachment is read and encoded once.
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted(f'subject {i}' for i in range(10)))
+        self.assertEqual(OutboxMessage.objects.filter(status='sent').count(), 10)
+        # The connections of the workers are closed with the batch.
+        self.assertEqual(pool.connections, set())
+
+    def test_take_over_stale_lock(self):
+        message = outbox.enqueue('subject', to=['a@example.com'])
+        self.assertEqual(outbox.claim(10), [message])
+        self.assertEqual(outbox.claim(10), [])
+        OutboxMessage.objects.update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(outbox.deliver_outbox(), (1, 0))
+
+    def test_result_of_lost_lock_is_dropped(self):
+        outbox.enqueue('subject', to=['a@example.com'])
+        [stale] = outbox.claim(10)
+        # Taken over by another worker after the lock timeout.
+        OutboxMessage.objects.update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        [message] = outbox.claim(10)
+        with self.assertLogs('core.outbox', 'WARNING'):
+            self.assertIsNone(outbox.record(stale, OSError('down')))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.last_error), ('sending', 0, ''))
+        self.assertTrue(outbox.record(message, None))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.lock_id), ('sent', 1, ''))
+
+
+class AttachmentCacheTestCase(TestCase):
+
+    def setUp(self):
+        attachments.cache.clear()
+        self.addCleanup(attachments.cache.clear)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_reuse_and_invalidate(self):
+        path = self.write('loa.pdf', b'loa')
+        part = attachments.cache.get(path, 'LOA.pdf')
+        self.assertIs(attachments.cache.get(path, 'LOA.pdf'), part)
+        self.assertEqual((attachments.cache.hits, attachments.cache.misses), (1, 1))
+        self.assertEqual(part.get_content_type(), 'application/pdf')
+        self.assertEqual(part.get_payload(decode=True), b'loa')
+        # Another name is another part.
+        self.assertIsNot(attachments.cache.get(path, 'other.pdf'), part)
+        # A replaced file is encoded again.
+        self.write('loa.pdf', b'new loa')
+        self.assertEqual(attachments.cache.get(path, 'LOA.pdf').get_payload(decode=True), b'new loa')
+
+    @override_settings(MAIL_ATTACHMENT_CACHE_BYTES=20, MAIL_ATTACHMENT_MMAP_BYTES=8)
+    def test_lru_limit(self):
+        # 6 bytes are 9 encoded bytes with the newline.
+        paths = [self.write(f'{i}.bin', b'x' * 6) for i in range(3)]
+        for path in paths[:2]:
+            attachments.cache.get(path, 'file')
+        attachments.cache.get(paths[0], 'file')
+        attachments.cache.get(paths[2], 'file')
+        self.assertEqual([key[0] for key in attachments.cache.parts], [paths[0], paths[2]])
+        self.assertEqual(attachments.cache.size, 18)
+        # Too large to be cached, and memory-mapped.
+        path = self.write('large.bin', b'y' * 30)
+        with mock.patch('core.attachments.mmap.mmap', wraps=attachments.mmap.mmap) as mock_mmap:
+            part = attachments.cache.get(path, 'file')
+        self.assertEqual(mock_mmap.call_count, 1)
+        self.assertEqual(part.get_payload(decode=True), b'y' * 30)
+        self.assertEqual(len(attachments.cache.parts), 2)
+
+
+class ContentAddressedStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = override_settings(MEDIA_ROOT=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='user')
+
+    def create_archive(self, content, filename='loa.PDF'):
+        archive = Archive(name='archive', type='files', created_by=self.user)
+        archive.archive.save(filename, ContentFile(content))
+        return archive
+
+    def list_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.directory.name).replace(os.sep, '/')
+            for dirpath, _, filenames in os.walk(self.directory.name)
+            for filename in filenames
+        )
+
+    def test_deduplicate_and_release(self):
+        first = self.create_archive(b'loa')
+        second = self.create_archive(b'loa', 'again.pdf')
+        digest = hashlib.sha256(b'loa').hexdigest()
+        self.assertEqual(first.archive.name, f'archive/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(second.archive.name, first.archive.name)
+        self.assertEqual(self.list_files(), [first.archive.name])
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        # Still referenced by the second one.
+        self.assertEqual(self.list_files(), [second.archive.name])
+        third = self.create_archive(b'loa')
+        with self.captureOnCommitCallbacks(execute=True):
+            Archive.objects.filter(pk__in=[second.pk, third.pk]).delete()
+        # Just touched by the upload of the third one, so it may be referenced by a row not committed yet.
+        self.assertEqual(self.list_files(), [second.archive.name])
+        third = self.create_archive(b'loa')
+        past = time.time() - 7200
+        os.utime(os.path.join(self.directory.name, third.archive.name), (past, past))
+        with self.captureOnCommitCallbacks(execute=True):
+            third.delete()
+        self.assertEqual(self.list_files(), [])
+        # Only the models with content files have delete receivers, the others keep the fast-delete.
+        collector = Collector(using='default')
+        self.assertTrue(collector._has_signal_listeners(Archive))
+        self.assertFalse(collector._has_signal_listeners(Log))
+
+    def test_collect_garbage(self):
+        archive = self.create_archive(b'kept')
+        orphan = self.create_archive(b'orphan')
+        recent = self.create_archive(b'recent')
+        # The on-commit release never runs in a test, so the blobs are left as orphans.
+        Archive.objects.filter(pk__in=[orphan.pk, recent.pk]).delete()
+        # A file of the old layout.
+        with open(os.path.join(self.directory.name, 'archive', 'uuid.pdf'), 'wb') as f:
+            f.write(b'old')
+        # All but the recent orphan are older than the grace period.
+        past = datetime.datetime.now().timestamp() - 7200
+        for name in [archive.archive.name, orphan.archive.name, 'archive/uuid.pdf']:
+            os.utime(os.path.join(self.directory.name, name), (past, past))
+        out = io.StringIO()
+        call_command('gcmedia', dry_run=True, stdout=out)
+        self.assertIn('4 file(s) scanned, 2 would be removed.', out.getvalue())
+        self.assertEqual(len(self.list_files()), 4)
+        removed, _ = storage.collect_garbage(workers=2)
+        self.assertEqual(removed, sorted(['archive/uuid.pdf', orphan.archive.name]))
+        self.assertEqual(len(self.list_files()), 2)
+        self.assertIn(archive.archive.name, self.list_files())
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.user.user_permissions.set(Permission.objects.filter(codename='view_diary'))
+        start = datetime.date(2024, 1, 1)
+        Diary.objects.bulk_create(
+            Diary(date=start + datetime.timedelta(days=i), daily_record=f'record, "{i}"', created_by=self.user)
+            for i in range(30)
+        )
+        # Bulk created, so not indexed by the signals.
+        search.rebuild()
+        self.client.force_login(self.user)
+
+    def test_iter_csv(self):
+        at = timezone.make_aware(datetime.datetime(2024, 1, 1, 1, 2, 3))
+        content = ''.join(export.iter_csv(['a', 'b'], [(None, at), ('x,y', datetime.date(2024, 1, 2))]))
+        self.assertEqual(content, '\ufeffa,b\r\n,2024-01-01 01:02:03\r\n"x,y",2024-01-02\r\n')
+
+    def test_stream_csv(self):
+        with mock.patch.object(export, 'ROWS_PER_CHUNK', 10):
+            response = self.client.get(reverse('diary:diary_export'), {'search_input': 'record'})
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[1][:4], ['2024-01-30', 'user', 'no', 'record, "29"'])
+        self.assertIn("filename*=UTF-8''diaries_", response['Content-Disposition'])
+
+    def test_stream_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(reverse('diary:diary_export'), {'format': 'xlsx'})
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.values)
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[-1][0], '2024-01-01')
+
+
+class PrefixTrieTestCase(TestCase):
+
+    def test_parse_prefix(self):
+        prefix = parse_prefix('10.1.0.0/16 ge 20 le 24')
+        self.assertEqual((prefix.version, prefix.prefixlen, prefix.ge, prefix.le), (4, 16, 20, 24))
+        self.assertEqual((parse_prefix('10.0.0.0/8 ge 16').le, parse_prefix('10.0.0.0/8 le 16').ge), (32, 8))
+        self.assertEqual(parse_prefix('10.0.0.1/8'), parse_prefix('10.0.0.0/8 eq 8'))
+        for text in ['10.0.0.0/8 le 24', '10.0.0.0/8 ge 16', '10.0.0.0/8 ge 16 le 24', '2001:db8::/32 le 48']:
+            self.assertEqual(str(parse_prefix(text)), text)
+        self.assertEqual(len(parse_prefix_list('10.0.0.0/8,\r\n2001:db8::/32 le 48,\r\n')), 2)
+        with self.assertRaises(ValueError):
+            parse_prefix('10.0.0.0/24 le 16')
+
+    def test_queries(self):
+        entries = ['10.0.0.0/8 le 24', '10.1.0.0/16', '10.1.0.0/16', '10.1.2.0/24', '10.2.0.0/16 ge 28', '192.168.0.0/16', '2001:db8::/32 le 48']
+        trie = PrefixTrie()
+        for i, text in enumerate(entries):
+            trie.add(parse_prefix(text), i)
+        self.assertEqual(len(trie), len(entries))
+
+        def values(results):
+            return sorted(value for _, value in results)
+
+        self.assertEqual(values(trie.duplicates(parse_prefix('10.1.0.0/16'))), [1, 2])
+        self.assertEqual(values(trie.covering(parse_prefix('10.1.2.0/24'))), [0, 3])
+        self.assertEqual(values(trie.covering(parse_prefix('10.1.2.0/24 le 28'))), [])
+        self.assertEqual(values(trie.covered(parse_prefix('10.0.0.0/8 le 24'))), [0, 1, 2, 3])
+        # 10.2.0.0/16 ge 28 only matches routes longer than the entries of 10.0.0.0/8 le 24.
+        self.assertEqual(values(trie.overlapping(parse_prefix('10.2.0.0/16 le 32'))), [0, 4])
+        self.assertEqual(values(trie.overlapping(parse_prefix('10.2.3.0/24'))), [0])
+        self.assertEqual(values(trie.intersecting(parse_prefix('10.2.3.4/32'))), [0, 4])
+        self.assertEqual(values(trie.overlapping(parse_prefix('2001:db8:1::/48'))), [6])
+        self.assertEqual(values(trie.overlapping(parse_prefix('172.16.0.0/12 le 32'))), [])
+
+    def test_aggregate(self):
+        prefixes = parse_prefix_list(
+            '10.0.0.0/24, 10.0.1.0/24, 10.0.2.0/24, 10.0.3.0/24 le 25, 10.0.4.0/24, 10.0.5.0/24,'
+            '192.168.0.0/16 le 24, 192.168.1.0/24, 192.168.1.0/24 le 24, 2001:db8::/33, 2001:db8:8000::/33'
+        )
+        self.assertEqual([str(prefix) for prefix in aggregate(prefixes)], [
+            '10.0.0.0/23 ge 24 le 24',
+            '10.0.2.0/24',
+            '10.0.3.0/24 le 25',
+            '10.0.4.0/23 ge 24 le 24',
+            '192.168.0.0/16 le 24',
+            '2001:db8::/32 ge 33 le 33',
+        ])
+        self.assertEqual(aggregate([]), [])
+
@@ -0,0 +1,92 @@
+"""
+Version counters shared by every worker process.
+
+The values cached per process, in the `default` cache or in memory, are keyed by a version
+kept in the `shared` cache, which every worker reads, e.g. the database cache. Bumping a
+version there invalidates the values of every process at once, while a lookup only costs
+the read of the versions.
+
+During a request, or in `with snapshot():` e.g. in a command, a version is read once and kept
+until the end of the scope, so a loop over dates or rows reads the shared cache once. A version
+bumped in the scope is seen at once by the scope; the bumps of the other processes are seen by
+the next scope.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+SHARED_CACHE_ALIAS = 'shared'
+
+_local = threading.local()
+
+
+def get_cache():
+    return caches[SHARED_CACHE_ALIAS if SHARED_CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def get_snapshot():
+    """
+    Return the versions read in the current scope, or None out of any scope.
+    """
+    return getattr(_local, 'snapshot', None)
+
+
+def start_snapshot():
+    _local.snapshot = {}
+
+
+def end_snapshot():
+    _local.snapshot = None
+
+
+@contextmanager
+def snapshot():
+    """
+    Read each version at most once in the block.
+    """
+    if get_snapshot() is not None:
+        # Nested, the outer scope keeps them.
+        yield
+        return
+    start_snapshot()
+    try:
+        yield
+    finally:
+        end_snapshot()
+
+
+def get_versions(*keys):
+    """
+    Return the versions of `keys`, with at most one read of the shared cache.
+    """
+    snapshot = get_snapshot()
+    versions = {key: snapshot[key] for key in keys if key in snapshot} if snapshot else {}
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        cache = get_cache()
+        versions.update(cache.get_many(missing))
+        for key in missing:
+            if key not in versions:
+                cache.add(key, 1, timeout=None)
+                versions[key] = cache.get(key, 1)
+        if snapshot is not None:
+            snapshot.update((key, versions[key]) for key in missing)
+    return [versions[key] for key in keys]
+
+
+def get_version(key):
+    return get_versions(key)[0]
+
+
+def bump_version(key):
+    cache = get_cache()
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = 2
+        cache.set(key, version, timeout=None)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        snapshot[key] = version
@@ -106,6 +106,9 @@ if DEBUG:
     ]
 
 MIDDLEWARE = [
+    # Outermost, so the logs written at the end of a request are not counted in its query budget.
+    "log.middleware.LogWriterMiddleware",
+    "core.middleware.QueryProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # To enables language selection based on data from the request. Reference:
@@ -121,6 +124,8 @@ MIDDLEWARE = [
 
 if USE_WHITENOISE:
     MIDDLEWARE = [
+        "log.middleware.LogWriterMiddleware",
+        "core.middleware.QueryProfilingMiddleware",
         "django.middleware.security.SecurityMiddleware",
         # This allows us to handle static files with DEBUG = False and runserver
         "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -198,6 +203,24 @@ DB_CONFIGS["MSSQL"] = {
 
 DATABASES = DB_CONFIGS[DATABASES_TYPE]
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Used to keep per-user data like the visibility scopes (accounts/visibility.py) in each
+# process. They are keyed by versions kept in the "shared" cache, which must be shared by
+# every worker process (the database here, or e.g. Redis) so that an invalidation is seen
+# by all of them, see core/versions.py. Its table is created by `migrate`.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ctdb",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "ctdb_cache",
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -259,6 +282,8 @@ STATIC_ROOT = BASE_DIR / "static"
 STATIC_URL = "/static/"
 
 MEDIA_ROOT = BASE_DIR / "media"
+# The uploads modified within these seconds are never removed, see core/storage.py.
+MEDIA_GC_GRACE_SECONDS = 3600
 
 MEDIA_URL = "/media/"
 
@@ -294,6 +319,24 @@ else:
     SERVER_EMAIL = "TDB <TDB@mail.chief-tech.net>"
     I01_FROM_MAIL = "i01@chief.com.tw"
 
+# Mail dispatch
+# See core/mail.py. Every worker keeps one SMTP connection open and sends in batches.
+MAIL_BATCH_SIZE = 50
+MAIL_THROTTLE_SECONDS = 0
+MAIL_CONNECTION_MAX_IDLE = 60
+MAIL_CONNECTION_MAX_MESSAGES = 500
+
+# Mail outbox
+# See core/outbox.py. The views enqueue the mails and `manage.py deliver_outbox --loop` sends them.
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF_SECONDS = 60
+OUTBOX_LOCK_TIMEOUT_SECONDS = 600
+# The threads sending a batch of the outbox, each over its own SMTP connection.
+OUTBOX_WORKERS = 4
+# The encoded attachments kept for reuse by the mails, and the files memory-mapped when encoded.
+MAIL_ATTACHMENT_CACHE_BYTES = 64 * 1024 * 1024
+MAIL_ATTACHMENT_MMAP_BYTES = 1024 * 1024
+
 
 # Authentication things
 AUTHENTICATION_BACKENDS = ["accounts.backends.AuthWithUsernameOrEmailBackend"]
@@ -348,6 +391,35 @@ LOGGING = {
 }
 
 
+# Query profiling
+# See core/middleware.py. The budgets are the maximum numbers of queries of the views,
+# checked by `core.profiling.QueryBudgetTestMixin` and logged as warnings when exceeded.
+# Every view here is checked on the data of `seedperfdata` by core/tests.py.
+
+QUERY_PROFILING = True
+QUERY_PROFILING_PANEL = DEBUG
+QUERY_BUDGETS = {
+    "diary:diary_list": 13,
+    "log:diary_log_list": 10,
+    "reminder:reminder_list": 10,
+    "news:news_list": 10,
+    "news:dep_news_list": 11,
+    "comment:comment_list": 10,
+    "comment:comment_message_list": 10,
+    "archive:archive_list": 10,
+    "archive:journals_list": 10,
+    "archive:announce_list": 10,
+    "tool:tool_list": 10,
+    "terms:terms_list": 10,
+    "telecom:isp_list": 10,
+    "telecom:ispgroup_list": 10,
+    "telecom:prefixlistupdatetask_list": 12,
+    "telecom:archive_list": 10,
+    "dep_calendar:calendar_events_json": 6,
+    "ext_calendar:calendar_events_json": 6,
+}
+
+
 # Django Rest Framework
 # https://www.django-rest-framework.org/
 
@@ -366,3 +438,27 @@ CORS_ALLOWED_ORIGINS = ["http://localhost:8080"]
 # New in Django 3.2.
 # https://docs.djangoproject.com/en/3.2/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+
+# Audit log
+# See log/writer.py. `LogWriterMiddleware` writes the logs of a request with one `bulk_create`
+# before its response is returned, or hands them to a background thread if `LOG_WRITER_BACKGROUND`.
+LOG_WRITER_BACKGROUND = False
+LOG_WRITER_QUEUE_SIZE = 1000
+LOG_WRITER_BATCH_SIZE = 500
+# The `archivelogs` command moves the logs older than N days into date-partitioned,
+# compressed JSONL files under this directory. See log/archive.py.
+LOG_ARCHIVE_ROOT = BASE_DIR / "logging" / "archive"
+LOG_ARCHIVE_AFTER_DAYS = 180
+
+# Diary
+# The `senddiaryuseremail` command may only notify the missing diaries of the last N days,
+# so that its cost does not grow with the years of history. 0, the default, for no limit,
+# i.e. every missing diary since the diary starting date of the user.
+
+DIARY_MISSING_LOOKBACK_DAYS = 0
+
+# The full-text search of diaries, see diary/search.py. "auto" picks FTS5 on SQLite,
+# the full-text index on MSSQL once `rebuilddiarysearch` has created it, else "table".
+DIARY_SEARCH_BACKEND = "auto"
+# The results shown when the diaries are sorted by relevance.
+DIARY_SEARCH_MAX_RESULTS = 100
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DayConfig(AppConfig):
     name = 'day'
+
+    def ready(self):
+        import day.signals  # noqa
@@ -0,0 +1,162 @@
+"""
+A business-day calendar built on `Day`.
+
+The weekdays are workdays and the weekends are not, unless a `Day` says otherwise.
+Every year is kept as a boolean NumPy array with its prefix sums, so `is_workday` and
+`count_workdays` are O(1) per year and `add_workdays` is O(log n). The calendar is
+loaded once per process and rebuilt when a `Day` is saved or deleted, as seen by the
+version shared by the processes (core/versions.py).
+"""
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+from core import versions
+
+from .models import Day
+
+VERSION_CACHE_KEY = 'day:calendar:version'
+
+_lock = threading.Lock()
+_calendar = None
+
+
+class BusinessCalendar:
+
+    def __init__(self, overrides, version=None):
+        """
+        `overrides` is a dict with `date` as key and `is_holiday` as value.
+        """
+        self.overrides = defaultdict(list)
+        for day, is_holiday in overrides.items():
+            self.overrides[day.year].append((day, is_holiday))
+        self.version = version
+        self.years = {}
+
+    def get_year(self, year):
+        """
+        Return (`is_workday`, `cumsum`) of `year`, where `cumsum[i]` is the number of
+        workdays before the i-th day of the year.
+        """
+        if year not in self.years:
+            start = date(year, 1, 1)
+            dates = np.arange(start, date(year + 1, 1, 1), dtype='datetime64[D]')
+            is_workday = np.is_busday(dates)
+            for day, is_holiday in self.overrides.get(year, ()):
+                is_workday[(day - start).days] = not is_holiday
+            cumsum = np.concatenate(([0], np.cumsum(is_workday, dtype=np.int32)))
+            self.years[year] = (is_workday, cumsum)
+        return self.years[year]
+
+    def count_before(self, d):
+        """
+        Return the number of workdays of the year of `d` before `d`.
+        """
+        _, cumsum = self.get_year(d.year)
+        return int(cumsum[d.timetuple().tm_yday - 1])
+
+    def is_workday(self, d):
+        is_workday, _ = self.get_year(d.year)
+        return bool(is_workday[d.timetuple().tm_yday - 1])
+
+    def count_workdays(self, start, end):
+        """
+        Return the number of workdays from `start` to `end` (excluded).
+        """
+        if start >= end:
+            return 0
+        count = self.count_before(end) - self.count_before(start)
+        for year in range(start.year, end.year):
+            count += int(self.get_year(year)[1][-1])
+        return count
+
+    def workdays_between(self, start, end):
+        """
+        Return a sorted `datetime64[D]` array of the workdays from `start` to `end` (excluded).
+        """
+        if start >= end:
+            return np.array([], dtype='datetime64[D]')
+        chunks = []
+        for year in range(start.year, end.year + 1):
+            is_workday, _ = self.get_year(year)
+            dates = np.arange(date(year, 1, 1), date(year + 1, 1, 1), dtype='datetime64[D]')[is_workday]
+            chunks.append(dates)
+        dates = np.concatenate(chunks)
+        return dates[(dates >= np.datetime64(start, 'D')) & (dates < np.datetime64(end, 'D'))]
+
+    def next_workday(self, d, include=False):
+        """
+        Return the first workday after `d`, or from `d` if `include`.
+        """
+        d = d if include else d + timedelta(days=1)
+        for year in range(d.year, d.year + 10):
+            is_workday, _ = self.get_year(year)
+            offset = d.timetuple().tm_yday - 1 if year == d.year else 0
+            index = np.argmax(is_workday[offset:])
+            if is_workday[offset + index]:
+                return date(year, 1, 1) + timedelta(days=int(offset + index))
+        raise ValueError(f'No workday in the 10 years after {d}.')
+
+    def add_workdays(self, d, n):
+        """
+        Return the `n`-th workday after `d`, e.g. `add_workdays(friday, 1)` is the next Monday.
+        """
+        if n <= 0:
+            return d
+        year = d.year
+        _, cumsum = self.get_year(year)
+        # The count of workdays up to the result, since the start of the year.
+        n += int(cumsum[d.timetuple().tm_yday])
+        while n > cumsum[-1]:
+            n -= int(cumsum[-1])
+            year += 1
+            _, cumsum = self.get_year(year)
+        index = int(np.searchsorted(cumsum, n)) - 1
+        return date(year, 1, 1) + timedelta(days=index)
+
+
+def invalidate():
+    """
+    Rebuild the calendar of every process on the next use.
+    """
+    global _calendar
+    versions.bump_version(VERSION_CACHE_KEY)
+    _calendar = None
+
+
+def get_calendar():
+    """
+    Return the `BusinessCalendar` of this process, loading it if `Day` changed.
+    """
+    global _calendar
+    version = versions.get_version(VERSION_CACHE_KEY)
+    calendar = _calendar
+    if calendar is not None and calendar.version == version:
+        return calendar
+    with _lock:
+        if _calendar is None or _calendar.version != version:
+            overrides = dict(Day.objects.filter(date__isnull=False).values_list('date', 'is_holiday'))
+            _calendar = BusinessCalendar(overrides, version=version)
+        return _calendar
+
+
+def is_workday(d):
+    return get_calendar().is_workday(d)
+
+
+def count_workdays(start, end):
+    return get_calendar().count_workdays(start, end)
+
+
+def workdays_between(start, end):
+    return get_calendar().workdays_between(start, end)
+
+
+def next_workday(d, include=False):
+    return get_calendar().next_workday(d, include=include)
+
+
+def add_workdays(d, n):
+    return get_calendar().add_workdays(d, n)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import calendar
+from .models import Day
+
+
+@receiver(post_save, sender=Day, dispatch_uid='invalidate_calendar_on_save')
+@receiver(post_delete, sender=Day, dispatch_uid='invalidate_calendar_on_delete')
+def invalidate_calendar(sender, instance, **kwargs):
+    calendar.invalidate()
@@ -0,0 +1,53 @@
+import datetime
+
+import numpy as np
+from django.test import TestCase
+
+from . import calendar
+from .models import Day
+
+
+class BusinessCalendarTestCase(TestCase):
+
+    def setUp(self):
+        calendar.invalidate()
+        # 2024-01-01 is a Monday.
+        Day.objects.create(date=datetime.date(2024, 1, 2), is_holiday=True)
+        Day.objects.create(date=datetime.date(2024, 1, 6), is_holiday=False)
+        Day.objects.create(date=datetime.date(2024, 12, 31), is_holiday=True)
+
+    def test_is_workday(self):
+        self.assertTrue(calendar.is_workday(datetime.date(2024, 1, 1)))
+        self.assertFalse(calendar.is_workday(datetime.date(2024, 1, 2)))
+        self.assertTrue(calendar.is_workday(datetime.date(2024, 1, 6)))
+        self.assertFalse(calendar.is_workday(datetime.date(2024, 1, 7)))
+
+    def test_count_and_list_workdays(self):
+        start, end = datetime.date(2023, 12, 25), datetime.date(2025, 1, 10)
+        expected = [
+            start + datetime.timedelta(days=n) for n in range((end - start).days)
+            if calendar.is_workday(start + datetime.timedelta(days=n))
+        ]
+        self.assertEqual(calendar.count_workdays(start, end), len(expected))
+        self.assertEqual(calendar.workdays_between(start, end).astype(object).tolist(), expected)
+        self.assertEqual(calendar.count_workdays(datetime.date(2024, 1, 1), datetime.date(2024, 1, 8)), 5)
+
+    def test_next_and_add_workdays(self):
+        self.assertEqual(calendar.next_workday(datetime.date(2024, 1, 1)), datetime.date(2024, 1, 3))
+        self.assertEqual(calendar.next_workday(datetime.date(2024, 1, 1), include=True), datetime.date(2024, 1, 1))
+        self.assertEqual(calendar.next_workday(datetime.date(2024, 12, 30)), datetime.date(2025, 1, 1))
+        self.assertEqual(calendar.add_workdays(datetime.date(2024, 1, 1), 1), datetime.date(2024, 1, 3))
+        self.assertEqual(calendar.add_workdays(datetime.date(2024, 1, 5), 2), datetime.date(2024, 1, 8))
+        self.assertEqual(calendar.add_workdays(datetime.date(2024, 12, 27), 2), datetime.date(2025, 1, 1))
+
+    def test_cached_and_invalidated(self):
+        calendar.is_workday(datetime.date(2024, 1, 1))
+        # Only the read of the version shared by the workers.
+        with self.assertNumQueries(1):
+            calendar.is_workday(datetime.date(2024, 3, 1))
+        Day.objects.create(date=datetime.date(2024, 3, 1), is_holiday=True)
+        self.assertFalse(calendar.is_workday(datetime.date(2024, 3, 1)))
+        Day.objects.filter(date=datetime.date(2024, 3, 1)).delete()
+        Day.objects.get(date=datetime.date(2024, 1, 2)).delete()
+        self.assertTrue(calendar.is_workday(datetime.date(2024, 1, 2)))
+        self.assertIsInstance(calendar.workdays_between(datetime.date(2024, 1, 1), datetime.date(2024, 1, 1)), np.ndarray)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from diary import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Create and rebuild the full-text search index of the diaries. An empty index is built by `migrate`; '
+        'run it after `bulk_create` of diaries, after renaming users, or once to create the mssql index. '
+        'See diary/search.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=sorted(search.BACKENDS), help='DIARY_SEARCH_BACKEND by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend(options['backend'])
+        count = search.rebuild(backend=backend.name, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} diaries indexed by the {backend.name} backend.'))
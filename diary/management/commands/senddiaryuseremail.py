@@ -1,14 +1,17 @@
 import logging
+from collections import defaultdict
 
+import numpy as np
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from django.template import loader
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from accounts.models import GroupProfile
 from core.mail import send_mail
-from core.utils import date_range, today
-from day.models import Day
+from core.utils import today
+from day import calendar
 from diary.models import Diary
 
 # Get an instance of a logger
@@ -21,8 +24,6 @@ User = get_user_model()
 class Command(BaseCommand):
     help = 'Commands of notifying users of the diary app.'
 
-    HOLIDAYS = [day.date for day in Day.objects.all() if day.is_holiday]
-    EXTRA_WORKDAY = [day.date for day in Day.objects.all() if not day.is_holiday]
     THRESHOLD_LIST = [3, 7, 30]
     SUBJECT_TEMPLATE_NAME = 'diary/mails/diary_missing_notification_subject.txt'
     BODY_TEMPLATE_NAME = 'diary/mails/diary_missing_notification_body.html'
@@ -37,55 +38,71 @@ class Command(BaseCommand):
                 'Defalut to `settings.DEBUG`'
             ),
         )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Run the command even if it is not 09:00.',
+        )
+        parser.add_argument(
+            '--lookback-days',
+            type=int,
+            default=getattr(settings, 'DIARY_MISSING_LOOKBACK_DAYS', 0),
+            help=(
+                'Only the missing diaries of the last N days are notified, 0 for no limit as before. '
+                'Default to `settings.DIARY_MISSING_LOOKBACK_DAYS`, which is 0.'
+            ),
+        )
 
     def get_diary_users(self):
         """
         Get all user who need to write diary.
         """
-        return User.objects.filter(profile__keep_diary=True)
+        return User.objects.filter(profile__keep_diary=True).select_related('profile')
 
-    def get_diary_needed(self, users):
+    def get_window(self, users, lookback_days):
         """
-        Generate a dict with (`user.id`, `date`) as key and boolean value as value.
-        This is for recording what kind of diary we need.
+        Return the (`start_date`, `end_date`) of the diaries to check. `end_date` (today) is excluded.
         """
-        needed = {}
-        for user in users:
-            start_date = user.profile.diary_starting_date
-            end_date = today()
-            dates = date_range(start_date, end_date)
-            weekday_dates = [date for date in dates if date.isoweekday() <= 5]
-            workday_dates = [date for date in weekday_dates if date not in self.HOLIDAYS]
-            needed_dates = set(workday_dates) | set(self.EXTRA_WORKDAY)
-            sorted_needed_dates = sorted(list(needed_dates))
-            for date in sorted_needed_dates:
-                needed.update({(user.id, date): False})
-        return needed
+        end_date = today()
+        start_date = min((user.profile.diary_starting_date for user in users), default=end_date)
+        if lookback_days:
+            start_date = max(start_date, end_date - timedelta(days=lookback_days))
+        return start_date, end_date
 
-    def get_diary_existing(self):
+    def get_workdays(self, start_date, end_date):
         """
-        Generate a dictionary with (`created_by_id`, `date`) as key and boolean value as value.
-        This is to recording what kind of diary we have.
+        Return a sorted `datetime64[D]` array of the workdays from `start_date` to `end_date` (excluded).
         """
-        diaries = Diary.objects.all()
-        diary_values_list = diaries.values_list('created_by_id', 'date')
-        existing = {(values): True for values in diary_values_list}
-        return existing
+        return calendar.workdays_between(start_date, end_date)
 
-    def get_diary_missing(self, needed, existing):
+    def get_diary_existing(self, users, start_date, end_date):
+        """
+        Generate a dictionary with `created_by_id` as key and a `datetime64[D]` array of
+        the dates of the diaries as value. Only the diaries within the window are fetched.
+        """
+        diaries = Diary.objects.filter(
+            created_by__in=users.values('pk'),
+            date__gte=start_date,
+            date__lt=end_date,
+        )
+        existing = defaultdict(list)
+        for created_by_id, date in diaries.values_list('created_by_id', 'date').iterator():
+            existing[created_by_id].append(date)
+        return {user_id: np.array(dates, dtype='datetime64[D]') for user_id, dates in existing.items()}
+
+    def get_diary_missing(self, users, workdays, existing):
         """
         Generate a dictionary with `user.id` as key and a list of `date` as value.
         This is to recording what kind of diary we are missing.
         """
-        needed.update(existing)
         missing = {}
-        for key, value in needed.items():
-            if value:
-                continue
-            user_id, date = key
-            if user_id not in missing:
-                missing[user_id] = []
-            missing[user_id].append(date)
+        for user in users:
+            starting_date = np.datetime64(user.profile.diary_starting_date, 'D')
+            needed = workdays[np.searchsorted(workdays, starting_date):]
+            if user.id in existing:
+                needed = needed[~np.isin(needed, existing[user.id])]
+            if needed.size:
+                missing[user.id] = needed.astype(object).tolist()
         return missing
 
     def get_notification_level(self, past_days):
@@ -102,27 +119,45 @@ class Command(BaseCommand):
                 break
         return notification_level
 
+    def load_hierarchy(self):
+        """
+        Load the whole supervisor hierarchy with a few queries, so that `get_cc` needs none.
+        The supervisors of a user are the members of any group supervising one of the user's roles.
+        """
+        role_ids = set(GroupProfile.objects.filter(is_role=True).values_list('group_id', flat=True))
+        self.user_roles = defaultdict(set)
+        self.group_members = defaultdict(set)
+        for user_id, group_id in User.groups.through.objects.values_list('user_id', 'group_id'):
+            self.group_members[group_id].add(user_id)
+            if group_id in role_ids:
+                self.user_roles[user_id].add(group_id)
+        self.supervising_groups = defaultdict(set)
+        through = GroupProfile.supervise_roles.through
+        for supervisor_group_id, role_id in through.objects.values_list('groupprofile__group_id', 'group_id'):
+            self.supervising_groups[role_id].add(supervisor_group_id)
+        self.emails = dict(User.objects.values_list('id', 'email'))
+
+    def get_supervisor_ids(self, user_ids):
+        supervisor_ids = set()
+        for user_id in user_ids:
+            for role_id in self.user_roles.get(user_id, ()):
+                for group_id in self.supervising_groups.get(role_id, ()):
+                    supervisor_ids |= self.group_members.get(group_id, set())
+        return supervisor_ids
+
     def get_cc(self, user, notification_level):
         """
         Given a `user` and a `notification_level`,
         return a CC, which is nothing more than a list of Email string.
         """
-        cc = []
-        users = [user]
+        cc = set()
+        user_ids = {user.id}
         for _ in range(notification_level):
-            for user in users:
-                supervisors = User.objects.filter(
-                    groups__groupprofile__supervise_roles__in=user.groups.filter(
-                        groupprofile__is_role=True
-                    )
-                ).distinct()
-                for supervisor in supervisors:
-                    cc.append(supervisor.email)
-            users = list(supervisors)
-        cc_distinct = list(set(cc))
-        return cc_distinct
-
-    def get_email_configs(self, missing, test=True):
+            user_ids = self.get_supervisor_ids(user_ids)
+            cc |= {self.emails[user_id] for user_id in user_ids if self.emails.get(user_id)}
+        return sorted(cc)
+
+    def get_email_configs(self, users, missing, test=True):
         """
         Given a dictionary with `user.id` as key and a list of `date` as value, It
         would generate a Email config list like this:
@@ -132,12 +167,10 @@ class Command(BaseCommand):
             ...
         ]
         """
+        users_by_id = {user.id: user for user in users}
         email_configs = []
         for user_id, dates in missing.items():
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                continue
+            user = users_by_id[user_id]
             username = user.username
             datestrings = ', '.join(str(date) for date in dates)
             context = {'username': username, 'dates': dates, 'datestrings': datestrings}
@@ -158,12 +191,15 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         now = datetime.now()
-        if now.hour == 9:
+        if now.hour == 9 or options['force']:
             users = self.get_diary_users()
-            diary_needed = self.get_diary_needed(users=users)
-            diary_existing = self.get_diary_existing()
-            diary_missing = self.get_diary_missing(needed=diary_needed, existing=diary_existing)
-            email_configs = self.get_email_configs(missing=diary_missing)
+            user_list = list(users)
+            start_date, end_date = self.get_window(user_list, lookback_days=options['lookback_days'])
+            workdays = self.get_workdays(start_date, end_date)
+            diary_existing = self.get_diary_existing(users, start_date, end_date)
+            diary_missing = self.get_diary_missing(users=user_list, workdays=workdays, existing=diary_existing)
+            self.load_hierarchy()
+            email_configs = self.get_email_configs(users=user_list, missing=diary_missing)
             for config in email_configs:
                 subject, body, to, cc = config['subject'], config['body'], config['to'], config['cc']
                 if not options['debug']:
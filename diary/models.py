@@ -28,6 +28,7 @@ class Diary(models.Model):
         verbose_name = _('Diary')
         verbose_name_plural = _('Diaries')
         unique_together = (('date', 'created_by'), )
+        indexes = [models.Index(fields=['-date', '-id'])]
 
     def __str__(self):
         return self.daily_record[:8] + '..'
@@ -46,3 +47,21 @@ class Diary(models.Model):
 
     def get_comment_url(self):
         return reverse('diary:diary_comment', kwargs={'pk': self.pk})
+
+    def get_history_url(self):
+        return reverse('log:diary_log_history', kwargs={'pk': self.pk})
+
+
+class DiarySearchTerm(models.Model):
+    """
+    A row of the inverted index of `diary.search.TableBackend`.
+    """
+    diary = models.ForeignKey(verbose_name=_('Diary'), to=Diary, on_delete=models.CASCADE, related_name='search_terms')
+    field = models.CharField(verbose_name=_('Field'), max_length=15)
+    term = models.CharField(verbose_name=_('Term'), max_length=64)
+    count = models.PositiveIntegerField(verbose_name=_('Count'), default=1)
+
+    class Meta:
+        verbose_name = _('Diary search term')
+        verbose_name_plural = _('Diary search terms')
+        indexes = [models.Index(fields=['term', 'field'])]
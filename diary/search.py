@@ -0,0 +1,567 @@
+"""
+Full-text search of `Diary`.
+
+The text of a diary is stripped of the CKEditor HTML and split into terms by `tokenize`:
+the words of letters and digits, and the characters and the bigrams of CJK runs, as CJK
+has no spaces. Every backend indexes the same terms, so all of them find the same diaries:
+
+- `FTS5Backend`: an FTS5 table on SQLite, ranked by bm25.
+- `MSSQLBackend`: a table with a full-text index on MSSQL, ranked by CONTAINSTABLE.
+- `TableBackend`: the `DiarySearchTerm` inverted index, on any database.
+
+The index is kept current by diary.signals and built after `migrate` if it is empty.
+`rebuilddiarysearch` rebuilds it, e.g. after a `bulk_create` or a renamed user.
+
+A query is a list of words, all of which must match; a word matches the terms starting with
+it. `field:word` matches in one field only (see `FIELD_ALIASES`), `from:YYYY-MM-DD` and
+`to:YYYY-MM-DD` limit the dates, and a bare `YYYY-MM-DD` or `YYYY-MM` matches that day or month.
+A word with other characters than letters and digits, e.g. an IP address or `c++`, is matched by
+`icontains` as it was before the index, and so is every word while the index is empty.
+"""
+import calendar
+import datetime
+import html
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+from .models import Diary, DiarySearchTerm
+
+# The indexed fields and their weights in the ranking.
+FIELDS = {
+    'daily_record': 1.0,
+    'todo': 1.0,
+    'remark': 0.5,
+    'comment': 0.5,
+    'created_by': 2.0,
+    'daily_check': 0.1,
+}
+HTML_FIELDS = ['daily_record', 'todo', 'remark', 'comment']
+FIELD_ALIASES = dict(
+    {field: field for field in FIELDS},
+    record='daily_record',
+    user='created_by',
+    check='daily_check',
+)
+
+MAX_TERM_LENGTH = 64
+WORD_RE = re.compile(r'[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+DATE_RE = re.compile(r'(\d{4})[-/](\d{1,2})(?:[-/](\d{1,2}))?')
+
+
+def iter_words(text):
+    for match in WORD_RE.finditer(unicodedata.normalize('NFKC', text).lower()):
+        yield match.group()
+
+
+def has_non_word(text):
+    return bool(WORD_RE.sub('', unicodedata.normalize('NFKC', text).lower()).strip())
+
+
+def is_cjk(word):
+    return not word[0].isascii()
+
+
+def tokenize(text):
+    """
+    Return the terms of `text` to index.
+    """
+    terms = []
+    for word in iter_words(text):
+        if is_cjk(word):
+            terms.extend(word)
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def tokenize_query(text):
+    """
+    Yield the (term, is_prefix) to look up for the query word `text`.
+    """
+    for word in iter_words(text):
+        if not is_cjk(word):
+            yield word[:MAX_TERM_LENGTH], True
+        elif len(word) == 1:
+            yield word, False
+        else:
+            for i in range(len(word) - 1):
+                yield word[i:i + 2], False
+
+
+def strip_html(text):
+    return html.unescape(strip_tags(text or ''))
+
+
+def get_document(diary):
+    """
+    Return {field: text} of `diary`, with `created_by` selected.
+    """
+    document = {field: strip_html(getattr(diary, field)) for field in HTML_FIELDS}
+    document['created_by'] = diary.created_by.username
+    document['daily_check'] = diary.daily_check
+    return document
+
+
+def parse_date(text):
+    """
+    Return the (first, last) day of `YYYY-MM-DD` or `YYYY-MM`, or None.
+    """
+    match = DATE_RE.fullmatch(text)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    try:
+        if day:
+            date = datetime.date(int(year), int(month), int(day))
+            return date, date
+        first = datetime.date(int(year), int(month), 1)
+    except ValueError:
+        return None
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+class Query:
+    """
+    A parsed query: `terms` is a list of (term, is_prefix, fields), with `fields` None for all.
+    `words` is the list of (word, fields) of the query and `phrases` those of them with non-word
+    characters, which have no terms and are matched by `icontains`.
+    """
+
+    def __init__(self, text):
+        self.terms = []
+        self.words = []
+        self.phrases = []
+        self.date_from = None
+        self.date_to = None
+        for part in (text or '').split():
+            key, sep, value = part.partition(':')
+            key = key.lower()
+            if sep and key in ('from', 'to') and parse_date(value):
+                first, last = parse_date(value)
+                if key == 'from':
+                    self.limit_dates(first, None)
+                else:
+                    self.limit_dates(None, last)
+                continue
+            if parse_date(part):
+                self.limit_dates(*parse_date(part))
+                continue
+            fields = None
+            if sep and key in FIELD_ALIASES and value:
+                fields = [FIELD_ALIASES[key]]
+                part = value
+            self.words.append((part, fields))
+            if has_non_word(part):
+                self.phrases.append((part, fields))
+                continue
+            for term, is_prefix in tokenize_query(part):
+                self.terms.append((term, is_prefix, fields))
+
+    def __bool__(self):
+        return bool(self.words) or self.date_from is not None or self.date_to is not None
+
+    def limit_dates(self, date_from, date_to):
+        if date_from and (self.date_from is None or date_from > self.date_from):
+            self.date_from = date_from
+        if date_to and (self.date_to is None or date_to < self.date_to):
+            self.date_to = date_to
+
+
+class BaseBackend:
+
+    def __init__(self):
+        # The names of the databases whose index has diaries.
+        self.indexed = set()
+
+    def ensure(self):
+        """
+        Create the index if it does not exist.
+        """
+
+    def index(self, diaries, fresh=False):
+        """
+        Index `diaries`, with `created_by` selected. If `fresh`, they are known not to be indexed.
+        """
+        raise NotImplementedError
+
+    def remove(self, diary_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def is_empty(self):
+        raise NotImplementedError
+
+    def is_indexed(self):
+        """
+        Return whether the index has any diary. Once it has, it is assumed to keep them.
+        """
+        name = connection.settings_dict['NAME']
+        if name not in self.indexed:
+            if self.is_empty():
+                return False
+            self.indexed.add(name)
+        return True
+
+    def filter(self, queryset, terms):
+        """
+        Filter `queryset` by the diaries matching all `terms`.
+        """
+        raise NotImplementedError
+
+    def rank(self, queryset, terms, limit):
+        """
+        Return the ids of the best `limit` diaries of `queryset`, which all match `terms`.
+        """
+        raise NotImplementedError
+
+
+class TableBackend(BaseBackend):
+    """
+    The inverted index in `DiarySearchTerm`, one row per (diary, field, term).
+    The score of a diary is the sum of count * field weight * idf of its matching terms.
+    """
+    name = 'table'
+
+    def index(self, diaries, fresh=False):
+        diaries = list(diaries)
+        if not fresh:
+            self.remove([diary.pk for diary in diaries])
+        objs = []
+        for diary in diaries:
+            for field, text in get_document(diary).items():
+                for term, count in Counter(tokenize(text)).items():
+                    objs.append(DiarySearchTerm(diary_id=diary.pk, field=field, term=term, count=count))
+        DiarySearchTerm.objects.bulk_create(objs, batch_size=1000)
+
+    def remove(self, diary_ids):
+        DiarySearchTerm.objects.filter(diary_id__in=diary_ids).delete()
+
+    def clear(self):
+        DiarySearchTerm.objects.all().delete()
+
+    def is_empty(self):
+        return not DiarySearchTerm.objects.exists()
+
+    def get_condition(self, term, is_prefix, fields):
+        q = Q(term__startswith=term) if is_prefix else Q(term=term)
+        if fields:
+            q &= Q(field__in=fields)
+        return q
+
+    def filter(self, queryset, terms):
+        for term in terms:
+            matched = DiarySearchTerm.objects.filter(self.get_condition(*term))
+            queryset = queryset.filter(id__in=matched.values('diary_id'))
+        return queryset
+
+    def rank(self, queryset, terms, limit):
+        total = Diary.objects.count()
+        whens = []
+        for term in terms:
+            condition = self.get_condition(*term)
+            matched = DiarySearchTerm.objects.filter(condition).values('diary_id').distinct().count()
+            idf = math.log(1 + total / (1 + matched))
+            whens.extend(When(condition & Q(field=field), then=Value(weight * idf)) for field, weight in FIELDS.items())
+        score = Sum(F('count') * Case(*whens, default=Value(0.0), output_field=FloatField()), output_field=FloatField())
+        rows = (
+            DiarySearchTerm.objects
+            .filter(diary_id__in=self.filter(queryset, terms).order_by().values('id'))
+            .values('diary_id')
+            .annotate(score=score)
+            .order_by('-score', '-diary_id')
+            .values_list('diary_id', flat=True)
+        )
+        return list(rows[:limit])
+
+
+def quote(term):
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+class FTS5Backend(BaseBackend):
+    """
+    An FTS5 table of the terms of every field, joined by spaces, with the diary id as rowid.
+    """
+    name = 'fts5'
+    table = 'diary_diary_fts'
+
+    def __init__(self):
+        super().__init__()
+        self.ready = set()
+
+    @classmethod
+    def is_available(cls):
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def ensure(self):
+        name = connection.settings_dict['NAME']
+        if name in self.ready:
+            return
+        with connection.cursor() as cursor:
+            columns = ', '.join(FIELDS)
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({columns}, prefix='2 3')")
+        self.ready.add(name)
+
+    def index(self, diaries, fresh=False):
+        self.ensure()
+        diaries = list(diaries)
+        if not fresh:
+            self.remove([diary.pk for diary in diaries])
+        rows = []
+        for diary in diaries:
+            document = get_document(diary)
+            rows.append([diary.pk] + [' '.join(tokenize(document[field])) for field in FIELDS])
+        placeholders = ', '.join(['%s'] * (len(FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, {", ".join(FIELDS)}) VALUES ({placeholders})', rows)
+
+    def remove(self, diary_ids):
+        self.ensure()
+        diary_ids = list(diary_ids)
+        with connection.cursor() as cursor:
+            for i in range(0, len(diary_ids), 500):
+                chunk = diary_ids[i:i + 500]
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+    def clear(self):
+        self.ensure()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def is_empty(self):
+        self.ensure()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {self.table} LIMIT 1')
+            return cursor.fetchone() is None
+
+    def get_expression(self, terms, operator='AND'):
+        expressions = []
+        for term, is_prefix, fields in terms:
+            expression = quote(term) + ('*' if is_prefix else '')
+            if fields:
+                expression = f'{{{" ".join(fields)}}} : {expression}'
+            expressions.append(expression)
+        return f' {operator} '.join(expressions)
+
+    def filter(self, queryset, terms):
+        self.ensure()
+        sql = f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s'
+        return queryset.filter(id__in=RawSQL(sql, [self.get_expression(terms)]))
+
+    def rank(self, queryset, terms, limit):
+        self.ensure()
+        candidates, params = self.filter(queryset, terms).order_by().values('id').query.sql_with_params()
+        weights = ', '.join(str(weight) for weight in FIELDS.values())
+        sql = (
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s AND rowid IN ({candidates}) '
+            f'ORDER BY bm25({self.table}, {weights}), rowid DESC LIMIT %s'
+        )
+        # The match of any term ranks the candidates, which already match all of them.
+        any_terms = [(term, is_prefix, None) for term, is_prefix, fields in terms]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.get_expression(any_terms, 'OR'), *params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class MSSQLBackend(BaseBackend):
+    """
+    A table of the terms of every field, joined by spaces, with a full-text index of the
+    neutral word breaker and no stoplist, so it finds exactly the terms of `tokenize`.
+
+    `CREATE FULLTEXT INDEX` can not run in a transaction, so the index is created by
+    `rebuilddiarysearch --backend mssql` and not on the fly.
+    """
+    name = 'mssql'
+    table = 'diary_diary_search'
+    catalog = 'diary_search_catalog'
+
+    @classmethod
+    def is_available(cls):
+        if connection.vendor != 'microsoft':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)', [cls.table])
+            return cursor.fetchone() is not None
+
+    def ensure(self):
+        columns = ', '.join(f'{field} nvarchar(max) NOT NULL' for field in FIELDS)
+        fulltext_columns = ', '.join(f'{field} LANGUAGE 0' for field in FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"IF OBJECT_ID(N'{self.table}', N'U') IS NULL "
+                f'CREATE TABLE {self.table} (diary_id int NOT NULL CONSTRAINT {self.table}_pk PRIMARY KEY, {columns})'
+            )
+            cursor.execute(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = N'{self.catalog}') "
+                f'CREATE FULLTEXT CATALOG {self.catalog}'
+            )
+            cursor.execute(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(N'{self.table}')) "
+                f'CREATE FULLTEXT INDEX ON {self.table} ({fulltext_columns}) KEY INDEX {self.table}_pk '
+                f'ON {self.catalog} WITH CHANGE_TRACKING AUTO, STOPLIST = OFF'
+            )
+
+    def index(self, diaries, fresh=False):
+        diaries = list(diaries)
+        if not fresh:
+            self.remove([diary.pk for diary in diaries])
+        rows = []
+        for diary in diaries:
+            document = get_document(diary)
+            rows.append([diary.pk] + [' '.join(tokenize(document[field])) for field in FIELDS])
+        placeholders = ', '.join(['%s'] * (len(FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self.table} (diary_id, {", ".join(FIELDS)}) VALUES ({placeholders})', rows)
+
+    def remove(self, diary_ids):
+        diary_ids = list(diary_ids)
+        with connection.cursor() as cursor:
+            # MSSQL takes at most ~2100 parameters in a query.
+            for i in range(0, len(diary_ids), 2000):
+                chunk = diary_ids[i:i + 2000]
+                cursor.execute(f'DELETE FROM {self.table} WHERE diary_id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE TABLE {self.table}')
+
+    def is_empty(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT TOP 1 1 FROM {self.table}')
+            return cursor.fetchone() is None
+
+    def get_expression(self, terms, operator='AND'):
+        return f' {operator} '.join(quote(term + ('*' if is_prefix else '')) for term, is_prefix, fields in terms)
+
+    def filter(self, queryset, terms):
+        # CONTAINSTABLE searches a single column list, so the terms are grouped by their fields.
+        groups = {}
+        for term in terms:
+            groups.setdefault(tuple(term[2] or ()), []).append(term)
+        for fields, group in groups.items():
+            columns = f'({", ".join(fields)})' if fields else '*'
+            sql = f'SELECT [KEY] FROM CONTAINSTABLE({self.table}, {columns}, %s)'
+            queryset = queryset.filter(id__in=RawSQL(sql, [self.get_expression(group)]))
+        return queryset
+
+    def rank(self, queryset, terms, limit):
+        candidates, params = self.filter(queryset, terms).order_by().values('id').query.sql_with_params()
+        weights = ', '.join(str(weight) for weight in FIELDS.values())
+        sql = (
+            f'SELECT TOP (%s) ft.[KEY] FROM CONTAINSTABLE({self.table}, *, %s) AS ft '
+            f'WHERE ft.[KEY] IN ({candidates}) ORDER BY ft.RANK DESC, ft.[KEY] DESC'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [limit, self.get_expression(terms, 'OR'), *params])
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {backend.name: backend for backend in (FTS5Backend, MSSQLBackend, TableBackend)}
+# {(vendor, database name): backend name} of "auto", and {backend name: backend}.
+_detected = {}
+_backends = {}
+
+
+def get_backend(name=None):
+    """
+    Return the backend `name`, `DIARY_SEARCH_BACKEND` by default.
+    """
+    name = name or getattr(settings, 'DIARY_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        key = (connection.vendor, connection.settings_dict['NAME'])
+        if key not in _detected:
+            for backend_class in (FTS5Backend, MSSQLBackend):
+                if backend_class.is_available():
+                    _detected[key] = backend_class.name
+                    break
+            else:
+                _detected[key] = TableBackend.name
+        name = _detected[key]
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def filter_dates(queryset, query):
+    if query.date_from:
+        queryset = queryset.filter(date__gte=query.date_from)
+    if query.date_to:
+        queryset = queryset.filter(date__lte=query.date_to)
+    return queryset
+
+
+def filter_contains(queryset, words):
+    """
+    Filter `queryset` by the diaries containing every (word, fields) of `words`.
+    """
+    for word, fields in words:
+        q = Q()
+        for field in fields or FIELDS:
+            q |= Q(**{f'{"created_by__username" if field == "created_by" else field}__icontains': word})
+        queryset = queryset.filter(q)
+    return queryset
+
+
+def filter_queryset(queryset, text, backend=None):
+    """
+    Filter `queryset` by the query `text`, keeping its ordering.
+    """
+    query = text if isinstance(text, Query) else Query(text)
+    queryset = filter_dates(queryset, query)
+    if not query.terms:
+        return filter_contains(queryset, query.phrases)
+    backend = get_backend(backend)
+    if not backend.is_indexed():
+        return filter_contains(queryset, query.words)
+    return filter_contains(backend.filter(queryset, query.terms), query.phrases)
+
+
+def search(queryset, text, limit=None, backend=None):
+    """
+    Return the diaries of `queryset` matching the query `text`, the most relevant first.
+    Without terms, e.g. only dates, or while the index is empty, they are in the order of `queryset`.
+    """
+    limit = limit or getattr(settings, 'DIARY_SEARCH_MAX_RESULTS', 100)
+    query = Query(text)
+    backend = get_backend(backend)
+    if not query.terms or not backend.is_indexed():
+        return list(filter_queryset(queryset, query, backend.name)[:limit])
+    ranked = backend.rank(filter_contains(filter_dates(queryset, query), query.phrases), query.terms, limit)
+    diaries = queryset.in_bulk(ranked)
+    return [diaries[diary_id] for diary_id in ranked if diary_id in diaries]
+
+
+def rebuild(backend=None, batch_size=1000):
+    """
+    Rebuild the index of every diary. Return the number of the indexed diaries.
+    """
+    backend = get_backend(backend)
+    backend.ensure()
+    backend.clear()
+    count = 0
+    batch = []
+    for diary in Diary.objects.select_related('created_by').order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(diary)
+        if len(batch) >= batch_size:
+            backend.index(batch, fresh=True)
+            count += len(batch)
+            batch = []
+    if batch:
+        backend.index(batch, fresh=True)
+        count += len(batch)
+    return count
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import Diary
+
+
+@receiver(post_save, sender=Diary, dispatch_uid='diary_search_index')
+def index_diary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Diary, dispatch_uid='diary_search_remove')
+def remove_diary(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(post_migrate, dispatch_uid='diary_search_create_index')
+def create_search_index(sender, **kwargs):
+    # The FTS5 table is created out of any request, as a rolled back `CREATE VIRTUAL TABLE` breaks it.
+    if sender.name != 'diary':
+        return
+    backend = search.get_backend()
+    if isinstance(backend, search.MSSQLBackend):
+        # Created and built by `rebuilddiarysearch --backend mssql`.
+        return
+    backend.ensure()
+    # The diaries older than the index, e.g. on the first `migrate` after deploying it.
+    if backend.is_empty() and Diary.objects.exists():
+        search.rebuild(backend.name)
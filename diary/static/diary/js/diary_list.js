@@ -41,6 +41,9 @@ document.addEventListener("DOMContentLoaded", function() {
         if (selectMembers && selectMembers.value) {
             params["member"] = selectMembers.value;
         }
+        if (searchValue && urlParams.get('sort')) {
+            params["sort"] = urlParams.get('sort');
+        }
 
         const queryString = new URLSearchParams(params).toString();
         const url = queryString ? pathname + "?" + queryString : pathname;
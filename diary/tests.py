@@ -0,0 +1,164 @@
+import datetime
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from day.models import Day
+
+from . import search
+from .management.commands.senddiaryuseremail import Command
+from .models import Diary, DiarySearchTerm
+from .signals import create_search_index
+
+User = get_user_model()
+
+
+class SendDiaryUserEmailTestCase(TestCase):
+
+    def setUp(self):
+        self.user = self.create_user('member', starting_date=datetime.date(2024, 1, 1))
+        self.manager = self.create_user('manager')
+        self.director = self.create_user('director')
+        member_role = self.create_role('member role')
+        manager_role = self.create_role('manager role')
+        director_role = self.create_role('director role')
+        manager_role.groupprofile.supervise_roles.add(member_role)
+        director_role.groupprofile.supervise_roles.add(manager_role)
+        self.user.groups.add(member_role)
+        self.manager.groups.add(manager_role)
+        self.director.groups.add(director_role)
+        # 2024-01-01 is a Monday.
+        Day.objects.create(date=datetime.date(2024, 1, 2), is_holiday=True)
+        Day.objects.create(date=datetime.date(2024, 1, 6), is_holiday=False)
+        Diary.objects.create(date=datetime.date(2024, 1, 1), daily_record='record', created_by=self.user)
+        Diary.objects.create(date=datetime.date(2024, 1, 4), daily_record='record', created_by=self.user)
+
+    def create_user(self, username, starting_date=datetime.date(2030, 1, 1)):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+        user.profile.keep_diary = True
+        user.profile.diary_starting_date = starting_date
+        user.profile.save()
+        return user
+
+    def create_role(self, name):
+        role = Group.objects.create(name=name)
+        role.groupprofile.is_role = True
+        role.groupprofile.save()
+        return role
+
+    def get_missing(self, end_date, lookback_days=0):
+        command = Command()
+        users = command.get_diary_users()
+        with mock.patch('diary.management.commands.senddiaryuseremail.today', return_value=end_date):
+            start_date, end_date = command.get_window(list(users), lookback_days=lookback_days)
+        workdays = command.get_workdays(start_date, end_date)
+        existing = command.get_diary_existing(users, start_date, end_date)
+        return command.get_diary_missing(list(users), workdays, existing)
+
+    def test_missing_dates(self):
+        missing = self.get_missing(end_date=datetime.date(2024, 1, 9))
+        self.assertEqual(missing, {self.user.id: [
+            datetime.date(2024, 1, 3),
+            datetime.date(2024, 1, 5),
+            datetime.date(2024, 1, 6),
+            datetime.date(2024, 1, 8),
+        ]})
+
+    def test_lookback_days(self):
+        missing = self.get_missing(end_date=datetime.date(2024, 1, 9), lookback_days=4)
+        self.assertEqual(missing, {self.user.id: [datetime.date(2024, 1, 5), datetime.date(2024, 1, 6), datetime.date(2024, 1, 8)]})
+
+    def test_cc(self):
+        command = Command()
+        command.load_hierarchy()
+        with self.assertNumQueries(0):
+            self.assertEqual(command.get_cc(self.user, 0), [])
+            self.assertEqual(command.get_cc(self.user, 1), ['manager@example.com'])
+            self.assertEqual(command.get_cc(self.user, 2), ['director@example.com', 'manager@example.com'])
+
+
+class DiarySearchTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.other = User.objects.create_user(username='bob')
+        self.router = Diary.objects.create(
+            date=datetime.date(2024, 1, 2),
+            daily_record='<p>Replaced the <strong>router</strong> of 台北機房</p>',
+            todo='Check the router again',
+            created_by=self.user,
+        )
+        self.switch = Diary.objects.create(
+            date=datetime.date(2024, 2, 3),
+            daily_record='<p>Upgraded a switch &amp; a router</p>',
+            remark='台中',
+            created_by=self.other,
+        )
+
+    def find(self, text, backend):
+        return list(search.filter_queryset(Diary.objects.order_by('date'), text, backend=backend))
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize(search.strip_html('<p>Ｒouter&nbsp;10G 機房</p>')), ['router', '10g', '機', '房', '機房'])
+        self.assertEqual(list(search.tokenize_query('台北機房')), [('台北', False), ('北機', False), ('機房', False)])
+        query = search.Query('todo:Router 2024-01 from:2024-01-02 機')
+        self.assertEqual(query.terms, [('router', True, ['todo']), ('機', False, None)])
+        self.assertEqual((query.date_from, query.date_to), (datetime.date(2024, 1, 2), datetime.date(2024, 1, 31)))
+
+    def test_backends(self):
+        search.rebuild(backend='table')
+        self.assertTrue(DiarySearchTerm.objects.filter(diary=self.router, field='daily_record', term='router').exists())
+        for backend in ['fts5', 'table']:
+            with self.subTest(backend=backend):
+                self.assertEqual(self.find('rout', backend), [self.router, self.switch])
+                self.assertEqual(self.find('ROUTER switch', backend), [self.switch])
+                self.assertEqual(self.find('台北', backend), [self.router])
+                self.assertEqual(self.find('北台', backend), [])
+                self.assertEqual(self.find('todo:router', backend), [self.router])
+                self.assertEqual(self.find('user:bob', backend), [self.switch])
+                self.assertEqual(self.find('strong', backend), [])
+                self.assertEqual(self.find('router 2024-02', backend), [self.switch])
+                # Twice in the record and the todo ranks first.
+                self.assertEqual(search.search(Diary.objects.all(), 'router', backend=backend), [self.router, self.switch])
+                self.assertEqual(search.search(Diary.objects.filter(created_by=self.other), 'router', backend=backend), [self.switch])
+
+    def test_contains_fallback(self):
+        self.router.todo = 'Ping 10.0.0.1 and c++'
+        self.router.save()
+        for backend in ['fts5', 'table']:
+            with self.subTest(backend=backend):
+                search.rebuild(backend=backend)
+                self.assertEqual(self.find('10.0.0.1', backend), [self.router])
+                self.assertEqual(self.find('10.0.0.2', backend), [])
+                self.assertEqual(self.find('todo:c++ router', backend), [self.router])
+                self.assertEqual(search.search(Diary.objects.all(), 'c++ router', backend=backend), [self.router])
+                # Not indexed yet, e.g. before the first `migrate` after deploying the index.
+                search.get_backend(backend).clear()
+                search.get_backend(backend).indexed.clear()
+                self.assertEqual(self.find('oute', backend), [self.router, self.switch])
+                self.assertEqual(search.search(Diary.objects.order_by('date'), 'rout 台北', backend=backend), [self.router])
+                with override_settings(DIARY_SEARCH_BACKEND=backend):
+                    create_search_index(sender=apps.get_app_config('diary'))
+                self.assertEqual(self.find('oute', backend), [])
+
+    def test_signals(self):
+        self.switch.remark = '高雄'
+        self.switch.save()
+        self.assertEqual(self.find('台中', 'fts5'), [])
+        self.assertEqual(self.find('高雄', 'fts5'), [self.switch])
+        self.switch.delete()
+        self.assertEqual(self.find('router', 'fts5'), [self.router])
+
+    def test_diary_list(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_diary'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('diary:diary_list'), {'search_input': '機房'})
+        self.assertEqual(list(response.context['object_list']), [self.router])
+        response = self.client.get(reverse('diary:diary_list'), {'search_input': 'switch'})
+        self.assertEqual(list(response.context['object_list']), [])
+        response = self.client.get(reverse('diary:diary_list'), {'search_input': 'router', 'sort': 'relevance'})
+        self.assertEqual(list(response.context['object_list']), [self.router])
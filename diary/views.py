@@ -1,14 +1,19 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
+from accounts.perms import prefetch_obj_perms
+from accounts.visibility import SCOPE_SELF, filter_visible
 from core.decorators import permission_required
+from core.export import export_queryset
+from core.pagination import get_keyset_page
 from core.utils import today
 
+from . import search
 from .forms import DiaryModelForm, DiaryCommentModelForm
 from .models import Diary
 from news.models import News
@@ -22,45 +27,47 @@ def get_diary_queryset(request):
     """
     model = Diary
     queryset = model.objects.all()
-    role = request.user.profile.activated_role
-    if not role:
-        return queryset.filter(created_by=request.user)
-    supervise_roles = role.groupprofile.supervise_roles.all()
-    if not supervise_roles:
-        return queryset.filter(created_by=request.user)
-    return queryset.filter(created_by__groups__in=supervise_roles).distinct()
+    return filter_visible(queryset, request.user, fallback=SCOPE_SELF)
+
+
+def filter_diary_queryset(request, queryset, with_search=True):
+    """
+    Filter `queryset` by the `dep`, `member` and `search_input` of the query string.
+    The search is done by the full-text index, see diary/search.py.
+    """
+    dep = request.GET.get('dep', '')
+    member = request.GET.get('member', '')
+    queryset = queryset.filter(created_by__groups__name=dep) if dep else queryset
+    queryset = queryset.filter(created_by__username=member) if member else queryset
+    if with_search:
+        queryset = search.filter_queryset(queryset, request.GET.get('search_input', ''))
+    return queryset
 
 
 @login_required
 @permission_required('diary.view_diary', raise_exception=True, exception=Http404)
 def diary_list(request):
     model = Diary
-    queryset = get_diary_queryset(request)
+    queryset = get_diary_queryset(request).select_related('created_by')
     paginate_by = 5
     template_name = 'diary/diary_list.html'
-    page_number = request.GET.get('page', '')
     dep = request.GET.get('dep', '')
-    member = request.GET.get('member', '')
     search_input = request.GET.get('search_input', '')
-    queryset = queryset.filter(created_by__groups__name=dep) if dep else queryset
-    queryset = queryset.filter(created_by__username=member) if member else queryset
-    if search_input:
-        queryset = queryset.filter(
-            Q(created_by__username__icontains=search_input) |
-            Q(daily_record__icontains=search_input) |
-            Q(todo__icontains=search_input) |
-            Q(date__icontains=search_input) |
-            Q(daily_check__icontains=search_input) |
-            Q(remark__icontains=search_input) |
-            Q(comment__icontains=search_input)
-        )
+    is_ranked = bool(search_input) and request.GET.get('sort') == 'relevance'
     role = request.user.profile.activated_role
     supervise_roles = role.groupprofile.supervise_roles.all() if role else None
     dep_role = supervise_roles.filter(name=dep).first() if supervise_roles else None
     supervise_members = dep_role.user_set.filter(is_active=True) if dep_role else None
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    if is_ranked:
+        # The most relevant diaries on a single page.
+        page_obj = None
+        is_paginated = False
+        object_list = search.search(filter_diary_queryset(request, queryset, with_search=False), search_input)
+    else:
+        page_obj = get_keyset_page(request, filter_diary_queryset(request, queryset), paginate_by)
+        is_paginated = page_obj.has_other_pages()
+        object_list = page_obj
+    object_list = prefetch_obj_perms(request.user, object_list)
 
     today = timezone.now().date()
     is_pinned_news = News.objects.filter(
@@ -73,7 +80,7 @@ def diary_list(request):
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
         'supervise_roles': supervise_roles,
         'supervise_members': supervise_members,
@@ -82,6 +89,22 @@ def diary_list(request):
     return render(request, template_name, context)
 
 
+@login_required
+@permission_required('diary.view_diary', raise_exception=True, exception=Http404)
+def diary_export(request):
+    queryset = filter_diary_queryset(request, get_diary_queryset(request))
+    columns = [
+        (_('Date'), 'date'),
+        (_('Created by'), 'created_by__username'),
+        (_('Daily check'), 'daily_check'),
+        (_('Daily record'), 'daily_record'),
+        (_('To do'), 'todo'),
+        (_('Remark'), 'remark'),
+        (_('Comment'), 'comment'),
+    ]
+    return export_queryset(request, queryset, columns, f'diaries_{today()}')
+
+
 @login_required
 @permission_required('diary.add_diary', raise_exception=True, exception=Http404)
 def diary_create(request):
@@ -3,6 +3,7 @@ from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from accounts.permissions import IsOwnerOrReadOnly
+from accounts.visibility import SCOPE_SELF, filter_visible
 
 from .models import Diary
 from .serializers import DiaryModelSerializer
@@ -16,13 +17,7 @@ class DiaryModelViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated, IsOwnerOrReadOnly, )
 
     def get_queryset(self):
-        role = self.request.user.profile.activated_role
-        if not role:
-            return self.queryset.filter(created_by=self.request.user)
-        supervise_roles = role.groupprofile.supervise_roles.all()
-        if not supervise_roles:
-            return self.queryset.filter(created_by=self.request.user)
-        return self.queryset.filter(created_by__groups__in=supervise_roles).distinct()
+        return filter_visible(self.queryset, self.request.user, fallback=SCOPE_SELF)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -28,7 +28,7 @@ def event_list(request):
 @login_required
 def calendar_events_json(request):
     user_department = request.user.profile.activated_role
-    events = CalendarEvent.objects.filter(department=user_department)
+    events = CalendarEvent.objects.filter(department=user_department).select_related('created_by').prefetch_related('support_group')
 
     # 定義使用者與顏色的對應
     user_colors = {
@@ -0,0 +1,200 @@
+"""
+The archive of old `Log`, in gzip compressed JSONL files partitioned by date.
+
+A day of logs is kept in `<LOG_ARCHIVE_ROOT>/<YYYY>/<MM>/log-<YYYY-MM-DD>.jsonl.gz` with a
+sidecar `log-<YYYY-MM-DD>.index.json` that has the id range, the count per model and the
+object ids per model, so a search only opens the partitions that may match. The indexes are
+parsed once per process and kept until their file changes, so the history of a diary does not
+parse every index again.
+
+An archived day may be archived again, e.g. after a late log; the new entries are appended
+to the partition as another gzip member and merged into its index.
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Log
+
+User = get_user_model()
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+FIELDS = ['id', 'action', 'app_label', 'model_name', 'object_id', 'data', 'created_by_id', 'created_at']
+
+
+def get_root():
+    return getattr(settings, 'LOG_ARCHIVE_ROOT', settings.BASE_DIR / 'logging' / 'archive')
+
+
+def get_partition_paths(date, root=None):
+    """
+    Return the paths of the data file and the index file of `date`.
+    """
+    directory = os.path.join(root or get_root(), f'{date:%Y}', f'{date:%m}')
+    return os.path.join(directory, f'log-{date:%Y-%m-%d}.jsonl.gz'), os.path.join(directory, f'log-{date:%Y-%m-%d}.index.json')
+
+
+def read_index(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_index(path):
+    """
+    Return the index of `path` with its object ids in sets, parsed only if the file changed since
+    it was last read. It is shared by the searches and must not be modified.
+    """
+    stat = os.stat(path)
+    # `write_index` replaces the file, so a new index has another inode even within the mtime resolution.
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _indexes_lock:
+        cached = _indexes.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    index = read_index(path)
+    index['objects'] = {model_name: set(ids) for model_name, ids in index['objects'].items()}
+    with _indexes_lock:
+        _indexes[path] = (key, index)
+    return index
+
+
+def clear_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def write_index(path, index):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def write_partition(date, entries, root=None):
+    """
+    Append `entries`, dicts of `FIELDS`, to the partition of `date`.
+    Entries already in the partition are skipped. Return the number of the written entries.
+    """
+    data_path, index_path = get_partition_paths(date, root)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    index = read_index(index_path) or {'date': date.isoformat(), 'count': 0, 'min_id': None, 'max_id': None, 'models': {}, 'objects': {}}
+    if index['max_id'] is not None:
+        entries = [entry for entry in entries if entry['id'] > index['max_id']]
+    if not entries:
+        return 0
+    objects = defaultdict(set, {model_name: set(ids) for model_name, ids in index['objects'].items()})
+    with gzip.open(data_path, 'at', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write('\n')
+            index['models'][entry['model_name']] = index['models'].get(entry['model_name'], 0) + 1
+            if entry['object_id'] is not None:
+                objects[entry['model_name']].add(entry['object_id'])
+    ids = [entry['id'] for entry in entries]
+    index['count'] += len(entries)
+    index['min_id'] = min(ids) if index['min_id'] is None else min(index['min_id'], *ids)
+    index['max_id'] = max(ids) if index['max_id'] is None else max(index['max_id'], *ids)
+    index['objects'] = {model_name: sorted(object_ids) for model_name, object_ids in objects.items()}
+    write_index(index_path, index)
+    return len(entries)
+
+
+def to_entry(values):
+    entry = dict(zip(FIELDS, values))
+    entry['created_at'] = entry['created_at'].isoformat()
+    return entry
+
+
+def archive(before, root=None, batch_size=1000, dry_run=False):
+    """
+    Move the logs created before the date `before` into the archive, a batch at a time.
+    Return {date: count}.
+    """
+    cutoff = timezone.make_aware(datetime.datetime.combine(before, datetime.time()))
+    queryset = Log.objects.filter(created_at__lt=cutoff).order_by('id')
+    archived = defaultdict(int)
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values_list(*FIELDS)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        partitions = defaultdict(list)
+        for values in rows:
+            partitions[timezone.localdate(values[-1])].append(to_entry(values))
+        for date, entries in partitions.items():
+            if not dry_run:
+                write_partition(date, entries, root)
+            archived[date] += len(entries)
+        if not dry_run:
+            # The rows are deleted only after they are in the archive, so nothing is lost on failure.
+            Log.objects.filter(id__in=[values[0] for values in rows]).delete()
+    return dict(sorted(archived.items()))
+
+
+def iter_partitions(root=None, since=None, until=None):
+    """
+    Yield (date, data path, index) of the partitions between `since` and `until`, oldest first.
+    The indexes are the cached ones of `get_index`.
+    """
+    root = root or get_root()
+    if not os.path.isdir(root):
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.index.json'):
+                continue
+            date = datetime.date.fromisoformat(filename[len('log-'):-len('.index.json')])
+            if (since and date < since) or (until and date > until):
+                continue
+            yield date, os.path.join(dirpath, filename.replace('.index.json', '.jsonl.gz')), get_index(os.path.join(dirpath, filename))
+
+
+def search(model_name=None, object_id=None, since=None, until=None, created_by_ids=None, root=None):
+    """
+    Yield the archived entries matching the arguments, oldest first.
+    Only the partitions whose index may match are opened.
+    """
+    for date, data_path, index in iter_partitions(root, since, until):
+        if model_name is not None and model_name not in index['models']:
+            continue
+        if object_id is not None and object_id not in index['objects'].get(model_name, ()):
+            continue
+        with gzip.open(data_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if model_name is not None and entry['model_name'] != model_name:
+                    continue
+                if object_id is not None and entry['object_id'] != object_id:
+                    continue
+                if created_by_ids is not None and entry['created_by_id'] not in created_by_ids:
+                    continue
+                yield entry
+
+
+def to_logs(entries):
+    """
+    Turn archived entries into unsaved `Log`, with their creators fetched in one query.
+    """
+    entries = list(entries)
+    users = User.objects.in_bulk({entry['created_by_id'] for entry in entries if entry['created_by_id']})
+    logs = []
+    for entry in entries:
+        log = Log(**{field: entry[field] for field in FIELDS if field not in ('created_by_id', 'created_at')})
+        log.created_at = parse_datetime(entry['created_at'])
+        log.created_by = users.get(entry['created_by_id'])
+        logs.append(log)
+    return logs
@@ -0,0 +1,36 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import today
+from log import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the logs older than a cutoff into gzip compressed JSONL files partitioned by date, '
+        'with a sidecar index per day. See log/archive.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive the logs created before this date (YYYY-MM-DD).')
+        parser.add_argument('--days', type=int, default=getattr(settings, 'LOG_ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive the logs older than this many days, unless --before is given.')
+        parser.add_argument('--root', help='The archive directory, LOG_ARCHIVE_ROOT by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the logs to archive.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['before']}")
+        else:
+            before = today() - datetime.timedelta(days=options['days'])
+        archived = archive.archive(before, root=options['root'], batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for date, count in archived.items():
+            self.stdout.write(f'{date}: {count}')
+        verb = 'would be archived' if options['dry_run'] else 'archived'
+        self.stdout.write(self.style.SUCCESS(f'{sum(archived.values())} logs before {before} {verb}.'))
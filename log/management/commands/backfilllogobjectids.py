@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from log.models import Log
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill `Log.object_id` of the logs written before it existed, from the "id" of their serialized data. '
+        'Logs whose data is not a serialized object, e.g. the READ logs of pilotadmin, are left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Log.objects.filter(object_id__isnull=True, data__startswith='{').order_by('id')
+        count = 0
+        last_id = 0
+        while True:
+            logs = list(queryset.filter(id__gt=last_id).only('id', 'data')[:batch_size])
+            if not logs:
+                break
+            last_id = logs[-1].id
+            changed = []
+            for log in logs:
+                try:
+                    object_id = json.loads(log.data).get('id')
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(object_id, int):
+                    log.object_id = object_id
+                    changed.append(log)
+            Log.objects.bulk_update(changed, ['object_id'])
+            count += len(changed)
+        self.stdout.write(self.style.SUCCESS(f'{count} logs backfilled.'))
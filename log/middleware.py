@@ -0,0 +1,15 @@
+from . import writer
+
+
+class LogWriterMiddleware:
+    """
+    Buffer the logs recorded during a request and write them with one `bulk_create` before the
+    response is returned, while the connection of the request is still open.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with writer.buffered():
+            return self.get_response(request)
@@ -9,6 +9,7 @@ class Log(models.Model):
     action = models.CharField(verbose_name=_('Action'), max_length=63)
     app_label = models.CharField(verbose_name=_('APP label'), max_length=63)
     model_name = models.CharField(verbose_name=_('Model name'), max_length=63)
+    object_id = models.PositiveIntegerField(verbose_name=_('Object id'), null=True, blank=True, db_index=True)
     data = models.TextField(verbose_name=_('Data'))
     created_by = models.ForeignKey(verbose_name=_('Created by'), to=settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(verbose_name=_('Created at'), default=now)
@@ -17,3 +18,4 @@ class Log(models.Model):
         ordering = ['-id']
         verbose_name = _('Log')
         verbose_name_plural = _('Logs')
+        indexes = [models.Index(fields=['model_name', 'created_at'])]
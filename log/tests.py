@@ -0,0 +1,166 @@
+import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from diary.models import Diary
+
+from . import archive, writer
+from .middleware import LogWriterMiddleware
+from .models import Log
+
+User = get_user_model()
+
+
+class LogWriterTestCase(TransactionTestCase):
+    # The entries are deferred to the commit, which `TestCase` never does.
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user')
+        self.date = datetime.date(2024, 1, 1)
+
+    def create_diaries(self, count):
+        for i in range(count):
+            Diary.objects.create(date=self.date, daily_record='record', created_by=self.user)
+            self.date += datetime.timedelta(days=1)
+
+    def test_written_at_once_out_of_scope(self):
+        self.create_diaries(1)
+        log = Log.objects.get(action='CREATE', model_name='diary')
+        self.assertEqual(log.object_id, Diary.objects.get().pk)
+
+    def test_buffered(self):
+        with writer.buffered():
+            self.create_diaries(5)
+            Diary.objects.filter(pk=Diary.objects.first().pk).delete()
+            self.assertEqual(Log.objects.count(), 0)
+            with CaptureQueriesContext(connection) as context:
+                writer.flush()
+            self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(list(Log.objects.order_by('id').values_list('action', flat=True)), ['CREATE'] * 5 + ['DELETE'])
+
+    def test_request_scope_and_rollback(self):
+        def view(request):
+            self.create_diaries(3)
+            with transaction.atomic():
+                self.create_diaries(1)
+                transaction.set_rollback(True)
+            self.assertEqual(Log.objects.count(), 0)
+            return HttpResponse()
+
+        # Written before the response is returned, not on `request_finished` which closes the connection.
+        LogWriterMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(Log.objects.count(), 3)
+        self.assertIsNone(writer.get_buffer())
+
+    @override_settings(LOG_WRITER_BACKGROUND=True)
+    def test_background(self):
+        with mock.patch('log.writer.write') as write:
+            with writer.buffered():
+                self.create_diaries(3)
+            writer.drain()
+            self.assertEqual(len(write.call_args[0][0]), 3)
+            full = queue.Queue(maxsize=1)
+            full.put([])
+            with mock.patch('log.writer.get_queue', return_value=full), self.assertLogs('log.writer', 'WARNING'):
+                with writer.buffered():
+                    self.create_diaries(2)
+            self.assertEqual(write.call_count, 2)
+
+
+class LogArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user')
+        self.other = User.objects.create_user(username='other')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_log'))
+        self.root = tempfile.mkdtemp()
+        self.settings = self.settings(LOG_ARCHIVE_ROOT=self.root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.root)
+        archive.clear_indexes()
+
+    def create_log(self, date, object_id, action='UPDATE', created_by=None):
+        return Log.objects.create(
+            action=action,
+            app_label='diary',
+            model_name='diary',
+            object_id=object_id,
+            data=json.dumps({'id': object_id}),
+            created_by=created_by or self.user,
+            created_at=timezone.make_aware(datetime.datetime.combine(date, datetime.time(12))),
+        )
+
+    def test_archive(self):
+        day = datetime.date(2024, 1, 1)
+        old = [self.create_log(day, 1), self.create_log(day, 2), self.create_log(day + datetime.timedelta(days=1), 1)]
+        new = self.create_log(datetime.date(2024, 3, 1), 1)
+        self.assertEqual(archive.archive(datetime.date(2024, 2, 1), batch_size=2), {day: 2, day + datetime.timedelta(days=1): 1})
+        self.assertEqual(list(Log.objects.values_list('id', flat=True)), [new.pk])
+        data_path, index_path = archive.get_partition_paths(day)
+        with gzip.open(data_path, 'rt', encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [old[0].pk, old[1].pk])
+        index = archive.read_index(index_path)
+        self.assertEqual((index['count'], index['min_id'], index['max_id']), (2, old[0].pk, old[1].pk))
+        self.assertEqual(index['objects'], {'diary': [1, 2]})
+        self.assertEqual([entry['id'] for entry in archive.search(model_name='diary', object_id=1)], [old[0].pk, old[2].pk])
+        self.assertEqual(list(archive.search(model_name='diary', object_id=1, created_by_ids={self.other.pk})), [])
+        # A late log of an archived day is appended.
+        late = self.create_log(day, 3)
+        self.assertEqual(archive.write_partition(day, [archive.to_entry(Log.objects.filter(pk=late.pk).values_list(*archive.FIELDS).get())]), 1)
+        self.assertEqual(archive.write_partition(day, [{'id': old[0].pk}]), 0)
+        self.assertEqual([entry['id'] for entry in archive.search(object_id=3, model_name='diary')], [late.pk])
+
+    def test_search_parses_an_index_once(self):
+        self.create_log(datetime.date(2024, 1, 1), 1)
+        self.create_log(datetime.date(2024, 1, 2), 2)
+        archive.archive(datetime.date(2024, 2, 1))
+        with mock.patch('log.archive.read_index', wraps=archive.read_index) as read_index:
+            self.assertEqual(len(list(archive.search(model_name='diary', object_id=1))), 1)
+            self.assertEqual(len(list(archive.search(model_name='diary', object_id=2))), 1)
+            self.assertEqual(read_index.call_count, 2)
+            # A partition archived again is parsed again.
+            late = self.create_log(datetime.date(2024, 1, 2), 1)
+            archive.archive(datetime.date(2024, 2, 1))
+            self.assertEqual([entry['id'] for entry in archive.search(model_name='diary', object_id=1)][-1], late.pk)
+
+    def test_dry_run(self):
+        self.create_log(datetime.date(2024, 1, 1), 1)
+        call_command('archivelogs', before='2024-02-01', dry_run=True, stdout=StringIO())
+        self.assertEqual(Log.objects.count(), 1)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_history(self):
+        self.create_log(datetime.date(2024, 1, 1), 1, action='CREATE')
+        self.create_log(datetime.date(2024, 1, 2), 2)
+        self.create_log(datetime.date(2024, 1, 3), 1, created_by=self.other)
+        archive.archive(datetime.date(2024, 2, 1))
+        self.create_log(datetime.date(2024, 3, 1), 1, action='DELETE')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('log:diary_log_history', kwargs={'pk': 1}))
+        self.assertEqual([log.action for log in response.context['object_list']], ['DELETE', 'CREATE'])
+
+    def test_backfill(self):
+        log = self.create_log(datetime.date(2024, 1, 1), None)
+        Log.objects.filter(pk=log.pk).update(data=json.dumps({'id': 7}))
+        Log.objects.create(action='READ', app_label='pilotadmin', model_name='pilotadmin', data='user view customer info')
+        call_command('backfilllogobjectids', stdout=StringIO())
+        self.assertEqual(list(Log.objects.order_by('id').values_list('object_id', flat=True)), [7, None])
@@ -1,10 +1,12 @@
 from django.urls import path
 
-from .views import diary_log_list, pilotadmin_log_list
+from .views import diary_log_export, diary_log_history, diary_log_list, pilotadmin_log_list
 
 app_name = 'log'
 
 urlpatterns = [
     path('diary/diaries/', diary_log_list, name='diary_log_list'),
+    path('diary/diaries/export/', diary_log_export, name='diary_log_export'),
+    path('diary/diaries/<int:pk>/', diary_log_history, name='diary_log_history'),
     path('pilotadmin/pilotadmin_content/', pilotadmin_log_list, name='pilotadmin_log_list'),
 ]
@@ -1,11 +1,16 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import render
+from django.utils.translation import gettext_lazy as _
 
+from accounts.visibility import SCOPE_SELF, filter_visible, get_visible_user_ids
 from core.decorators import permission_required
+from core.export import export_queryset
+from core.pagination import get_keyset_page
+from core.utils import today
 
+from . import archive
 from .models import Log
 
 User = get_user_model()
@@ -19,13 +24,7 @@ def get_diary_log_queryset(request):
     """
     model = Log
     queryset = model.objects.all().filter(model_name='diary')
-    role = request.user.profile.activated_role
-    if not role:
-        return queryset.filter(model_name='diary', created_by=request.user)
-    supervise_roles = role.groupprofile.supervise_roles.all()
-    if not supervise_roles:
-        return queryset.filter(model_name='diary', created_by=request.user)
-    return queryset.filter(created_by__groups__in=supervise_roles).distinct()
+    return filter_visible(queryset, request.user, fallback=SCOPE_SELF)
 
 
 def get_pilotadmin_log_queryset(request):
@@ -40,22 +39,53 @@ def get_pilotadmin_log_queryset(request):
 @permission_required('log.view_log', raise_exception=True, exception=Http404)
 def diary_log_list(request):
     model = Log
-    queryset = get_diary_log_queryset(request)
+    queryset = get_diary_log_queryset(request).select_related('created_by')
     paginate_by = 5
     template_name = 'log/diary_log_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': page_obj,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)
 
 
+@login_required
+@permission_required('log.view_log', raise_exception=True, exception=Http404)
+def diary_log_export(request):
+    model = Log
+    queryset = get_diary_log_queryset(request)
+    fields = ['id', 'action', 'app_label', 'model_name', 'data', 'created_at']
+    columns = [(model._meta.get_field(field).verbose_name, field) for field in fields]
+    columns.append((_('Created by'), 'created_by__username'))
+    return export_queryset(request, queryset, columns, f'diary_logs_{today()}')
+
+
+@login_required
+@permission_required('log.view_log', raise_exception=True, exception=Http404)
+def diary_log_history(request, pk):
+    """
+    The history of a diary, including the archived one. The diary may be deleted.
+    """
+    model = Log
+    queryset = get_diary_log_queryset(request).filter(object_id=pk).select_related('created_by')
+    template_name = 'log/log_history.html'
+    object_list = list(queryset)
+    if request.GET.get('archived') != 'false':
+        user_ids = set(get_visible_user_ids(request.user, fallback=SCOPE_SELF))
+        entries = archive.search(model_name='diary', object_id=pk, created_by_ids=user_ids)
+        object_list += archive.to_logs(reversed(list(entries)))
+    context = {
+        'model': model,
+        'object_id': pk,
+        'object_list': object_list,
+    }
+    return render(request, template_name, context)
+
+
 @login_required
 @permission_required('pilotadmin.view_pilotadmin', raise_exception=True, exception=Http404)
 def pilotadmin_log_list(request):
@@ -63,14 +93,12 @@ def pilotadmin_log_list(request):
     queryset = get_pilotadmin_log_queryset(request)
     paginate_by = 10
     template_name = 'log/diary_log_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': page_obj,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+A buffered writer of `Log`.
+
+During a request the entries are kept per thread by `LogWriterMiddleware` and written with
+one `bulk_create` before the response is returned. Not when the request finishes: Django closes
+the connection of the request on `request_finished`, and writing after that would open another
+connection for every request with logs. An entry recorded inside a
+transaction joins the buffer only when the transaction commits, so a rolled back change
+leaves no log, as it did with `Log.objects.create`. Out of a request the entries are written
+at once, unless they are recorded in `with buffered():`.
+
+With `LOG_WRITER_BACKGROUND` the buffers are handed to a background thread through a queue
+of `LOG_WRITER_QUEUE_SIZE` buffers. When the queue is full, the buffer is written by the
+caller, so nothing is dropped.
+"""
+import atexit
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from core.utils import now
+
+from .models import Log
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_queue = None
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    Return the buffer of the current scope, or None out of any scope.
+    """
+    return getattr(_local, 'buffer', None)
+
+
+def write(entries):
+    Log.objects.bulk_create(entries, batch_size=getattr(settings, 'LOG_WRITER_BATCH_SIZE', 500))
+
+
+def _work():
+    while True:
+        entries = _queue.get()
+        try:
+            write(entries)
+        except Exception:
+            logger.exception(f'Failed to write {len(entries)} log entries.')
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def get_queue():
+    global _queue, _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _queue = queue.Queue(maxsize=getattr(settings, 'LOG_WRITER_QUEUE_SIZE', 1000))
+            _worker = threading.Thread(target=_work, name='log-writer', daemon=True)
+            _worker.start()
+    return _queue
+
+
+def drain():
+    """
+    Wait until the background thread has written everything queued.
+    """
+    if _queue is not None and _worker is not None and _worker.is_alive():
+        _queue.join()
+
+
+atexit.register(drain)
+
+
+def flush():
+    """
+    Write the buffer of the current scope.
+    """
+    buffer = get_buffer()
+    if not buffer:
+        return
+    entries = buffer[:]
+    buffer.clear()
+    if getattr(settings, 'LOG_WRITER_BACKGROUND', False):
+        try:
+            get_queue().put_nowait(entries)
+            return
+        except queue.Full:
+            logger.warning('The log writer queue is full, writing in the request.')
+    write(entries)
+
+
+def _append(entry):
+    buffer = get_buffer()
+    if buffer is None:
+        write([entry])
+    else:
+        buffer.append(entry)
+
+
+def record(action, app_label, model_name, data, created_by=None, object_id=None):
+    """
+    Record a `Log`, which is written when the scope ends.
+    """
+    entry = Log(
+        action=action,
+        app_label=app_label,
+        model_name=model_name,
+        object_id=object_id,
+        data=data,
+        created_by=created_by,
+        created_at=now(),
+    )
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(_append, entry))
+    else:
+        _append(entry)
+
+
+@contextmanager
+def buffered():
+    """
+    Buffer the entries recorded in the block and write them at the end with one `bulk_create`.
+    """
+    if get_buffer() is not None:
+        # Nested, the outer scope writes them.
+        yield
+        return
+    _local.buffer = []
+    try:
+        yield
+        flush()
+    finally:
+        _local.buffer = None
+
@@ -1,163 +1,206 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.conf import settings
-from django.contrib.auth.models import User, Group
-from django.core.mail import send_mail
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+from accounts.models import GroupProfile
+from core.mail import MailDispatcher
+from core.profiling import profile_queries
 from news.models import News, NewsReadRecord
 from news.views import SPECIAL_USERS
 from datetime import datetime, timedelta
 
+TARGET_DEPARTMENTS = ['I00', 'I01', 'I02', 'I03', 'I04']
+
+
 class Command(BaseCommand):
     help = '每日檢查最新消息簽到狀況（正式發信版本，建議於每日 09:00 執行）'
 
-    def handle(self, *args, **options):
-        now_dt = datetime.now()
-        
-        if now_dt.hour != 9:
-            self.stdout.write(f"[{now_dt}] 非執行時間 (09:00)，跳過簽到檢查。")
-            return
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='非 09:00 也強制執行')
+        parser.add_argument('--stats', action='store_true', help='列出各階段的耗時與查詢數')
 
-        self.stdout.write(f"========== [{now_dt}] 開始執行每日簽到檢查與發信作業 ==========")
-        
-        today = timezone.localdate()
-        yesterday = today - timedelta(days=1)
+    @contextmanager
+    def stage(self, name):
+        with profile_queries() as profile:
+            started_at = time.perf_counter()
+            yield
+        self.stats.append((name, time.perf_counter() - started_at, profile.count))
 
+    def get_active_news(self, today):
+        yesterday = today - timedelta(days=1)
         active_news = News.objects.filter(created_by__username__in=SPECIAL_USERS)
-        active_news = (
+        return (
             active_news.filter(is_permanent=True) |
             active_news.filter(visible_at__date__lte=today, visible_due__date__gte=today) |
             active_news.filter(is_permanent=False, visible_due__date=yesterday)
         )
 
-        for news in active_news:
-            news_date = timezone.localtime(news.visible_at or news.at).date()
-            days_passed = (today - news_date).days
+    def get_action(self, news, today):
+        """
+        今日對此公告要做的事：('remind', 截止日, 剩餘天數, 是否為時效性公告)、('report', 標題) 或 None
+        """
+        news_date = timezone.localtime(news.visible_at or news.at).date()
+        days_passed = (today - news_date).days
+        is_urgent = (
+            not news.is_permanent and
+            news.visible_at is not None and
+            news.visible_due is not None and
+            news.visible_due.date() < (news.visible_at.date() + timedelta(days=15))
+        )
+        # 類型2：時效性公告
+        if is_urgent:
+            due_date = news.visible_due.date()
+            if today <= due_date:
+                # 上架期間：每日提醒本人
+                return ('remind', due_date, (due_date - today).days, True)
+            if today == due_date + timedelta(days=1):
+                # 下架隔天：發主管報表
+                return ('report', '時效性公告逾期報表')
+            return None
+        # 類型1：標準公告 / 永久顯示公告
+        if days_passed in [16, 17, 18]:
+            # 距主管報表還有幾天：3, 2, 1
+            return ('remind', news_date + timedelta(days=19), 19 - days_passed, False)
+        if days_passed == 19:
+            return ('report', '罰則報表')
+        return None
+
+    def get_unsigned(self, news_ids):
+        """
+        以兩個查詢取得各公告的未簽到者，回傳 ({user_id: (username, email)}, {news_id: [user_id]})
+        """
+        targets = User.objects.filter(is_active=True, groups__name__in=TARGET_DEPARTMENTS)
+        users = dict(
+            (user_id, (username, email))
+            for user_id, username, email in targets.values_list('id', 'username', 'email').distinct()
+        )
+        read = defaultdict(set)
+        records = NewsReadRecord.objects.filter(news_id__in=news_ids, user__in=targets.values('id'))
+        for news_id, user_id in records.values_list('news_id', 'user_id').iterator():
+            read[news_id].add(user_id)
+        unsigned = {news_id: sorted(set(users) - read[news_id]) for news_id in news_ids}
+        return users, unsigned
+
+    def get_supervisors(self, user_ids):
+        """
+        一次查出所有使用者的主管：其群組被主管所屬群組的 supervise_roles 涵蓋者
+        回傳 {user_id: {(username, email)}}
+        """
+        through = User.groups.through
+        user_groups = defaultdict(set)
+        for user_id, group_id in through.objects.filter(user_id__in=user_ids).values_list('user_id', 'group_id'):
+            user_groups[user_id].add(group_id)
+        supervising_groups = defaultdict(set)
+        supervise = GroupProfile.supervise_roles.through.objects.filter(group_id__in={g for gs in user_groups.values() for g in gs})
+        for supervisor_group_id, group_id in supervise.values_list('groupprofile__group_id', 'group_id'):
+            supervising_groups[group_id].add(supervisor_group_id)
+        members = defaultdict(set)
+        supervisor_members = through.objects.filter(
+            group_id__in={g for gs in supervising_groups.values() for g in gs},
+            user__is_active=True,
+        ).exclude(user__email='')
+        for group_id, username, email in supervisor_members.values_list('group_id', 'user__username', 'user__email'):
+            members[group_id].add((username, email))
+        supervisors = {}
+        for user_id, group_ids in user_groups.items():
+            supervisors[user_id] = {
+                member
+                for group_id in group_ids
+                for supervisor_group_id in supervising_groups.get(group_id, ())
+                for member in members[supervisor_group_id]
+            }
+        return supervisors
+
+    def add_reminders(self, news, unsigned_ids, users, due_date, remaining_days, is_urgent):
+        for user_id in unsigned_ids:
+            username, email = users[user_id]
+            if not email:
+                continue
+            recipient_format = f"{username} <{email}>"
+            subject = f"【簽閱提醒】剩餘{remaining_days}天！請儘速簽閱公告：《{news.title}》"
+            if is_urgent:
+                message = (
+                    f"同仁您好，\n\n"
+                    f"提醒您，目前有一則重要公告即將下架，請於今日下班前或截止日前完成確認：《{news.title}》\n\n"
+                    f"狀態：尚未簽閱\n"
+                    f"截止倒數：預計於 {due_date} 下架，屆時未簽閱者將計入逾期登記。\n\n"
+                    f"謝謝您的配合！"
+                )
+            else:
+                message = (
+                    f"同仁您好，\n\n"
+                    f"提醒您，目前有一則重要公告即將截止簽閱，請於今日下班前或截止日前完成確認：《{news.title}》\n\n"
+                    f"狀態：尚未簽閱\n"
+                    f"截止倒數：預計於 {due_date} 截止簽閱，屆時未簽閱者將計入逾期登記。\n\n"
+                    f"謝謝您的配合！"
+                )
+            self.dispatcher.add(EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [recipient_format]))
+
+    def add_reports(self, news, unsigned_ids, users, supervisors):
+        supervisor_reports = defaultdict(set)
+        for user_id in unsigned_ids:
+            for supervisor in supervisors.get(user_id, ()):
+                supervisor_reports[supervisor].add(users[user_id][0])
+        for (supervisor_name, supervisor_email), usernames in sorted(supervisor_reports.items()):
+            contact_info = f"{supervisor_name} <{supervisor_email}>"
+            subject = f"【TDB最新消息逾期簽閱報表】- 《{news.title}》"
+            message = f"{supervisor_name}  您好，\n\n以下為逾期未簽閱《{news.title}》之人員名單：\n\n" + "\n".join(sorted(usernames))
+            self.dispatcher.add(EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [contact_info]))
 
-            target_departments = ['I00', 'I01', 'I02', 'I03', 'I04']
-            read_user_ids = NewsReadRecord.objects.filter(news=news).values_list('user_id', flat=True)
-            unsigned_users = User.objects.filter(is_active=True, groups__name__in=target_departments).exclude(id__in=read_user_ids)
+    def handle(self, *args, **options):
+        now_dt = datetime.now()
 
-            if not unsigned_users.exists():
-                continue
+        if now_dt.hour != 9 and not options['force']:
+            self.stdout.write(f"[{now_dt}] 非執行時間 (09:00)，跳過簽到檢查。")
+            return
 
-            # 判斷公告類型
-            is_urgent = (
-                not news.is_permanent and
-                news.visible_at is not None and
-                news.visible_due is not None and
-                news.visible_due.date() < (news.visible_at.date() + timedelta(days=15))
-            )
+        self.stdout.write(f"========== [{now_dt}] 開始執行每日簽到檢查與發信作業 ==========")
 
-            # 類型2：時效性公告
-            if is_urgent:
-                due_date = news.visible_due.date()
-
-                if today <= due_date:
-                    # 上架期間：每日提醒本人
-                    remaining_days = (due_date - today).days
-                    for user in unsigned_users.exclude(email=''):
-                        recipient_format = f"{user.username} <{user.email}>"
-                        subject = f"【簽閱提醒】剩餘{remaining_days}天！請儘速簽閱公告：《{news.title}》"
-                        message = (
-                            f"同仁您好，\n\n"
-                            f"提醒您，目前有一則重要公告即將下架，請於今日下班前或截止日前完成確認：《{news.title}》\n\n"
-                            f"狀態：尚未簽閱\n"
-                            f"截止倒數：預計於 {due_date} 下架，屆時未簽閱者將計入逾期登記。\n\n"
-                            f"謝謝您的配合！"
-                        )
-                        send_mail(
-                            subject=subject,
-                            message=message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[recipient_format],
-                            fail_silently=True,
-                        )
-                    self.stdout.write(f"已發送【時效性公告每日提醒信】給 《{news.title}》 的未簽到者")
-
-                elif today == due_date + timedelta(days=1):
-                    # 下架隔天：發主管報表
-                    supervisor_reports = {}
-                    for user in unsigned_users:
-                        user_groups = user.groups.all()
-                        supervisors = User.objects.filter(
-                            is_active=True,
-                            groups__groupprofile__supervise_roles__in=user_groups
-                        ).exclude(email='').distinct()
-                        for supervisor in supervisors:
-                            supervisor_contact = f"{supervisor.username} <{supervisor.email}>"
-                            if supervisor_contact not in supervisor_reports:
-                                supervisor_reports[supervisor_contact] = set()
-                            supervisor_reports[supervisor_contact].add(user.username)
-
-                    for contact_info, usernames in supervisor_reports.items():
-                        names_list = sorted(list(usernames))
-                        supervisor_name = contact_info.split(' <')[0]
-                        subject = f"【TDB最新消息逾期簽閱報表】- 《{news.title}》"
-                        message = (
-                            f"{supervisor_name}  您好，\n\n"
-                            f"以下為逾期未簽閱《{news.title}》之人員名單：\n\n" +
-                            "\n".join(names_list)
-                        )
-                        send_mail(
-                            subject=subject,
-                            message=message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[contact_info],
-                            fail_silently=True,
-                        )
-                    self.stdout.write(f"已發送【時效性公告逾期報表】給 《{news.title}》 的相關主管與幕僚")
-
-                continue  # 類型2處理完畢，不走下面的類型1邏輯
-
-            # 類型1：標準公告 / 永久顯示公告
-            if days_passed in [16, 17, 18]:
-                remaining_days = 19 - days_passed  # 距主管報表還有幾天：3, 2, 1
-                deadline_date = news_date + timedelta(days=19)
-                for user in unsigned_users.exclude(email=''):
-                    recipient_format = f"{user.username} <{user.email}>"
-                    subject = f"【簽閱提醒】剩餘{remaining_days}天！請儘速簽閱公告：《{news.title}》"
-                    message = (
-                        f"同仁您好，\n\n"
-                        f"提醒您，目前有一則重要公告即將截止簽閱，請於今日下班前或截止日前完成確認：《{news.title}》\n\n"
-                        f"狀態：尚未簽閱\n"
-                        f"截止倒數：預計於 {deadline_date} 截止簽閱，屆時未簽閱者將計入逾期登記。\n\n"
-                        f"謝謝您的配合！"
-                    )
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[recipient_format],
-                        fail_silently=True,
-                    )
-                self.stdout.write(f"已發送【提醒信】給 《{news.title}》 的未簽到者")
-
-            elif days_passed == 19:
-                supervisor_reports = {}
-                for user in unsigned_users:
-                    user_groups = user.groups.all()
-                    supervisors = User.objects.filter(
-                        is_active=True,
-                        groups__groupprofile__supervise_roles__in=user_groups
-                    ).exclude(email='').distinct()
-                    for supervisor in supervisors:
-                        supervisor_contact = f"{supervisor.username} <{supervisor.email}>"
-                        if supervisor_contact not in supervisor_reports:
-                            supervisor_reports[supervisor_contact] = set()
-                        supervisor_reports[supervisor_contact].add(user.username)
-
-                for contact_info, usernames in supervisor_reports.items():
-                    names_list = sorted(list(usernames))
-                    supervisor_name = contact_info.split(' <')[0]
-                    subject = f"【TDB最新消息逾期簽閱報表】- 《{news.title}》"
-                    message = f"{supervisor_name}  您好，\n\n以下為逾期未簽閱《{news.title}》之人員名單：\n\n" + "\n".join(names_list)
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[contact_info],
-                        fail_silently=True,
-                    )
-                self.stdout.write(f"已發送【罰則報表】給 《{news.title}》 的相關主管與幕僚")
-
-        self.stdout.write(f"========== [{datetime.now()}] 簽到檢查與發信作業結束 ==========")
\ No newline at end of file
+        today = timezone.localdate()
+        self.stats = []
+        # 所有信件集中於最後分批寄出，共用同一個 SMTP 連線
+        self.dispatcher = MailDispatcher(fail_silently=True)
+
+        with self.stage('active news'):
+            actions = []
+            for news in self.get_active_news(today):
+                action = self.get_action(news, today)
+                if action:
+                    actions.append((news, action))
+
+        with self.stage('unsigned users'):
+            users, unsigned = self.get_unsigned([news.pk for news, _ in actions])
+
+        with self.stage('supervisors'):
+            report_user_ids = {
+                user_id for news, action in actions if action[0] == 'report' for user_id in unsigned[news.pk]
+            }
+            supervisors = self.get_supervisors(report_user_ids) if report_user_ids else {}
+
+        with self.stage('build mails'):
+            for news, action in actions:
+                unsigned_ids = unsigned[news.pk]
+                if not unsigned_ids:
+                    continue
+                if action[0] == 'remind':
+                    _, due_date, remaining_days, is_urgent = action
+                    self.add_reminders(news, unsigned_ids, users, due_date, remaining_days, is_urgent)
+                    kind = '時效性公告每日提醒信' if is_urgent else '提醒信'
+                    self.stdout.write(f"已發送【{kind}】給 《{news.title}》 的未簽到者")
+                else:
+                    self.add_reports(news, unsigned_ids, users, supervisors)
+                    self.stdout.write(f"已發送【{action[1]}】給 《{news.title}》 的相關主管與幕僚")
+
+        with self.stage('send mails'):
+            sent = self.dispatcher.flush()
+
+        self.stdout.write(f"共寄出 {sent} 封信，分 {len(self.dispatcher.batches)} 批")
+        if options['stats']:
+            for name, duration, queries in self.stats:
+                self.stdout.write(f"{name:<16}{duration * 1000:>10.1f} ms{queries:>6} queries")
+        self.stdout.write(f"========== [{datetime.now()}] 簽到檢查與發信作業結束 ==========")
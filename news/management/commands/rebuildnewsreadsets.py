@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from news import readset
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the read bitmaps and the read and audience counters of every news from the read records. '
+        'The news without them are rebuilt after `migrate`; run it after `bulk_create` of read records, '
+        'or to refresh the audience counts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = readset.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} news rebuilt.'))
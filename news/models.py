@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from core.utils import now
@@ -17,11 +18,43 @@ class News(models.Model):
     visible_at = models.DateTimeField(verbose_name=_('Visible Start'), null=True, blank=True)
     visible_due = models.DateTimeField(verbose_name=_('Visible Due'), null=True, blank=True)
     created_by = models.ForeignKey(verbose_name=_('Created by'), to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Kept by news/readset.py.
+    read_count = models.PositiveIntegerField(verbose_name=_('Read count'), default=0, editable=False)
+    audience_count = models.PositiveIntegerField(verbose_name=_('Audience count'), default=0, editable=False)
+    read_bitmap = models.BinaryField(verbose_name=_('Read bitmap'), default=b'', blank=True, editable=False)
 
     class Meta:
         ordering = ['-is_pinned', '-at']
         verbose_name = _('New')
         verbose_name_plural = _('News')
+        indexes = [models.Index(fields=['-is_pinned', '-at', '-id'])]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.audience_count:
+            from .readset import get_audience_count
+            self.audience_count = get_audience_count()
+        super().save(*args, **kwargs)
+
+    @cached_property
+    def read_set(self):
+        from .readset import ReadSet
+        return ReadSet(self.read_bitmap)
+
+    def has_read(self, user):
+        return user.pk in self.read_set
+
+    @property
+    def unread_count(self):
+        return max(self.audience_count - self.read_count, 0)
+
+    @property
+    def completion(self):
+        """
+        The percentage of the audience who signed in.
+        """
+        if not self.audience_count:
+            return 0
+        return min(round(self.read_count * 100 / self.audience_count), 100)
 
     def get_create_url(self):
         return reverse('news:news_create')
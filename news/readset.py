@@ -0,0 +1,133 @@
+"""
+The readers of a news as a bitmap keyed by user id, kept in `News.read_bitmap`.
+
+Bit `i` of byte `i // 8` is set when the user `i` has signed in the news, so a
+user with id 10000 takes 1.25 kB. `read_count` and `audience_count` are kept next
+to it, so the badges and the completion need no `NewsReadRecord` query.
+
+The news older than the bitmaps have none, they are rebuilt after `migrate` by `backfill`.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import News, NewsReadRecord
+
+User = get_user_model()
+
+POPCOUNT = bytes(bin(i).count('1') for i in range(256))
+
+
+class ReadSet:
+
+    def __init__(self, data=b''):
+        self.data = bytearray(data or b'')
+
+    def __contains__(self, user_id):
+        index = user_id >> 3
+        return index < len(self.data) and bool(self.data[index] & (1 << (user_id & 7)))
+
+    def __iter__(self):
+        for index, byte in enumerate(self.data):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (index << 3) | bit
+
+    def __len__(self):
+        return sum(POPCOUNT[byte] for byte in self.data)
+
+    def add(self, user_id):
+        """
+        Add `user_id`, return whether it was not there.
+        """
+        index = user_id >> 3
+        if index >= len(self.data):
+            self.data.extend(bytes(index + 1 - len(self.data)))
+        mask = 1 << (user_id & 7)
+        if self.data[index] & mask:
+            return False
+        self.data[index] |= mask
+        return True
+
+    def discard(self, user_id):
+        """
+        Remove `user_id`, return whether it was there.
+        """
+        if user_id not in self:
+            return False
+        self.data[user_id >> 3] &= ~(1 << (user_id & 7)) & 0xFF
+        return True
+
+    def to_bytes(self):
+        return bytes(self.data.rstrip(b'\x00'))
+
+
+def get_audience_count():
+    """
+    The target audience of a news, i.e. the active users.
+    """
+    return User.objects.filter(is_active=True).count()
+
+
+def update_read_set(news_id, user_id, read=True):
+    """
+    Add or remove `user_id` in the read set of the news, counting it once.
+    """
+    with transaction.atomic():
+        data = News.objects.select_for_update().filter(pk=news_id).values_list('read_bitmap', flat=True).first()
+        if data is None:
+            return
+        read_set = ReadSet(data)
+        changed = read_set.add(user_id) if read else read_set.discard(user_id)
+        if changed:
+            News.objects.filter(pk=news_id).update(
+                read_bitmap=read_set.to_bytes(),
+                read_count=F('read_count') + (1 if read else -1),
+            )
+
+
+def rebuild(queryset=None, batch_size=500):
+    """
+    Rebuild the read sets and the counters of `queryset` from `NewsReadRecord`.
+    Return the number of the rebuilt news.
+    """
+    queryset = News.objects.all() if queryset is None else queryset
+    read_sets = {}
+    records = NewsReadRecord.objects.filter(news__in=queryset.values('pk'))
+    for news_id, user_id in records.values_list('news_id', 'user_id').iterator():
+        read_sets.setdefault(news_id, ReadSet()).add(user_id)
+    audience_count = get_audience_count()
+    changed = []
+    count = 0
+    for news in queryset.only('pk').iterator(chunk_size=batch_size):
+        read_set = read_sets.get(news.pk, ReadSet())
+        news.read_bitmap = read_set.to_bytes()
+        news.read_count = len(read_set)
+        news.audience_count = audience_count
+        changed.append(news)
+        if len(changed) >= batch_size:
+            News.objects.bulk_update(changed, ['read_bitmap', 'read_count', 'audience_count'])
+            count += len(changed)
+            changed = []
+    if changed:
+        News.objects.bulk_update(changed, ['read_bitmap', 'read_count', 'audience_count'])
+        count += len(changed)
+    return count
+
+
+def get_stale_news():
+    """
+    The news whose read set and counters were not built: fewer readers than read records, e.g.
+    only the ones who signed again since, or no audience.
+    """
+    return News.objects.annotate(record_count=Count('read_records')).filter(
+        Q(audience_count=0) | Q(read_count__lt=F('record_count'))
+    )
+
+
+def backfill(batch_size=500):
+    """
+    Rebuild the stale news. Return the number of the rebuilt news.
+    """
+    return rebuild(get_stale_news(), batch_size)
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import readset
+from .models import NewsReadRecord
+
+
+@receiver(post_save, sender=NewsReadRecord, dispatch_uid='add_news_reader')
+def add_news_reader(sender, instance, created, **kwargs):
+    if created:
+        readset.update_read_set(instance.news_id, instance.user_id)
+
+
+@receiver(post_delete, sender=NewsReadRecord, dispatch_uid='remove_news_reader')
+def remove_news_reader(sender, instance, **kwargs):
+    readset.update_read_set(instance.news_id, instance.user_id, read=False)
+
+
+@receiver(post_migrate, dispatch_uid='backfill_news_read_sets')
+def backfill_read_sets(sender, **kwargs):
+    # The news created before the read bitmaps have none.
+    if sender.name != 'news':
+        return
+    readset.backfill()
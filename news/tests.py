@@ -1,3 +1,155 @@
-from django.test import TestCase
+import io
+import smtplib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.mail import pool
+from core.profiling import profile_queries
+
+from .models import News, NewsReadRecord
+from .readset import ReadSet
+from .signals import backfill_read_sets
+
+User = get_user_model()
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class CheckNewsSignaturesTestCase(TestCase):
+
+    def setUp(self):
+        pool.close()
+        self.addCleanup(pool.close)
+        self.author = User.objects.create_user(username='Apple_Lai')
+        department = Group.objects.create(name='I01')
+        member_role = Group.objects.create(name='member role')
+        manager_role = Group.objects.create(name='manager role')
+        manager_role.groupprofile.supervise_roles.add(member_role)
+        self.manager = User.objects.create_user(username='manager', email='manager@example.com')
+        self.manager.groups.add(manager_role)
+        self.members = []
+        for i in range(6):
+            member = User.objects.create_user(username=f'member{i}', email=f'member{i}@example.com' if i else '')
+            member.groups.add(department, member_role)
+            self.members.append(member)
+
+    def create_news(self, title, days_ago):
+        at = timezone.now() - timedelta(days=days_ago)
+        news = News.objects.create(title=title, content='content', at=at, created_by=self.author)
+        NewsReadRecord.objects.create(news=news, user=self.members[1])
+        return news
+
+    def run_command(self):
+        stdout = io.StringIO()
+        with profile_queries() as profile:
+            call_command('check_news_signatures', force=True, stats=True, stdout=stdout)
+        return profile.count, stdout.getvalue()
+
+    def test_reminders_and_reports(self):
+        self.create_news('remind', days_ago=16)
+        self.create_news('report', days_ago=19)
+        self.create_news('quiet', days_ago=3)
+        count, stdout = self.run_command()
+        reminders = [message for message in mail.outbox if 'remind' in message.subject]
+        reports = [message for message in mail.outbox if 'report' in message.subject]
+        # member0 has no email, member1 has signed.
+        self.assertEqual(sorted(message.to[0] for message in reminders), [f'member{i} <member{i}@example.com>' for i in range(2, 6)])
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0].to, ['manager <manager@example.com>'])
+        self.assertIn('member0\nmember2\nmember3\nmember4\nmember5', reports[0].body)
+        self.assertIn('supervisors', stdout)
+
+    def test_refused_recipient_does_not_stop_the_batch(self):
+        self.create_news('remind', days_ago=16)
+        self.create_news('report', days_ago=19)
+        locmem = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        original = __import__('django.core.mail.backends.locmem', fromlist=['EmailBackend']).EmailBackend.send_messages
+
+        def refuse_member3(backend, messages):
+            if messages[0].to == ['member3 <member3@example.com>']:
+                raise smtplib.SMTPRecipientsRefused({'member3@example.com': (550, b'No such user')})
+            return original(backend, messages)
+
+        with mock.patch(locmem, autospec=True, side_effect=refuse_member3), self.assertLogs('core.mail', 'ERROR'):
+            _, stdout = self.run_command()
+        # The mails queued after the refused one are sent, the report included.
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['manager <manager@example.com>'] + [f'member{i} <member{i}@example.com>' for i in (2, 4, 5)],
+        )
+        self.assertIn('共寄出 4 封信', stdout)
+
+    def test_queries_do_not_grow_with_users(self):
+        self.create_news('report', days_ago=19)
+        count, _ = self.run_command()
+        for i in range(6, 20):
+            User.objects.create_user(username=f'member{i}').groups.add(*self.members[0].groups.all())
+        self.create_news('another report', days_ago=19)
+        self.assertEqual(self.run_command()[0], count)
+
+
+class NewsReadSetTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Brian_Chiang', password='password')
+        self.users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(20)]
+        self.news = News.objects.create(title='title', content='content', created_by=self.author)
+
+    def test_read_set(self):
+        read_set = ReadSet()
+        self.assertTrue(read_set.add(3))
+        self.assertFalse(read_set.add(3))
+        read_set.add(17)
+        self.assertEqual((list(read_set), len(read_set), 17 in read_set, 4 in read_set, 1000 in read_set), ([3, 17], 2, True, False, False))
+        self.assertTrue(read_set.discard(17))
+        self.assertEqual(read_set.to_bytes(), b'\x08')
+
+    def test_counters_follow_the_records(self):
+        self.assertEqual(self.news.audience_count, 21)
+        for user in self.users[:5]:
+            NewsReadRecord.objects.create(news=self.news, user=user)
+        NewsReadRecord.objects.filter(user=self.users[0]).delete()
+        self.news.refresh_from_db()
+        self.assertEqual((self.news.read_count, self.news.completion), (4, 19))
+        self.assertFalse(self.news.has_read(self.users[0]))
+        self.assertTrue(self.news.has_read(self.users[4]))
+        News.objects.update(read_count=0, read_bitmap=b'')
+        call_command('rebuildnewsreadsets', stdout=io.StringIO())
+        self.news.refresh_from_db()
+        self.assertEqual(sorted(self.news.read_set), [user.pk for user in self.users[1:5]])
+
+    def test_news_older_than_the_read_sets(self):
+        NewsReadRecord.objects.bulk_create([NewsReadRecord(news=self.news, user=user) for user in self.users[:3]])
+        old = News.objects.create(title='old', content='content', created_by=self.author)
+        News.objects.update(audience_count=0)
+        # Signing again repairs the read set.
+        self.client.force_login(self.users[0])
+        self.client.get(reverse('news:news_sign_in', args=[self.news.pk]))
+        self.news.refresh_from_db()
+        self.assertEqual((self.news.read_count, self.news.has_read(self.users[0])), (1, True))
+        backfill_read_sets(sender=apps.get_app_config('news'))
+        self.news = News.objects.get(pk=self.news.pk)
+        old.refresh_from_db()
+        self.assertEqual(sorted(self.news.read_set), [user.pk for user in self.users[:3]])
+        self.assertEqual((self.news.audience_count, old.audience_count, old.read_count), (21, 21, 0))
+
+    def test_sign_in_and_report(self):
+        self.client.force_login(self.users[0])
+        self.client.get(reverse('news:news_sign_in', args=[self.news.pk]))
+        self.client.get(reverse('news:news_sign_in', args=[self.news.pk]))
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.read_count, 1)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('news:news_read_report', args=[self.news.pk]))
+        self.assertEqual([record.user for record in response.context['records']], [self.users[0]])
+        self.assertEqual(len(response.context['unread_users']), 20)
+        response = self.client.get(reverse('news:news_export_csv', args=[self.news.pk]))
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8-sig').count('未簽到'), 20)
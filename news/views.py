@@ -1,10 +1,7 @@
-import csv
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.core.paginator import Paginator
 from django.http.response import Http404
-from django.http import HttpResponseForbidden, HttpResponse
+from django.http import HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
@@ -12,11 +9,16 @@ from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
 
 
+from accounts.visibility import SCOPE_DEPARTMENTS, filter_visible
+from core import outbox
 from core.decorators import permission_required
+from core.export import export, iter_queryset_rows
+from core.pagination import get_keyset_page
 
+from . import readset
 from .forms import NewsModelForm
 from .models import News, NewsReadRecord
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
 
 SPECIAL_USERS = ['Apple_Lai', 'jill_ko', 'Brian_Chiang']
 GLOBAL_REPORT_VIEWERS = ['Brian_Chiang']
@@ -31,14 +33,12 @@ def get_dep_news_queryset(request):
     now = timezone.now()
     valid_condition = Q(is_permanent=True) | Q(is_permanent=False, visible_at__lte=now, visible_due__gte=now)
     queryset = model.objects.exclude(created_by__username__in=SPECIAL_USERS).filter(valid_condition)
-    role = request.user.profile.activated_role
-    deps = request.user.groups.filter(groupprofile__is_department=True)
-    if not role:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    supervise_roles = role.groupprofile.supervise_roles.all()
-    if not supervise_roles:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    return queryset.filter(created_by__groups__in=supervise_roles).distinct()
+    return filter_visible(queryset, request.user, fallback=SCOPE_DEPARTMENTS)
+
+
+def can_view_report(request, supervise_roles):
+    # Checked once for the page instead of in the template for every news.
+    return bool(supervise_roles) or request.user.username in SPECIAL_USERS
 
 
 @login_required
@@ -50,18 +50,19 @@ def news_list(request):
     now = timezone.now()
     valid_condition = Q(is_permanent=True) | Q(is_permanent=False, visible_at__lte=now, visible_due__gte=now)
     qs = News.objects.filter(created_by__username__in=SPECIAL_USERS).filter(valid_condition)
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(qs, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
-    read_news_ids = NewsReadRecord.objects.filter(user=request.user, news__in=qs).values_list('news_id', flat=True)
+    page_obj = get_keyset_page(request, qs, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    read_news_ids = [news.pk for news in page_obj if news.has_read(request.user)]
+    role = request.user.profile.activated_role
+    supervise_roles = role.groupprofile.supervise_roles.all() if role else None
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else qs,
+        'object_list': page_obj,
         'is_paginated': is_paginated,
         'is_supervisor': is_supervisor,
-        'read_news_ids': list(read_news_ids),
+        'read_news_ids': read_news_ids,
+        'can_view_report': can_view_report(request, supervise_roles),
     }
     return render(request, template_name, context)
 
@@ -77,19 +78,18 @@ def dep_news_list(request):
     qs = qs.filter(created_by__groups__name=dep) if dep else qs
     role = request.user.profile.activated_role
     supervise_roles = role.groupprofile.supervise_roles.all() if role else None
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(qs, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
-    read_news_ids = NewsReadRecord.objects.filter(user=request.user, news__in=qs).values_list('news_id', flat=True)
+    page_obj = get_keyset_page(request, qs, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    read_news_ids = [news.pk for news in page_obj if news.has_read(request.user)]
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else qs,
+        'object_list': page_obj,
         'is_paginated': is_paginated,
         'is_supervisor': is_supervisor,
         'supervise_roles': supervise_roles,
-        'read_news_ids': list(read_news_ids)
+        'read_news_ids': read_news_ids,
+        'can_view_report': can_view_report(request, supervise_roles),
     }
     return render(request, template_name, context)
 
@@ -112,15 +112,13 @@ def news_create(request):
             news_title = news.title
 
             if success_url == success_url1:
-                active_users = User.objects.filter(is_active=1)
-                recipient_list = [user.email for user in active_users if user.email]
-                send_mail(
+                recipient_list = User.objects.filter(is_active=1).exclude(email='').values_list('email', flat=True)
+                outbox.enqueue(
                     subject=f"[TDB] 最新消息：{news_title}",
-                    message=f"TDB最新消息已發布：{news_title}。\n\n請至TDB最新消息專區查看最新發布公告。",
+                    body=f"TDB最新消息已發布：{news_title}。\n\n請至TDB最新消息專區查看最新發布公告。",
                     from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=recipient_list,
-                    fail_silently=False,
-                    html_message=f"TDB最新消息已發布：{news_title}。\n\n請至<a href='https://tdb.chief-tech.net/news/'>最新消息</a>查看最新發布公告。",
+                    to=recipient_list,
+                    html_body=f"TDB最新消息已發布：{news_title}。\n\n請至<a href='https://tdb.chief-tech.net/news/'>最新消息</a>查看最新發布公告。",
                 )
 
             return redirect(success_url)
@@ -173,8 +171,12 @@ def news_delete(request, pk):
 @login_required
 def news_sign_in(request, pk):
     news = get_object_or_404(News, pk=pk)
-    NewsReadRecord.objects.get_or_create(news=news, user=request.user)
-    
+    if not news.has_read(request.user):
+        _, created = NewsReadRecord.objects.get_or_create(news=news, user=request.user)
+        if not created:
+            # Signed before the read set was built, repair it.
+            readset.update_read_set(news.pk, request.user.pk)
+
     previous_url = request.META.get('HTTP_REFERER')
     if previous_url:
         return redirect(previous_url)
@@ -182,46 +184,40 @@ def news_sign_in(request, pk):
     return redirect('news:news_list')
 
 
-@login_required
-def news_read_report(request, pk):
-    news = get_object_or_404(News, pk=pk)
+def get_read_report(request, news):
+    """
+    Return the (`records`, `users`) querysets of `news` the user could see, or None if the user may not see it.
+    `users` are everyone the user could see, the unread ones are told from the read set of the news.
+    """
     role = request.user.profile.activated_role
-
     if not role and request.user.username not in SPECIAL_USERS:
-        return HttpResponseForbidden(_('You have no permission to read this list.'))
-
-    supervise_roles = []
-    if role:
-        supervise_roles = role.groupprofile.supervise_roles.all()
-    
-    # 1. 先取得這篇公告「已簽到」的使用者 ID 列表
-    read_user_ids = NewsReadRecord.objects.filter(news=news).values_list('user_id', flat=True)
-    
+        return None
+    supervise_roles = role.groupprofile.supervise_roles.all() if role else Group.objects.none()
     if request.user.username in GLOBAL_REPORT_VIEWERS:
         # 特權帳號：看全部的已簽到與未簽到紀錄
-        records = NewsReadRecord.objects.filter(news=news).select_related('user__profile')
-        # 排除已簽到的人，即為未簽到的人 (建議加上 is_active=True 排除已離職或停用的帳號)
-        unread_users = User.objects.filter(is_active=True).exclude(id__in=read_user_ids).select_related('profile')
-        
+        records = NewsReadRecord.objects.filter(news=news)
+        users = User.objects.filter(is_active=True)
     elif supervise_roles.exists():
         # 部門/處主管：看轄下群組的已簽到與未簽到紀錄
-        records = NewsReadRecord.objects.filter(
-            news=news, 
-            user__groups__in=supervise_roles
-        ).distinct().select_related('user__profile')
-        
-        # 從 User 中過濾屬於轄下群組的人，並排除已簽到的人
-        unread_users = User.objects.filter(
-            is_active=True, 
-            groups__in=supervise_roles
-        ).exclude(id__in=read_user_ids).distinct().select_related('profile')
-        
+        records = NewsReadRecord.objects.filter(news=news, user__groups__in=supervise_roles).distinct()
+        users = User.objects.filter(is_active=True, groups__in=supervise_roles).distinct()
     else:
+        return None
+    return records, users
+
+
+@login_required
+def news_read_report(request, pk):
+    news = get_object_or_404(News, pk=pk)
+    report = get_read_report(request, news)
+    if report is None:
         return HttpResponseForbidden(_('You have no permission to read this list.'))
-    
+    records, users = report
+    # 排除已簽到的人，即為未簽到的人
+    unread_users = [user for user in users.select_related('profile') if not news.has_read(user)]
     context = {
         'news': news,
-        'records': records,
+        'records': records.select_related('user__profile'),
         'unread_users': unread_users,  # 將未簽到名單傳入 Template
     }
     return render(request, 'news/read_report.html', context)
@@ -230,49 +226,20 @@ def news_read_report(request, pk):
 @login_required
 def news_export_csv(request, pk):
     news = get_object_or_404(News, pk=pk)
-    role = request.user.profile.activated_role
-
-    # 1. 權限檢查 (與 read_report 完全相同)
-    if not role and request.user.username not in SPECIAL_USERS:
-        return HttpResponseForbidden(_('You have no permission to export this list.'))
-
-    supervise_roles = []
-    if role:
-        supervise_roles = role.groupprofile.supervise_roles.all()
-    
-    # 2. 撈取資料 (與 read_report 完全相同)
-    read_user_ids = NewsReadRecord.objects.filter(news=news).values_list('user_id', flat=True)
-    
-    if request.user.username in GLOBAL_REPORT_VIEWERS:
-        records = NewsReadRecord.objects.filter(news=news).select_related('user__profile')
-        unread_users = User.objects.filter(is_active=True).exclude(id__in=read_user_ids).select_related('profile')
-    elif supervise_roles.exists():
-        records = NewsReadRecord.objects.filter(news=news, user__groups__in=supervise_roles).distinct().select_related('user__profile')
-        unread_users = User.objects.filter(is_active=True, groups__in=supervise_roles).exclude(id__in=read_user_ids).distinct().select_related('profile')
-    else:
+    # 權限檢查與資料與 read_report 相同
+    report = get_read_report(request, news)
+    if report is None:
         return HttpResponseForbidden(_('You have no permission to export this list.'))
-
-    # 3. 建立 CSV 回應
-    response = HttpResponse(content_type='text/csv')
-    # 設定下載的檔名
-    response['Content-Disposition'] = f'attachment; filename="News_SignIn_Report_{news.pk}.csv"'
-    
-    # 【關鍵】寫入 UTF-8 BOM，防止 Excel 打開中文變亂碼
-    response.write('\ufeff'.encode('utf8'))
-
-    writer = csv.writer(response)
-    
-    # 寫入標題列 (Header)
-    writer.writerow(['狀態', '姓名', '簽到時間'])
-
-    # 寫入「已簽到」資料
-    for record in records:
-        # 將 UTC 時間轉換為本地時間並格式化
-        local_time = timezone.localtime(record.read_at).strftime('%Y-%m-%d %H:%M:%S')
-        writer.writerow(['已簽到', record.user.username, local_time])
-
-    # 寫入「未簽到」資料
-    for user in unread_users:
-        writer.writerow(['未簽到', user.username, ''])
-
-    return response
\ No newline at end of file
+    records, users = report
+
+    def iter_rows():
+        # 「已簽到」資料
+        for username, read_at in iter_queryset_rows(records, ['user__username', 'read_at']):
+            yield '已簽到', username, read_at
+        # 「未簽到」資料
+        for user_id, username in iter_queryset_rows(users, ['id', 'username']):
+            if user_id not in news.read_set:
+                yield '未簽到', username, ''
+
+    # 串流輸出，報表大小不影響記憶體用量
+    return export(request, f'News_SignIn_Report_{news.pk}', ['狀態', '姓名', '簽到時間'], iter_rows())
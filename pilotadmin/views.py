@@ -9,7 +9,7 @@ from core.decorators import permission_required
 from .forms import PilotadminModelForm
 from .models import Pilotadmin
 
-from log.models import Log
+from log import writer as log_writer
 
 
 def get_all_pilotadmin_queryset(request):
@@ -22,16 +22,16 @@ def get_all_pilotadmin_queryset(request):
     queryset = model.objects.all()
     return queryset
 
-def pilot_log_record(action, data):
+def pilot_log_record(action, data, object_id=None):
     processmodel = Pilotadmin
-    model = Log
-    instance = model()
-    instance.action = action
-    instance.app_label = processmodel._meta.app_label
-    instance.model_name = processmodel._meta.model_name
-    instance.data = data
-    instance.created_by=None
-    instance.save()
+    log_writer.record(
+        action=action,
+        app_label=processmodel._meta.app_label,
+        model_name=processmodel._meta.model_name,
+        object_id=object_id,
+        data=data,
+        created_by=None,
+    )
 
 @login_required
 @permission_required('pilotadmin.view_pilotadmin', raise_exception=True, exception=Http404)
@@ -62,7 +62,7 @@ def pilotadmin_content(request, pk):
 
     action = "READ"
     log_data = f"{request.user} view customer info:{queryset.customer_name}, {queryset.direct_number}"
-    pilot_log_record(action=action, data=log_data)
+    pilot_log_record(action=action, data=log_data, object_id=queryset.pk)
 
     context = {
         'model': model,
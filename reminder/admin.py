@@ -1,5 +1,6 @@
 from django.contrib import admin
 
-from .models import Reminder
+from .models import Reminder, ReminderDelivery
 
 admin.site.register(Reminder)
+admin.site.register(ReminderDelivery)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ReminderConfig(AppConfig):
     name = 'reminder'
+
+    def ready(self):
+        import reminder.signals  # noqa
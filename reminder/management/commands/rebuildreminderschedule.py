@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.utils import today
+from reminder import schedule
+from reminder.models import Reminder
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the next occurrence of every reminder. '
+        'Run it once after adding `next_fire_at`, or after changing the reminders with `QuerySet.update`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--retire-past-once',
+            action='store_true',
+            help='Deactivate the `once` reminders which started before today, i.e. already sent before the send ledger.',
+        )
+
+    def handle(self, *args, **options):
+        if options['retire_past_once']:
+            count = Reminder.objects.filter(is_active=True, policy='once', start_at__lt=today()).update(is_active=False)
+            self.stdout.write(f'{count} `once` reminder(s) retired.')
+        count = schedule.rebuild_next_fire_at(Reminder.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} reminder(s) updated.'))
@@ -1,59 +1,98 @@
+import logging
+
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.management.base import BaseCommand
-from datetime import datetime
+from django.db import IntegrityError, transaction
+
+from core import versions
+from core.mail import send_mail
+from core.utils import now
+from reminder import schedule
+from reminder.models import Reminder, ReminderDelivery
 
-from core.utils import today
-from reminder.models import Reminder
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
     help = 'Commands of send reminder Email.'
-    WEEK_MAP = {
-        0: 'monday',
-        1: 'tuesday',
-        2: 'wednesday',
-        3: 'thursday',
-        4: 'friday',
-        5: 'saturday',
-        6: 'sunday',
-    }
 
-    def handle(self, *args, **options):
-        # Hourly
-        qs = Reminder.objects.filter(is_active=True, policy='hourly', start_at__lte=today(), end_at__gt=today())
-        for reminder in qs:
+    MAX_ATTEMPTS = 3
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Send the reminders of 09:00 even if it is not 09:00.',
+        )
+
+    def get_due_reminders(self, until):
+        """
+        The active reminders with an occurrence up to `until`, whatever the policy.
+        """
+        return Reminder.objects.filter(is_active=True, next_fire_at__lte=until).order_by('next_fire_at', 'pk')
+
+    def claim(self, reminder, occurrence):
+        """
+        Return the ledger row of `occurrence` if it is to be sent by this run, else None.
+        The unique (reminder, occurrence) makes sure that it is sent once even if two runs overlap.
+        """
+        try:
+            with transaction.atomic():
+                return ReminderDelivery.objects.create(reminder=reminder, occurrence=occurrence)
+        except IntegrityError:
+            pass
+        # Only a failed one is retried.
+        claimed = ReminderDelivery.objects.filter(
+            reminder=reminder, occurrence=occurrence, status='failed', attempts__lt=self.MAX_ATTEMPTS,
+        ).update(status='pending')
+        return ReminderDelivery.objects.get(reminder=reminder, occurrence=occurrence) if claimed else None
+
+    def deliver(self, reminder, delivery):
+        """
+        Send `reminder` and record the result in `delivery`. Return whether it is done with,
+        i.e. sent or failed for `MAX_ATTEMPTS` times.
+        """
+        delivery.attempts += 1
+        try:
             self.handle_mail(reminder)
-        now = datetime.now()
-        if now.hour == 9:
-            # Daily
-            qs = Reminder.objects.filter(is_active=True, policy='daily', start_at__lte=today(), end_at__gt=today())
-            for reminder in qs:
-                self.handle_mail(reminder)
-            # On weekdays
-            qs = Reminder.objects.filter(is_active=True, policy='on weekdays', start_at__lte=today(), end_at__gt=today())
-            for reminder in qs:
-                self.handle_mail(reminder)
-            # Once
-            qs = Reminder.objects.filter(is_active=True, policy='once', start_at__lte=today())
-            for reminder in qs:
-                self.handle_mail(reminder)
-            # Every Monday, every tuesday, every Wednesday, every Thursday, every Friday, every Saturday, every Friday
-            code = today().weekday()
-            suffix = self.WEEK_MAP[code]
-            policy = 'every ' + suffix
-            qs = Reminder.objects.filter(is_active=True, policy=policy, start_at__lte=today(), end_at__gt=today())
-            for reminder in qs:
-                self.handle_mail(reminder)
-            # Specified dates
-            qs = Reminder.objects.filter(is_active=True, policy='specified dates')
-            for reminder in qs:
-                dates = reminder.specified_dates
-                seperator = ','
-                dates = dates[:-1] if dates[-1:] == seperator else dates
-                date_list = list(map(str.strip, dates.split(seperator)))
-                if str(today()) in date_list:
-                    self.handle_mail(reminder)
+        except Exception as e:
+            logger.exception(f'Failed to send reminder {reminder.pk} of {delivery.occurrence}.')
+            delivery.status = 'failed'
+            delivery.error = str(e)
+        else:
+            delivery.status = 'sent'
+            delivery.error = ''
+            delivery.sent_at = now()
+        delivery.save(update_fields=['status', 'attempts', 'error', 'sent_at'])
+        return delivery.status == 'sent' or delivery.attempts >= self.MAX_ATTEMPTS
+
+    def advance(self, reminder, until):
+        """
+        Move `next_fire_at` past `until`, and retire the reminder after its last occurrence.
+        """
+        # `once` catches up when it is saved too late, but never fires twice.
+        next_fire_at = None if reminder.policy == 'once' else schedule.get_next_fire_at(reminder, after=until)
+        Reminder.objects.filter(pk=reminder.pk, next_fire_at=reminder.next_fire_at).update(
+            next_fire_at=next_fire_at,
+            is_active=next_fire_at is not None,
+        )
+
+    def handle(self, *args, **options):
+        until = now()
+        if options['force']:
+            until = max(until, schedule.get_fire_datetime(until.date()))
+        # The business calendar is checked once for the whole run.
+        with versions.snapshot():
+            for reminder in self.get_due_reminders(until):
+                occurrence = reminder.next_fire_at
+                # `next_fire_at` may be stale, e.g. after a `Day` was changed, then it is only advanced.
+                if schedule.is_occurrence(reminder, occurrence):
+                    delivery = self.claim(reminder, occurrence)
+                    if delivery and not self.deliver(reminder, delivery):
+                        # Keep `next_fire_at`, so that the next run retries it.
+                        continue
+                self.advance(reminder, until)
 
     def handle_mail(self, reminder, debug=settings.DEBUG):
         seperator = ';'
@@ -66,8 +105,7 @@ class Command(BaseCommand):
             print(reminder.email_content)
         send_mail(
             subject=reminder.email_subject,
-            message=reminder.email_content,
+            body=reminder.email_content,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            fail_silently=False,
+            to=recipient_list,
         )
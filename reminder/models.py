@@ -7,6 +7,8 @@ from core.utils import today, tomorrow
 from core.validators import (validate_comma_seperated_date_string,
                              validate_semicolon_seperated_email_string)
 
+from . import schedule
+
 
 class Reminder(models.Model):
     POLICY = [
@@ -43,12 +45,26 @@ class Reminder(models.Model):
         validators=[validate_semicolon_seperated_email_string],
     )
     created_by = models.ForeignKey(verbose_name=_('Created by'), to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    next_fire_at = models.DateTimeField(verbose_name=_('Next fire at'), blank=True, null=True, db_index=True, editable=False)
 
     class Meta:
         ordering = ['-id']
         verbose_name = _('Reminder')
         verbose_name_plural = _('Reminders')
 
+    def save(self, *args, **kwargs):
+        self.next_fire_at = schedule.get_next_fire_at(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'next_fire_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'next_fire_at']
+        super().save(*args, **kwargs)
+
+    def get_occurrences(self, count=5, after=None):
+        """
+        Return the next `count` occurrences, e.g. for previews.
+        """
+        return schedule.get_occurrences(self, count=count, after=after)
+
     def get_create_url(self):
         return reverse('reminder:reminder_create')
 
@@ -63,3 +79,29 @@ class Reminder(models.Model):
 
     def get_send_email_url(self):
         return reverse('reminder:reminder_send_email', kwargs={'pk': self.pk})
+
+
+class ReminderDelivery(models.Model):
+    """
+    The send ledger of the reminders, one row per occurrence.
+    """
+    STATUS = [
+        ('pending', _('Pending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+    reminder = models.ForeignKey(Reminder, on_delete=models.CASCADE, related_name='deliveries', verbose_name=_('Reminder'))
+    occurrence = models.DateTimeField(verbose_name=_('Occurrence'))
+    status = models.CharField(verbose_name=_('Status'), max_length=15, choices=STATUS, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=0)
+    error = models.TextField(verbose_name=_('Error'), blank=True)
+    sent_at = models.DateTimeField(verbose_name=_('Sent at'), blank=True, null=True)
+
+    class Meta:
+        unique_together = ('reminder', 'occurrence')
+        ordering = ['-occurrence', '-id']
+        verbose_name = _('Reminder Delivery')
+        verbose_name_plural = _('Reminder Deliveries')
+
+    def __str__(self):
+        return f'{self.reminder.event} at {self.occurrence}: {self.status}'
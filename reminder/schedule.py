@@ -0,0 +1,142 @@
+"""
+The occurrences of the reminders.
+
+- `hourly`: every hour on the hour, from `start_at` to `end_at` (excluded).
+- `daily`, `on weekdays`, `every <weekday>`: at `FIRE_TIME` of the matching dates from
+  `start_at` to `end_at` (excluded). `on weekdays` follows the business calendar of `day`.
+- `once`: at `FIRE_TIME` of `start_at`, or at the next `FIRE_TIME` if that has passed.
+  The scheduler retires it after it is sent.
+- `specified dates`: at `FIRE_TIME` of every specified date.
+"""
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from core import versions
+from core.utils import now
+from day import calendar
+
+FIRE_TIME = time(9, 0)
+
+WEEKDAY_POLICIES = {
+    'every monday': 0,
+    'every tuesday': 1,
+    'every wednesday': 2,
+    'every thursday': 3,
+    'every friday': 4,
+    'every saturday': 5,
+    'every sunday': 6,
+}
+
+
+def get_fire_datetime(date, fire_time=FIRE_TIME):
+    return timezone.make_aware(datetime.combine(date, fire_time))
+
+
+def parse_specified_dates(specified_dates):
+    """
+    Return a sorted list of the distinct dates of a comma seperated date string.
+    """
+    dates = set()
+    for s in specified_dates.split(','):
+        s = s.strip()
+        if s:
+            dates.add(datetime.strptime(s, '%Y-%m-%d').date())
+    return sorted(dates)
+
+
+def match_date(policy, date, business_calendar=None):
+    if policy == 'daily':
+        return True
+    if policy == 'on weekdays':
+        return (business_calendar or calendar.get_calendar()).is_workday(date)
+    return date.weekday() == WEEKDAY_POLICIES[policy]
+
+
+def iter_occurrences(reminder, after):
+    """
+    Yield the occurrences of `reminder` after `after` (excluded), in order.
+    """
+    after = timezone.localtime(after)
+    policy = reminder.policy
+    if policy == 'specified dates':
+        for date in parse_specified_dates(reminder.specified_dates):
+            fire_at = get_fire_datetime(date)
+            if fire_at > after:
+                yield fire_at
+        return
+    if not reminder.start_at:
+        return
+    if policy == 'once':
+        fire_at = get_fire_datetime(reminder.start_at)
+        if fire_at <= after:
+            date = after.date() if after.time() < FIRE_TIME else after.date() + timedelta(days=1)
+            fire_at = get_fire_datetime(date)
+        yield fire_at
+        return
+    if not reminder.end_at:
+        return
+    end = get_fire_datetime(reminder.end_at, time(0))
+    if policy == 'hourly':
+        fire_at = max(get_fire_datetime(reminder.start_at, time(0)), after.replace(minute=0, second=0, microsecond=0))
+        while fire_at < end:
+            if fire_at > after:
+                yield fire_at
+            # Step in UTC so that the hours stay distinct around DST changes.
+            fire_at = timezone.localtime(fire_at + timedelta(hours=1))
+        return
+    if policy != 'daily' and policy != 'on weekdays' and policy not in WEEKDAY_POLICIES:
+        return
+    # Resolved once, not for every date.
+    business_calendar = calendar.get_calendar() if policy == 'on weekdays' else None
+    date = max(reminder.start_at, after.date())
+    while date < reminder.end_at:
+        fire_at = get_fire_datetime(date)
+        if fire_at > after and match_date(policy, date, business_calendar):
+            yield fire_at
+        date += timedelta(days=1)
+
+
+def get_occurrences(reminder, count=5, after=None):
+    """
+    Return the next `count` occurrences of `reminder`, e.g. for previews.
+    """
+    return list(islice(iter_occurrences(reminder, after or now()), count))
+
+
+def get_next_fire_at(reminder, after=None):
+    """
+    Return the next occurrence of an active `reminder`, or None.
+    """
+    if not reminder.is_active:
+        return None
+    return next(iter_occurrences(reminder, after or now()), None)
+
+
+def is_occurrence(reminder, fire_at):
+    return next(iter_occurrences(reminder, fire_at - timedelta(microseconds=1)), None) == fire_at
+
+
+def rebuild_next_fire_at(queryset, after=None, batch_size=500):
+    """
+    Recompute `next_fire_at` of the reminders of `queryset`. Return the number of changed ones.
+    """
+    after = after or now()
+    changed = []
+    count = 0
+    # The business calendar is checked once for all the reminders.
+    with versions.snapshot():
+        for reminder in queryset.iterator(chunk_size=batch_size):
+            next_fire_at = get_next_fire_at(reminder, after=after)
+            if next_fire_at != reminder.next_fire_at:
+                reminder.next_fire_at = next_fire_at
+                changed.append(reminder)
+            if len(changed) >= batch_size:
+                queryset.model.objects.bulk_update(changed, ['next_fire_at'])
+                count += len(changed)
+                changed = []
+    if changed:
+        queryset.model.objects.bulk_update(changed, ['next_fire_at'])
+        count += len(changed)
+    return count
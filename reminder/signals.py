@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from day.models import Day
+
+from . import schedule
+from .models import Reminder
+
+
+@receiver(post_save, sender=Day, dispatch_uid='rebuild_reminder_schedule_on_day_save')
+@receiver(post_delete, sender=Day, dispatch_uid='rebuild_reminder_schedule_on_day_delete')
+def rebuild_reminder_schedule(sender, instance, **kwargs):
+    """
+    The occurrences of `on weekdays` follow the business calendar, which `day` has just invalidated.
+    """
+    schedule.rebuild_next_fire_at(Reminder.objects.filter(is_active=True, policy='on weekdays'))
@@ -1,3 +1,155 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import versions
+from day import calendar
+from day.models import Day
+
+from . import schedule
+from .models import Reminder, ReminderDelivery
+
+User = get_user_model()
+
+
+def aware(*args):
+    return timezone.make_aware(datetime.datetime(*args))
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ReminderScheduleTestCase(TestCase):
+
+    def setUp(self):
+        calendar.invalidate()
+        self.user = User.objects.create_user(username='user')
+        # 2024-01-01 is a Monday.
+        Day.objects.create(date=datetime.date(2024, 1, 2), is_holiday=True)
+
+    def create_reminder(self, policy, start_at=datetime.date(2024, 1, 1), end_at=datetime.date(2024, 1, 8), **kwargs):
+        with mock.patch('reminder.schedule.now', return_value=aware(2024, 1, 1, 0, 0)):
+            return Reminder.objects.create(
+                policy=policy, start_at=start_at, end_at=end_at, event='event', email_subject='subject',
+                recipients='a@example.com;', created_by=self.user, **kwargs,
+            )
+
+    def tick(self, *args, force=False):
+        with mock.patch('reminder.management.commands.sendreminderemail.now', return_value=aware(*args)):
+            call_command('sendreminderemail', force=force)
+
+    def test_occurrences(self):
+        after = aware(2024, 1, 1, 0, 0)
+        cases = [
+            ('daily', {}, [(2024, 1, d, 9) for d in range(1, 8)]),
+            ('on weekdays', {}, [(2024, 1, 1, 9), (2024, 1, 3, 9), (2024, 1, 4, 9), (2024, 1, 5, 9)]),
+            ('every sunday', {}, [(2024, 1, 7, 9)]),
+            ('once', {}, [(2024, 1, 1, 9)]),
+            ('specified dates', {'specified_dates': '2024-01-05, 2024-01-03,2024-01-05,'}, [(2024, 1, 3, 9), (2024, 1, 5, 9)]),
+        ]
+        for policy, kwargs, expected in cases:
+            with self.subTest(policy=policy):
+                reminder = self.create_reminder(policy, **kwargs)
+                self.assertEqual(reminder.get_occurrences(count=10, after=after), [aware(*args) for args in expected])
+        hourly = self.create_reminder('hourly', end_at=datetime.date(2024, 1, 2))
+        self.assertEqual(hourly.get_occurrences(count=30, after=after), [aware(2024, 1, 1, h) for h in range(1, 24)])
+
+    def test_calendar_version_is_read_once(self):
+        reminder = self.create_reminder('on weekdays', end_at=datetime.date(2024, 2, 1))
+        after = aware(2024, 1, 1, 0, 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(reminder.get_occurrences(count=5, after=after)), 5)
+        with versions.snapshot():
+            reminder.get_occurrences(after=after)
+            with self.assertNumQueries(0):
+                for i in range(3):
+                    reminder.get_occurrences(after=after)
+                    schedule.is_occurrence(reminder, aware(2024, 1, 3, 9))
+
+    def test_next_fire_at_is_kept_on_save(self):
+        reminder = self.create_reminder('on weekdays')
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 1, 9))
+        reminder.is_active = False
+        reminder.save()
+        self.assertIsNone(reminder.next_fire_at)
+        self.assertIsNone(self.create_reminder('daily', end_at=None).next_fire_at)
+
+    def test_tick_sends_due_reminders_once(self):
+        daily = self.create_reminder('daily')
+        once = self.create_reminder('once')
+        weekdays = self.create_reminder('on weekdays')
+        self.create_reminder('every friday')
+        self.tick(2024, 1, 1, 9, 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(ReminderDelivery.objects.filter(status='sent', occurrence=aware(2024, 1, 1, 9)).count(), 3)
+        # A rerun in the same hour is a single query.
+        with self.assertNumQueries(1):
+            self.tick(2024, 1, 1, 9, 30)
+        self.assertEqual(len(mail.outbox), 3)
+        daily.refresh_from_db()
+        once.refresh_from_db()
+        weekdays.refresh_from_db()
+        self.assertEqual(daily.next_fire_at, aware(2024, 1, 2, 9))
+        self.assertIsNone(once.next_fire_at)
+        self.assertFalse(once.is_active)
+        self.assertEqual(weekdays.next_fire_at, aware(2024, 1, 3, 9))
+        # 2024-01-02 is a holiday.
+        self.tick(2024, 1, 2, 9, 0)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_tick_force(self):
+        self.create_reminder('daily')
+        self.tick(2024, 1, 1, 8, 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.tick(2024, 1, 1, 8, 0, force=True)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_day_change_rebuilds_on_weekdays(self):
+        reminder = self.create_reminder('on weekdays', start_at=datetime.date(2024, 1, 2))
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 3, 9))
+        with mock.patch('reminder.schedule.now', return_value=aware(2024, 1, 1, 0, 0)):
+            Day.objects.filter(date=datetime.date(2024, 1, 2)).delete()
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 2, 9))
+
+    def test_stale_next_fire_at_is_only_advanced(self):
+        reminder = self.create_reminder('every friday')
+        Reminder.objects.filter(pk=reminder.pk).update(next_fire_at=aware(2024, 1, 1, 9))
+        self.tick(2024, 1, 1, 9, 0)
+        self.assertEqual(len(mail.outbox), 0)
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 5, 9))
+        self.assertEqual(schedule.rebuild_next_fire_at(Reminder.objects.all(), after=aware(2024, 1, 1, 0, 0)), 0)
+
+    def test_occurrence_is_sent_once(self):
+        reminder = self.create_reminder('daily')
+        ReminderDelivery.objects.create(reminder=reminder, occurrence=aware(2024, 1, 1, 9), status='sent')
+        self.tick(2024, 1, 1, 9, 0)
+        self.assertEqual(len(mail.outbox), 0)
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 2, 9))
+
+    def test_retire_after_last_occurrence(self):
+        reminder = self.create_reminder('daily', end_at=datetime.date(2024, 1, 2))
+        self.tick(2024, 1, 1, 9, 0)
+        reminder.refresh_from_db()
+        self.assertFalse(reminder.is_active)
+        self.assertIsNone(reminder.next_fire_at)
+
+    def test_failed_delivery_is_retried(self):
+        reminder = self.create_reminder('daily')
+        send_mail = mock.patch('reminder.management.commands.sendreminderemail.send_mail', side_effect=OSError('down'))
+        with send_mail, self.assertLogs('reminder.management.commands.sendreminderemail', 'ERROR'):
+            for _ in range(2):
+                self.tick(2024, 1, 1, 9, 0)
+                reminder.refresh_from_db()
+                self.assertEqual(reminder.next_fire_at, aware(2024, 1, 1, 9))
+            # Give up after `MAX_ATTEMPTS`.
+            self.tick(2024, 1, 1, 9, 0)
+        delivery = ReminderDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.error), ('failed', 3, 'down'))
+        reminder.refresh_from_db()
+        self.assertEqual(reminder.next_fire_at, aware(2024, 1, 2, 9))
@@ -1,13 +1,15 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 import urllib.parse
 
+from accounts.perms import prefetch_obj_perms
+from accounts.visibility import SCOPE_DEPARTMENTS, filter_visible
+from core import outbox
 from core.decorators import permission_required
+from core.pagination import get_keyset_page
 from core.utils import remove_unnecessary_seperator
 
 from .forms import ReminderModelForm
@@ -22,33 +24,25 @@ def get_reminder_queryset(request):
     """
     model = Reminder
     queryset = model.objects.all()
-    role = request.user.profile.activated_role
-    deps = request.user.groups.filter(groupprofile__is_department=True)
-    if not role:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    supervise_roles = role.groupprofile.supervise_roles.all()
-    if not supervise_roles:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    return queryset.filter(created_by__groups__in=supervise_roles).distinct()
+    return filter_visible(queryset, request.user, fallback=SCOPE_DEPARTMENTS)
 
 
 @login_required
 @permission_required('reminder.view_reminder', raise_exception=True, exception=Http404)
 def reminder_list(request):
     model = Reminder
-    queryset = get_reminder_queryset(request)
+    queryset = get_reminder_queryset(request).select_related('created_by')
     paginate_by = 5
     template_name = 'reminder/reminder_list.html'
     create_by = request.GET.get('created_by')
     queryset = queryset.filter(created_by=request.user) if create_by else queryset
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
         'create_by': create_by,
     }
@@ -157,12 +151,12 @@ def reminder_send_email(request, pk):
     if request.method == 'POST':
         s = remove_unnecessary_seperator(instance.recipients, ';')
         recipient_list = list(map(str.strip, s.split(';')))
-        send_mail(
+        outbox.enqueue(
             subject=instance.email_subject,
-            message=instance.email_content,
+            body=instance.email_content,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            fail_silently=False,
+            to=recipient_list,
+            priority=outbox.HIGH,
         )
         if create_by:
             success_url += f'?created_by={create_by}'
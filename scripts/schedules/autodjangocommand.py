@@ -35,6 +35,15 @@ def calld_django_check_news_signatures():
     os.system(cmd)
 
 
+def calld_django_deliver_outbox():
+    time_string = time.strftime('%Y%m%d%H%M%S')
+    print(time_string)
+    print('start deliver_outbox..')
+    cmd = f'{PYTHONPATH_ABS} {REPO_ROOT}\\manage.py deliver_outbox'
+    os.system(cmd)
+
+
 # calld_django_send_diary_user_email()
 calld_django_send_reminder_email()
 calld_django_check_news_signatures()
+calld_django_deliver_outbox()
@@ -17,4 +17,8 @@ $PYTHON_BIN $MANAGE_PY sendreminderemail
 echo "start check_news_signatures.."
 $PYTHON_BIN $MANAGE_PY check_news_signatures
 
+# 寄件匣平時由 deliver_outbox --loop 常駐寄送，此處補送遺留的信件
+echo "start deliver_outbox.."
+$PYTHON_BIN $MANAGE_PY deliver_outbox
+
 echo "排程執行結束。"
\ No newline at end of file
@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import Isp, IspGroup, PrefixListUpdateTask, Archive
+from .models import Isp, IspGroup, PrefixListUpdateTask, PrefixListUpdateTaskMail, Archive
 
 admin.site.register(Isp)
 admin.site.register(IspGroup)
 admin.site.register(PrefixListUpdateTask)
+admin.site.register(PrefixListUpdateTaskMail)
 admin.site.register(Archive)
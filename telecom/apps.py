@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TelecomConfig(AppConfig):
     name = 'telecom'
+
+    def ready(self):
+        import telecom.signals  # noqa
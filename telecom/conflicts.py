@@ -0,0 +1,94 @@
+"""
+The conflicts of the prefix-lists of a `PrefixListUpdateTask` with the other tasks and the ISP sessions.
+
+The prefix-lists of the task are compiled into a `PrefixTrie` once, then the prefix-lists of
+the other tasks and the session IPs of the ISPs are streamed and looked up in it, so the cost
+grows with the entries of the history times the prefix length, not times the size of the task.
+
+- `duplicate`: the same entry is in another task of the same update type.
+- `covered`: the entry is covered by an entry of another task of the same update type.
+- `conflict`: the entry overlaps an entry of a task of the other update type. The same entry
+  is not a conflict, as deleting what was added, or adding back what was deleted, is routine.
+- `session`: the network of the entry contains, or is inside, a session IP of an ISP.
+"""
+from collections import namedtuple
+
+from django.utils.translation import gettext_lazy as _
+
+from core.prefixes import PrefixTrie, parse_prefix_list
+
+from .models import Isp, PrefixListUpdateTask
+
+KINDS = {
+    "duplicate": _("Duplicate"),
+    "covered": _("Covered"),
+    "conflict": _("Overlaps the opposite operation"),
+    "session": _("Covers an ISP session IP"),
+}
+MAX_CONFLICTS = 200
+
+# `prefix` is the entry of the task, `other` the one it conflicts with, in the object `label`.
+Conflict = namedtuple("Conflict", ["kind", "prefix", "other", "label"])
+
+
+def compile_task(ipv4_prefix_list, ipv6_prefix_list):
+    trie = PrefixTrie()
+    for prefix in parse_prefix_list(f"{ipv4_prefix_list},{ipv6_prefix_list}", ignore_invalid=True):
+        trie.add(prefix)
+    return trie
+
+
+def iter_task_conflicts(trie, update_type, exclude_pks=()):
+    update_types = dict(PrefixListUpdateTask._meta.get_field("update_type").choices)
+    queryset = PrefixListUpdateTask.objects.order_by("-id").values_list(
+        "pk", "update_type", "ipv4_prefix_list", "ipv6_prefix_list"
+    )
+    if exclude_pks:
+        queryset = queryset.exclude(pk__in=exclude_pks)
+    for pk, other_update_type, ipv4_prefix_list, ipv6_prefix_list in queryset.iterator():
+        label = f"#{pk} {update_types.get(other_update_type, other_update_type)}"
+        for other in parse_prefix_list(f"{ipv4_prefix_list},{ipv6_prefix_list}", ignore_invalid=True):
+            if other_update_type != update_type:
+                for prefix, _ in trie.overlapping(other):
+                    if prefix != other:
+                        yield Conflict("conflict", prefix, other, label)
+                continue
+            for prefix, _ in trie.covered(other):
+                yield Conflict("duplicate" if prefix == other else "covered", prefix, other, label)
+
+
+def iter_session_conflicts(trie):
+    queryset = Isp.objects.order_by("id").values_list("name", "upstream_session_ip", "chief_session_ip")
+    for name, upstream_session_ip, chief_session_ip in queryset.iterator():
+        for other in parse_prefix_list(f"{upstream_session_ip},{chief_session_ip}", ignore_invalid=True):
+            for prefix, _ in trie.intersecting(other):
+                yield Conflict("session", prefix, other, name)
+
+
+def find_conflicts(update_type, ipv4_prefix_list, ipv6_prefix_list, exclude_pks=(), limit=MAX_CONFLICTS):
+    """
+    Return the first `limit` `Conflict` of the prefix-lists of a task of `update_type`, ignoring the tasks of `exclude_pks`.
+    """
+    trie = compile_task(ipv4_prefix_list, ipv6_prefix_list)
+    if not len(trie):
+        return []
+    conflicts = []
+    for iterator in (iter_session_conflicts(trie), iter_task_conflicts(trie, update_type, exclude_pks)):
+        for conflict in iterator:
+            conflicts.append(conflict)
+            if len(conflicts) >= limit:
+                return conflicts
+    return conflicts
+
+
+def group_conflicts(conflicts):
+    """
+    Return [{"kind": kind label, "label": label, "prefixes": [(prefix, other)]}] of `conflicts` grouped by kind and label.
+    """
+    groups = {}
+    for conflict in conflicts:
+        key = (conflict.kind, conflict.label)
+        if key not in groups:
+            groups[key] = {"kind": KINDS[conflict.kind], "label": conflict.label, "prefixes": []}
+        groups[key]["prefixes"].append((str(conflict.prefix), str(conflict.other)))
+    return list(groups.values())
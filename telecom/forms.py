@@ -1,6 +1,7 @@
 from django import forms
 from django.utils.translation import gettext_lazy as _
 
+from .conflicts import find_conflicts, group_conflicts
 from .models import Isp, IspGroup, PrefixListUpdateTask, Archive
 
 
@@ -196,6 +197,25 @@ class PrefixListUpdateTaskModelForm(forms.ModelForm):
         model = PrefixListUpdateTask
         exclude = ["created_by", "meil_sended_time"]
 
+    def __init__(self, *args, conflict_exclude_pks=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # The tasks not checked for conflicts besides this one, e.g. the source of a clone.
+        self.conflict_exclude_pks = [pk for pk in [self.instance.pk, *conflict_exclude_pks] if pk is not None]
+        self.conflicts = []
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+        # Only a warning, the task is saved anyway.
+        self.conflicts = group_conflicts(find_conflicts(
+            cleaned_data.get("update_type"),
+            cleaned_data.get("ipv4_prefix_list") or "",
+            cleaned_data.get("ipv6_prefix_list") or "",
+            exclude_pks=self.conflict_exclude_pks,
+        ))
+        return cleaned_data
+
 
 class ArchiveModelForm(forms.ModelForm):
     class Meta:
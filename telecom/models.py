@@ -4,7 +4,9 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import EmailValidator
 
-from core.utils import today
+from core.prefixes import aggregate, parse_prefix_list
+from core.storage import ContentAddressedStorage
+from core.utils import now, today
 import os
 
 from core.validators import (
@@ -12,15 +14,13 @@ from core.validators import (
     validate_semicolon_seperated_email_string,
 )
 
-from .storage import UUIDFileSystemStorage
-
-uuid_file_system_storage = UUIDFileSystemStorage()
+content_storage = ContentAddressedStorage()
 
 
 class File(models.Model):
     name = models.CharField(verbose_name=_("Name"), max_length=255)
     file = models.FileField(
-        storage=uuid_file_system_storage,
+        storage=content_storage,
         upload_to="telecom",
     )
 
@@ -171,6 +171,13 @@ class PrefixListUpdateTask(models.Model):
             validate_comma_separated_prefix_list_string,
         ],
     )
+    aggregate_prefixes = models.BooleanField(
+        verbose_name=_("Aggregate prefixes"),
+        help_text=_(
+            "Merge the adjacent prefixes and drop the covered ones in the notification mails."
+        ),
+        default=False,
+    )
     subject_warning = models.CharField(
         verbose_name=_("Subject warning"), max_length=63, blank=True
     )
@@ -214,6 +221,47 @@ class PrefixListUpdateTask(models.Model):
         verbose_name = _("Prefix-list update task")
         verbose_name_plural = _("Prefix-list update tasks")
 
+    def get_prefix_contents(self):
+        """
+        Return the lines of the IPv4 and the IPv6 prefix-lists in the notification mails.
+        """
+        ipv4_contents = self.ipv4_prefix_list.split(",\r\n")
+        ipv6_contents = self.ipv6_prefix_list.split(",\r\n")
+        if not self.aggregate_prefixes:
+            return ipv4_contents, ipv6_contents
+        return (
+            self.aggregate_prefix_list(self.ipv4_prefix_list, ipv4_contents),
+            self.aggregate_prefix_list(self.ipv6_prefix_list, ipv6_contents),
+        )
+
+    @staticmethod
+    def aggregate_prefix_list(value, contents):
+        try:
+            prefixes = parse_prefix_list(value)
+        except ValueError:
+            # An invalid entry is sent as entered rather than dropped.
+            return contents
+        return [str(prefix) for prefix in aggregate(prefixes)] if prefixes else contents
+
+    def get_prefix_aggregation(self):
+        """
+        Return [(name, before, after, removed, added)] of the prefix-lists changed by the aggregation.
+        """
+        if not self.aggregate_prefixes:
+            return []
+        changes = []
+        for name, value, after in zip(("IPv4", "IPv6"), (self.ipv4_prefix_list, self.ipv6_prefix_list), self.get_prefix_contents()):
+            try:
+                before = [str(prefix) for prefix in parse_prefix_list(value)]
+            except ValueError:
+                continue
+            before_lines, after_lines = set(before), set(after)
+            removed = [line for line in before if line not in after_lines]
+            added = [line for line in after if line not in before_lines]
+            if removed or added:
+                changes.append((name, before, after, removed, added))
+        return changes
+
     def get_create_url(self):
         return reverse("telecom:prefixlistupdatetask_create")
 
@@ -226,6 +274,9 @@ class PrefixListUpdateTask(models.Model):
     def get_clone_url(self):
         return reverse("telecom:prefixlistupdatetask_clone", kwargs={"pk": self.pk})
 
+    def mail_status_url(self):
+        return reverse("telecom:prefixlistupdatetask_mailstatus", kwargs={"pk": self.pk})
+
     def preview_mail_content_url(self):
         return reverse(
             "telecom:prefixlistupdatetask_previewmailcontent", kwargs={"pk": self.pk}
@@ -261,8 +312,38 @@ class ExtraFileTaskFileISP(models.Model):
     isp = models.ForeignKey(to="telecom.Isp", on_delete=models.CASCADE)
 
 
+class PrefixListUpdateTaskMail(models.Model):
+    """
+    The notification mail of a task to an ISP, one per ISP for every sending of the task.
+    """
+
+    STATUS = [
+        ("queued", _("Queued")),
+        ("sent", _("Sent")),
+        ("failed", _("Failed")),
+        ("skipped", _("Skipped")),
+    ]
+    task = models.ForeignKey(
+        to="telecom.PrefixListUpdateTask", on_delete=models.CASCADE, related_name="mails"
+    )
+    isp = models.ForeignKey(to="telecom.Isp", on_delete=models.CASCADE)
+    # The mails sent together share a batch.
+    batch = models.CharField(max_length=32, db_index=True)
+    status = models.CharField(
+        verbose_name=_("Status"), max_length=15, choices=STATUS, default="queued"
+    )
+    detail = models.CharField(verbose_name=_("Detail"), max_length=255, blank=True)
+    outbox_message = models.ForeignKey(
+        to="core.OutboxMessage", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    created_at = models.DateTimeField(verbose_name=_("Created at"), default=now)
+
+    class Meta:
+        ordering = ["id"]
+
+
 class Archive(models.Model):
-    archive = models.FileField(storage=uuid_file_system_storage, upload_to="telecom")
+    archive = models.FileField(storage=content_storage, upload_to="telecom")
     name = models.CharField(max_length=255)
     type = models.CharField(max_length=255)
     date = models.DateField(verbose_name=_("Date"), default=today)
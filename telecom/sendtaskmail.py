@@ -1,8 +1,26 @@
-import mimetypes
+import os
+from collections import Counter, defaultdict
+from datetime import datetime
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives, get_connection
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Max
 from django.utils.html import strip_tags
-from email.header import Header
+
+from core import attachments, outbox
+from core.mail import send_messages
+
+from .models import (
+    ExtraFileTaskFileISP,
+    LoaTaskFileISP,
+    PrefixListUpdateTask,
+    PrefixListUpdateTaskMail,
+    RoaTaskFileISP,
+)
+
+# {outbox status: mail status} of the finished outbox mails.
+OUTBOX_STATUS = {"sent": "sent", "dead": "failed"}
+
 
 def send_mail(
     subject,
@@ -18,12 +36,15 @@ def send_mail(
     html_message=None,
     attach_file=None,
 ):
+    # Only a connection opened here for other credentials is closed here, the pooled one is kept open.
+    own_connection = None
     try:
-        connection = connection or get_connection(
-            username=auth_user,
-            password=auth_password,
-            fail_silently=fail_silently,
-        )
+        if connection is None and (auth_user or auth_password):
+            connection = own_connection = get_connection(
+                username=auth_user,
+                password=auth_password,
+                fail_silently=fail_silently,
+            )
         mail = EmailMultiAlternatives(
             subject,
             message,
@@ -37,14 +58,10 @@ def send_mail(
             mail.attach_alternative(html_message, "text/html")
         if attach_file:
             for filepath, filename in attach_file:
-                with open(filepath, 'rb') as file:
-                    content = file.read()
-                    mime_type, _ = mimetypes.guess_type(filepath)
-                    if mime_type is None:
-                        mime_type = 'application/octet-stream'
-                    encoded_filename = Header(filename, 'utf-8').encode()
-                    mail.attach(encoded_filename, content, mime_type)
+                attachments.attach(mail, filepath, filename)
 
+        if connection is None:
+            return send_messages([mail])
         return mail.send()
     except Exception as e:
         print(f"Error sendingemail: {e}")
@@ -52,8 +69,8 @@ def send_mail(
             raise
         return False
     finally:
-        if connection:
-            connection.close()
+        if own_connection:
+            own_connection.close()
 
 
 def handle_task_mail(isp, task, mail_content, attach_file=None, debug=settings.DEBUG):
@@ -85,24 +102,96 @@ def handle_task_mail(isp, task, mail_content, attach_file=None, debug=settings.D
             print("Email:")
             print(email_subject)
 
-        success = send_mail(
+        # Queued in the outbox and sent by `deliver_outbox`. In a savepoint, so a failure leaves
+        # the transaction of the caller usable to record it.
+        with transaction.atomic():
+            outbox_message = outbox.enqueue(
                 email_subject,
                 email_content,
                 from_email=settings.I01_FROM_MAIL,
-                recipient_list=recipient_list,
+                to=recipient_list,
                 bcc=recipient_bcc_list,
                 cc=recipient_cc_list,
-                html_message=mail_content,
-                fail_silently=False,
-                attach_file=attach_file,
+                html_body=mail_content,
+                attachments=attach_file,
             )
-
-        if success:
-            print(f"Successfully sent email to {isp.to}")
-            return True
-        else:
-            print(f"Failed to send email to {isp.to}")
-            return False
+        return outbox_message
     except Exception as e:
         print(f"Error in handle_task_mail for {isp.to}: {e}")
-        return False
+        return None
+
+
+def get_task_attachments(task):
+    """
+    Return {isp id: [(path, filename)]} of the ROA, LOA and extra files of `task`, in one query per kind.
+    """
+    attachments = defaultdict(list)
+    for model in (RoaTaskFileISP, LoaTaskFileISP, ExtraFileTaskFileISP):
+        for taskfileisp in model.objects.filter(task=task).select_related("file").order_by("id"):
+            file = taskfileisp.file
+            attachments[taskfileisp.isp_id].append(
+                (os.path.join(settings.MEDIA_ROOT, str(file.file)), str(file.name))
+            )
+    return attachments
+
+
+def get_sended_time():
+    return datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+
+
+def complete_batches(batches):
+    """
+    Set the mail sended time of the tasks of `batches`, {batch: task id}, whose mails are all finished.
+    """
+    queued = set(
+        PrefixListUpdateTaskMail.objects.filter(batch__in=batches, status="queued").values_list("batch", flat=True)
+    )
+    task_ids = [task_id for batch, task_id in batches.items() if batch not in queued]
+    if task_ids:
+        PrefixListUpdateTask.objects.filter(pk__in=task_ids).update(meil_sended_time=get_sended_time())
+
+
+def update_task_mails(outbox_message):
+    """
+    Record the result of `outbox_message` on its task mails.
+    """
+    status = OUTBOX_STATUS.get(outbox_message.status)
+    if status is None:
+        return
+    mails = list(PrefixListUpdateTaskMail.objects.filter(outbox_message=outbox_message, status="queued"))
+    if not mails:
+        return
+    PrefixListUpdateTaskMail.objects.filter(pk__in=[mail.pk for mail in mails]).update(
+        status=status, detail=outbox_message.last_error[:255] if status == "failed" else ""
+    )
+    complete_batches({mail.batch: mail.task_id for mail in mails})
+
+
+def summarize_mails(mails):
+    """
+    Return the summary of `mails`, the task mails of a batch.
+    """
+    counts = Counter(mail.status for mail in mails)
+    labels = dict(PrefixListUpdateTaskMail.STATUS)
+    return {
+        "counts": dict(counts),
+        "complete": not counts["queued"],
+        "summary": " / ".join(f"{labels[status]} {counts[status]}" for status, _ in PrefixListUpdateTaskMail.STATUS if counts[status]),
+    }
+
+
+def get_latest_mails(task_ids):
+    """
+    Return {task id: [task mail]} of the latest batches of the tasks.
+    """
+    latest_ids = (
+        PrefixListUpdateTaskMail.objects.filter(task_id__in=task_ids)
+        .values("task_id")
+        .annotate(latest_id=Max("id"))
+        .values("latest_id")
+    )
+    batches = PrefixListUpdateTaskMail.objects.filter(pk__in=latest_ids).values("batch")
+    mails = defaultdict(list)
+    for mail in PrefixListUpdateTaskMail.objects.filter(batch__in=batches).select_related("isp").order_by("id"):
+        mails[mail.task_id].append(mail)
+    return dict(mails)
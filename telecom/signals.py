@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.models import OutboxMessage
+
+from .sendtaskmail import update_task_mails
+
+
+@receiver(post_save, sender=OutboxMessage, dispatch_uid="update_task_mails_on_outbox_message_save")
+def update_task_mails_on_delivery(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "status" not in update_fields):
+        return
+    update_task_mails(instance)
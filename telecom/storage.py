@@ -4,6 +4,7 @@ import uuid
 from django.core.files.storage import FileSystemStorage
 
 
+# Replaced by core.storage.ContentAddressedStorage, kept for the migrations which refer to it.
 class UUIDFileSystemStorage(FileSystemStorage):
 
     def generate_filename(self, filename):
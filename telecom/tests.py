@@ -0,0 +1,215 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import outbox
+from core.models import OutboxMessage
+
+from .conflicts import find_conflicts
+from .models import File, Isp, PrefixListUpdateTask, PrefixListUpdateTaskMail, RoaTaskFileISP
+
+User = get_user_model()
+
+
+class PrefixListConflictTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user")
+        department = Group.objects.create(name="I01")
+        department.groupprofile.is_department = True
+        department.groupprofile.save()
+        self.user.groups.add(department)
+        self.user.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label="telecom", codename__in=["add_prefixlistupdatetask", "view_prefixlistupdatetask"]
+        ))
+        self.client.force_login(self.user)
+        Isp.objects.create(
+            name="ISP", cname="ISP", upstream_as="AS1", primary_contact="contact", to="isp@example.com",
+            ip_version="ipv4", upstream_session_ip="203.0.113.1/32", chief_session_ip="203.0.113.2/32",
+            created_by=self.user,
+        )
+        self.added = self.create_task("add prefix-list", "192.0.2.0/24,\r\n198.51.100.0/22 le 24", "2001:db8::/32 le 48")
+        self.deleted = self.create_task("delete prefix-list", "100.64.0.0/16", "")
+
+    def create_task(self, update_type, ipv4_prefix_list, ipv6_prefix_list):
+        return PrefixListUpdateTask.objects.create(
+            update_type=update_type, origin_as="AS2", as_path="AS2", created_by=self.user,
+            ipv4_prefix_list=ipv4_prefix_list, ipv6_prefix_list=ipv6_prefix_list,
+        )
+
+    def test_find_conflicts(self):
+        conflicts = find_conflicts(
+            "add prefix-list",
+            "192.0.2.0/24,\r\n198.51.101.0/24,\r\n100.64.1.0/24,\r\n203.0.113.0/24,\r\n10.0.0.0/8",
+            "2001:db8:1::/48",
+        )
+        found = {(conflict.kind, str(conflict.prefix)) for conflict in conflicts}
+        self.assertEqual(found, {
+            ("duplicate", "192.0.2.0/24"),
+            ("covered", "198.51.101.0/24"),
+            ("covered", "2001:db8:1::/48"),
+            ("session", "203.0.113.0/24"),
+        })
+        # Routes of 100.64.1.0/24 are not matched by 100.64.0.0/16 without le.
+        conflicts = find_conflicts("add prefix-list", "100.64.0.0/16 le 24", "")
+        self.assertEqual([(conflict.kind, conflict.label.split()[0]) for conflict in conflicts], [("conflict", f"#{self.deleted.pk}")])
+        # A task does not conflict with itself.
+        self.assertEqual(find_conflicts("add prefix-list", self.added.ipv4_prefix_list, "", exclude_pks=[self.added.pk]), [])
+        # Deleting the entries added by a task is not a conflict.
+        self.assertEqual(find_conflicts("delete prefix-list", "192.0.2.0/24", ""), [])
+
+    def test_form_warning(self):
+        url = reverse("telecom:prefixlistupdatetask_create")
+        data = {
+            "update_type": "add prefix-list",
+            "origin_as": "AS2",
+            "as_path": "AS2",
+            "ipv4_prefix_list": "192.0.2.0/24",
+            "ipv6_prefix_list": "",
+        }
+        # The conflicts do not block saving, they are shown on the task list.
+        response = self.client.post(url, data, follow=True)
+        self.assertRedirects(response, reverse("telecom:prefixlistupdatetask_list"))
+        self.assertEqual(PrefixListUpdateTask.objects.count(), 3)
+        warnings = [str(message) for message in response.context["messages"]]
+        self.assertEqual(len(warnings), 1)
+        self.assertIn(f"#{self.added.pk} ", warnings[0])
+        self.assertContains(response, "重複")
+
+    def test_clone_excludes_its_source(self):
+        self.user.user_permissions.add(
+            Permission.objects.get(content_type__app_label="telecom", codename="change_prefixlistupdatetask")
+        )
+        url = reverse("telecom:prefixlistupdatetask_clone", kwargs={"pk": self.added.pk})
+        response = self.client.post(url, {
+            "update_type": "add prefix-list",
+            "origin_as": "AS2",
+            "as_path": "AS2",
+            "ipv4_prefix_list": self.added.ipv4_prefix_list,
+            "ipv6_prefix_list": self.added.ipv6_prefix_list,
+        }, follow=True)
+        self.assertRedirects(response, reverse("telecom:prefixlistupdatetask_list"))
+        self.assertEqual(list(response.context["messages"]), [])
+        self.assertEqual(PrefixListUpdateTask.objects.count(), 3)
+
+    def test_preview_aggregation(self):
+        self.user.user_permissions.add(
+            Permission.objects.get(content_type__app_label="telecom", codename="change_prefixlistupdatetask")
+        )
+        task = self.create_task("add prefix-list", "192.0.2.0/25,\r\n192.0.2.128/25,\r\n192.0.2.0/26", "")
+        task.isps.set(Isp.objects.all())
+        url = reverse("telecom:prefixlistupdatetask_previewmailcontent", kwargs={"pk": task.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.context["ipv4_contents"], ["192.0.2.0/25", "192.0.2.128/25", "192.0.2.0/26"])
+        self.assertEqual(response.context["prefix_aggregation"], [])
+        task.aggregate_prefixes = True
+        task.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context["ipv4_contents"], ["192.0.2.0/24 ge 25 le 25", "192.0.2.0/26"])
+        name, before, after, removed, added = response.context["prefix_aggregation"][0]
+        self.assertEqual((name, removed, added), ("IPv4", ["192.0.2.0/25", "192.0.2.128/25"], ["192.0.2.0/24 ge 25 le 25"]))
+        self.assertContains(response, "+ 192.0.2.0/24 ge 25 le 25")
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", I01_FROM_MAIL="i01@example.com")
+class TaskMailTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username="user")
+        department = Group.objects.create(name="I01")
+        department.groupprofile.is_department = True
+        department.groupprofile.save()
+        self.user.groups.add(department)
+        for codename in ["view_prefixlistupdatetask", "change_prefixlistupdatetask"]:
+            self.user.user_permissions.add(Permission.objects.get(content_type__app_label="telecom", codename=codename))
+        self.client.force_login(self.user)
+        self.isps = [
+            Isp.objects.create(
+                name=f"ISP{i}", cname=f"ISP{i}", upstream_as="AS1", primary_contact="contact", to=f"isp{i}@example.com",
+                ip_version=ip_version, created_by=self.user,
+            )
+            for i, ip_version in enumerate(["ipv4", "ipv4&ipv6", "ipv4", "ipv6"])
+        ]
+        self.task = PrefixListUpdateTask.objects.create(
+            update_type="add prefix-list", origin_as="AS2", as_path="AS2", created_by=self.user,
+            ipv4_prefix_list="192.0.2.0/24", ipv6_prefix_list="",
+        )
+        self.task.isps.set(self.isps)
+        file = File(file=ContentFile(b"roa", name="roa.pdf"))
+        file.save()
+        for isp in self.isps[:3]:
+            RoaTaskFileISP.objects.create(task=self.task, file=file, isp=isp)
+
+    def test_send_task_mail(self):
+        url = reverse("telecom:prefixlistupdatetask_sendtaskmail", kwargs={"pk": self.task.pk})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        # The attachments of all the ISPs are fetched once.
+        self.assertEqual(len([query for query in context.captured_queries if "telecom_roataskfileisp" in query["sql"]]), 1)
+        mails = {mail.isp.name: mail for mail in PrefixListUpdateTaskMail.objects.select_related("isp")}
+        self.assertEqual({name: mail.status for name, mail in mails.items()}, {"ISP0": "queued", "ISP1": "queued", "ISP2": "queued", "ISP3": "skipped"})
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.meil_sended_time, "")
+        status_url = reverse("telecom:prefixlistupdatetask_mailstatus", kwargs={"pk": self.task.pk})
+        self.assertFalse(self.client.get(status_url).json()["complete"])
+
+        # The first mail fails for good, the others are sent.
+        OutboxMessage.objects.filter(to="isp0@example.com").update(attempts=4)
+        send_messages = "django.core.mail.backends.locmem.EmailBackend.send_messages"
+        original = __import__("django.core.mail.backends.locmem", fromlist=["EmailBackend"]).EmailBackend.send_messages
+
+        def fail_isp0(backend, messages):
+            if messages[0].to == ["isp0@example.com"]:
+                raise OSError("refused")
+            return original(backend, messages)
+
+        with mock.patch(send_messages, autospec=True, side_effect=fail_isp0), self.assertLogs("core.outbox", "ERROR"):
+            self.assertEqual(outbox.deliver_outbox(workers=2), (2, 1))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["isp1@example.com", "isp2@example.com"])
+        self.assertEqual(mail.outbox[0].attachments[0].get_payload(decode=True), b"roa")
+        data = self.client.get(status_url).json()
+        self.assertTrue(data["complete"])
+        self.assertEqual(data["counts"], {"failed": 1, "sent": 2, "skipped": 1})
+        details = {item["isp"]: item["detail"] for item in data["mails"]}
+        self.assertEqual((details[str(self.isps[0])], details[str(self.isps[3])]), ("OSError: refused", "缺少 IPv6 prefix"))
+        self.task.refresh_from_db()
+        self.assertNotEqual(self.task.meil_sended_time, "")
+        self.assertEqual(data["sended_time"], self.task.meil_sended_time)
+        response = self.client.get(reverse("telecom:prefixlistupdatetask_list"))
+        self.assertEqual(response.context["object_list"][0].mail_summary["counts"]["sent"], 2)
+
+
+    def test_outbox_error_is_recorded(self):
+        enqueue = outbox.enqueue
+
+        def fail_isp1(subject, body, **kwargs):
+            if kwargs["to"] == ["isp1@example.com"]:
+                # A database error, which breaks the transaction it runs in.
+                User.objects.create(username="user")
+            return enqueue(subject, body, **kwargs)
+
+        with mock.patch("core.outbox.enqueue", side_effect=fail_isp1):
+            response = self.client.get(reverse("telecom:prefixlistupdatetask_sendtaskmail", kwargs={"pk": self.task.pk}))
+        self.assertEqual(response.status_code, 302)
+        mails = {mail.isp.name: mail for mail in PrefixListUpdateTaskMail.objects.select_related("isp")}
+        self.assertEqual((mails["ISP1"].status, mails["ISP1"].detail), ("failed", "無法寫入寄件匣"))
+        self.assertEqual({name: mail.status for name, mail in mails.items() if name != "ISP1"}, {"ISP0": "queued", "ISP2": "queued", "ISP3": "skipped"})
+        self.assertEqual(OutboxMessage.objects.count(), 2)
@@ -4,8 +4,9 @@ from .views import (isp_create, isp_delete, isp_list, isp_review, isp_update,
                     ispgroup_create, ispgroup_delete, ispgroup_list,
                     ispgroup_update, prefixlistupdatetask_clone,
                     prefixlistupdatetask_create, prefixlistupdatetask_delete,
-                    prefixlistupdatetask_list, prefixlistupdatetask_update,
+                    prefixlistupdatetask_export, prefixlistupdatetask_list, prefixlistupdatetask_update,
                     prefixlistupdatetask_previewmailcontent, prefixlistupdatetask_sendtaskmail,
+                    prefixlistupdatetask_mailstatus,
                     archive_list, archive_create, archive_update, archive_delete)
 
 app_name = 'telecom'
@@ -21,12 +22,14 @@ urlpatterns = [
     path('ispgroups/<int:pk>/change/', ispgroup_update, name='ispgroup_update'),
     path('ispgroups/<int:pk>/delete/', ispgroup_delete, name='ispgroup_delete'),
     path('prefixlistupdatetasks/', prefixlistupdatetask_list, name='prefixlistupdatetask_list'),
+    path('prefixlistupdatetasks/export/', prefixlistupdatetask_export, name='prefixlistupdatetask_export'),
     path('prefixlistupdatetasks/add/', prefixlistupdatetask_create, name='prefixlistupdatetask_create'),
     path('prefixlistupdatetasks/<int:pk>/change/', prefixlistupdatetask_update, name='prefixlistupdatetask_update'),
     path('prefixlistupdatetasks/<int:pk>/delete/', prefixlistupdatetask_delete, name='prefixlistupdatetask_delete'),
     path('prefixlistupdatetasks/<int:pk>/clone/', prefixlistupdatetask_clone, name='prefixlistupdatetask_clone'),
     path('prefixlistupdatetasks/<int:pk>/previewmailcontent/', prefixlistupdatetask_previewmailcontent, name='prefixlistupdatetask_previewmailcontent'),
     path('prefixlistupdatetasks/<int:pk>/sendtaskmail/', prefixlistupdatetask_sendtaskmail, name='prefixlistupdatetask_sendtaskmail'),
+    path('prefixlistupdatetasks/<int:pk>/mailstatus/', prefixlistupdatetask_mailstatus, name='prefixlistupdatetask_mailstatus'),
     path('telecom_archives/', archive_list, name='archive_list'),
     path('telecom_archives/add/', archive_create, name='archive_create'),
     path('telecom_archives/<int:pk>/change/', archive_update, name='archive_update'),
@@ -1,11 +1,17 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.template.loader import render_to_string
-from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+from accounts.perms import prefetch_obj_perms
+from accounts.visibility import SCOPE_DEPARTMENTS, filter_visible
 from core.decorators import permission_required
+from core.export import export_queryset
+from core.pagination import get_keyset_page
 
 from .forms import (
     IspGroupModelForm,
@@ -17,15 +23,16 @@ from .models import (
     Isp,
     IspGroup,
     PrefixListUpdateTask,
+    PrefixListUpdateTaskMail,
     File,
     Archive,
     RoaTaskFileISP,
     LoaTaskFileISP,
     ExtraFileTaskFileISP,
 )
-from .sendtaskmail import handle_task_mail
+from .sendtaskmail import complete_batches, get_latest_mails, get_task_attachments, handle_task_mail, summarize_mails
 from datetime import datetime
-import os
+import uuid
 
 
 def get_telecom_model_queryset(request, model):
@@ -36,14 +43,7 @@ def get_telecom_model_queryset(request, model):
     or touch those they shouldn't.
     """
     queryset = model.objects.all()
-    role = request.user.profile.activated_role
-    deps = request.user.groups.filter(groupprofile__is_department=True)
-    if not role:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    supervise_roles = role.groupprofile.supervise_roles.all()
-    if not supervise_roles:
-        return queryset.filter(created_by__groups__in=deps).distinct()
-    return queryset.filter(created_by__groups__in=supervise_roles).distinct()
+    return filter_visible(queryset, request.user, fallback=SCOPE_DEPARTMENTS)
 
 
 def get_isp_queryset(request):
@@ -68,17 +68,16 @@ def get_prefixlistupdatetask_queryset(request):
 @permission_required("telecom.view_isp", raise_exception=True, exception=Http404)
 def isp_list(request):
     model = Isp
-    queryset = get_isp_queryset(request)
+    queryset = get_isp_queryset(request).select_related("created_by")
     paginate_by = 5
     template_name = "telecom/isp_list.html"
-    page_number = request.GET.get("page", "")
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != "all" and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         "model": model,
         "page_obj": page_obj,
-        "object_list": page_obj if is_paginated else queryset,
+        "object_list": object_list,
         "is_paginated": is_paginated,
     }
     return render(request, template_name, context)
@@ -161,17 +160,16 @@ def isp_delete(request, pk):
 @permission_required("telecom.view_ispgroup", raise_exception=True, exception=Http404)
 def ispgroup_list(request):
     model = IspGroup
-    queryset = get_ispgroup_queryset(request)
+    queryset = get_ispgroup_queryset(request).select_related("created_by").prefetch_related("isps")
     paginate_by = 5
     template_name = "telecom/ispgroup_list.html"
-    page_number = request.GET.get("page", "")
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != "all" and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         "model": model,
         "page_obj": page_obj,
-        "object_list": page_obj if is_paginated else queryset,
+        "object_list": object_list,
         "is_paginated": is_paginated,
     }
     return render(request, template_name, context)
@@ -241,22 +239,64 @@ def ispgroup_delete(request, pk):
 )
 def prefixlistupdatetask_list(request):
     model = PrefixListUpdateTask
-    queryset = get_prefixlistupdatetask_queryset(request)
+    queryset = (
+        get_prefixlistupdatetask_queryset(request)
+        .select_related("created_by")
+        .prefetch_related("isps", "isp_groups")
+    )
     paginate_by = 5
     template_name = "telecom/prefixlistupdatetask_list.html"
-    page_number = request.GET.get("page", "")
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != "all" and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
+    latest_mails = get_latest_mails([obj.pk for obj in object_list])
+    for obj in object_list:
+        obj.mail_summary = summarize_mails(latest_mails[obj.pk]) if obj.pk in latest_mails else None
     context = {
         "model": model,
         "page_obj": page_obj,
-        "object_list": page_obj if is_paginated else queryset,
+        "object_list": object_list,
         "is_paginated": is_paginated,
     }
     return render(request, template_name, context)
 
 
+@login_required
+@permission_required(
+    "telecom.view_prefixlistupdatetask", raise_exception=True, exception=Http404
+)
+def prefixlistupdatetask_mailstatus(request, pk):
+    queryset = get_prefixlistupdatetask_queryset(request)
+    instance = get_object_or_404(klass=queryset, pk=pk)
+    mails = get_latest_mails([instance.pk]).get(instance.pk, [])
+    data = {
+        "sended_time": instance.meil_sended_time,
+        **summarize_mails(mails),
+        "mails": [
+            {
+                "isp": str(mail.isp),
+                "status": mail.status,
+                "status_display": mail.get_status_display(),
+                "detail": mail.detail,
+            }
+            for mail in mails
+        ],
+    }
+    return JsonResponse(data)
+
+
+@login_required
+@permission_required("telecom.view_prefixlistupdatetask", raise_exception=True, exception=Http404)
+def prefixlistupdatetask_export(request):
+    model = PrefixListUpdateTask
+    queryset = get_prefixlistupdatetask_queryset(request)
+    fields = ["id", "update_type", "origin_as", "as_path", "ipv4_prefix_list", "ipv6_prefix_list",
+              "subject_warning", "related_ticket", "remark", "meil_sended_time"]
+    columns = [(model._meta.get_field(field).verbose_name, field) for field in fields]
+    columns.append((_("Created by"), "created_by__username"))
+    return export_queryset(request, queryset, columns, f"prefixlistupdatetasks_{datetime.now():%Y%m%d}")
+
+
 def handle_file_isp_relationship(task, files, file_prefix, request_post):
     for file in files:
         file_instance = File(file=file)
@@ -280,6 +320,15 @@ def handle_file_isp_relationship(task, files, file_prefix, request_post):
                 )
 
 
+def warn_conflicts(request, form):
+    """
+    Show the conflicts found by `form` on the saved task as a warning, they do not block saving it.
+    """
+    for group in form.conflicts:
+        prefixes = ", ".join(prefix if prefix == other else f"{prefix} ({other})" for prefix, other in group["prefixes"])
+        messages.warning(request, f"{group['kind']} {group['label']}：{prefixes}")
+
+
 @login_required
 @permission_required(
     "telecom.add_prefixlistupdatetask", raise_exception=True, exception=Http404
@@ -300,6 +349,7 @@ def prefixlistupdatetask_create(request):
         if form.is_valid():
             task = form.save(commit=False)
             task.save()
+            warn_conflicts(request, form)
             handle_file_isp_relationship(
                 task, request.FILES.getlist("roa"), "id_roa", request.POST
             )
@@ -351,6 +401,7 @@ def prefixlistupdatetask_update(request, pk):
         if form.is_valid():
             task = form.save(commit=False)
             task.save()
+            warn_conflicts(request, form)
             handle_file_isp_relationship(
                 task, request.FILES.getlist("roa"), "id_roa", request.POST
             )
@@ -452,10 +503,15 @@ def prefixlistupdatetask_clone(request, pk):
     success_url = reverse("telecom:prefixlistupdatetask_list")
     template_name = "telecom/prefixlistupdatetask_form.html"
     if request.method == "POST":
-        form = form_class(data=request.POST, instance=model(created_by=request.user))
+        form = form_class(
+            data=request.POST,
+            instance=model(created_by=request.user),
+            conflict_exclude_pks=[instance.pk],
+        )
         if form.is_valid():
             task = form.save(commit=False)
             task.save()
+            warn_conflicts(request, form)
             handle_file_isp_relationship(
                 task, request.FILES.getlist("roa"), "id_roa", request.POST
             )
@@ -493,8 +549,7 @@ def prefixlistupdatetask_previewmailcontent(request, pk):
     ip_type = "ipv4" if instance.ipv4_prefix_list else "ipv6"
     if instance.ipv4_prefix_list and instance.ipv6_prefix_list:
         ip_type = "ipv4 & ipv6"
-    ipv4_contents = instance.ipv4_prefix_list.split(",\r\n")
-    ipv6_contents = instance.ipv6_prefix_list.split(",\r\n")
+    ipv4_contents, ipv6_contents = instance.get_prefix_contents()
     ispsqs = instance.isps.all()
     ispgroupsqs = (
         Isp.objects.filter(ispgroup__in=instance.isp_groups.all())
@@ -530,6 +585,7 @@ def prefixlistupdatetask_previewmailcontent(request, pk):
         "ip_type": ip_type,
         "ipv4_contents": ipv4_contents,
         "ipv6_contents": ipv6_contents,
+        "prefix_aggregation": instance.get_prefix_aggregation(),
         "taskfileisps": {
             "roa": RoaTaskFileISP.objects.filter(task_id=instance),
             "loa": LoaTaskFileISP.objects.filter(task_id=instance),
@@ -554,8 +610,7 @@ def prefixlistupdatetask_sendtaskmail(request, pk):
     ip_type = "ipv4" if instance.ipv4_prefix_list else "ipv6"
     if instance.ipv4_prefix_list and instance.ipv6_prefix_list:
         ip_type = "ipv4 & ipv6"
-    ipv4_contents = instance.ipv4_prefix_list.split(",\r\n")
-    ipv6_contents = instance.ipv6_prefix_list.split(",\r\n")
+    ipv4_contents, ipv6_contents = instance.get_prefix_contents()
     ispsqs = instance.isps.all()
     ispgroupsqs = (
         Isp.objects.filter(ispgroup__in=instance.isp_groups.all())
@@ -569,67 +624,55 @@ def prefixlistupdatetask_sendtaskmail(request, pk):
     
     # 紀錄 IP version 不符的 ISP
     skipped_isps = []
-    
-    for isp in isps:
-        # 檢查 IP version 相符性
-        if isp.ip_version == 'ipv4' and not instance.ipv4_prefix_list:
-            skipped_isps.append(f"{isp.name}({isp.to}) - 缺少 IPv4 prefix")
-            continue
-        elif isp.ip_version == 'ipv6' and not instance.ipv6_prefix_list:
-            skipped_isps.append(f"{isp.name}({isp.to}) - 缺少 IPv6 prefix")
-            continue
-        elif isp.ip_version == 'ipv4&ipv6' and not (instance.ipv4_prefix_list or instance.ipv6_prefix_list):
-            skipped_isps.append(f"{isp.name}({isp.to}) - 需要同時有 IPv4 與 IPv6 prefix")
-            continue
-            
-        # 原本的寄信邏輯
-        roa_files = RoaTaskFileISP.objects.filter(task_id=instance, isp_id=isp)
-        loa_files = LoaTaskFileISP.objects.filter(task_id=instance, isp_id=isp)
-        extra_files = ExtraFileTaskFileISP.objects.filter(task_id=instance, isp_id=isp)
-        attachments = []
-        for taskfileisp in roa_files:
-            file = taskfileisp.file
-            print(str(file.name))
-            attachments.append((os.path.join(settings.MEDIA_ROOT, str(file.file)), str(file.name)))
-        for taskfileisp in loa_files:
-            file = taskfileisp.file
-            print(str(file.name))
-            attachments.append((os.path.join(settings.MEDIA_ROOT, str(file.file)), str(file.name)))
-        for taskfileisp in extra_files:
-            file = taskfileisp.file
-            print(str(file.name))
-            attachments.append((os.path.join(settings.MEDIA_ROOT, str(file.file)), str(file.name)))
-        context = {
-            "model": model,
-            "task": instance,
-            "isp": isp,
-            "ip_type": ip_type,
-            "ipv4_contents": ipv4_contents,
-            "ipv6_contents": ipv6_contents,
-            "attach_file": attachments,
-        }
-        if isp == hinet_mail:
-            mail_content = render_to_string(template_name_hinet, context)
-        elif isp.eng_mail_type:
-            mail_content = render_to_string(eng_template_name, context)
-        else:
-            mail_content = render_to_string(template_name, context)
-        success = handle_task_mail(isp, instance, mail_content, attachments)
-        if not success:
-            print(request, f"Failed to send email to {isp.to}")
-        else:
-            print(request, f"Successfully sent email to {isp.to}")
-    
+    # Fetched once for all the ISPs, the files are read when the outbox sends the mails.
+    attachments = get_task_attachments(instance)
+    batch = uuid.uuid4().hex
+    mails = []
+
+    with transaction.atomic():
+        for isp in isps:
+            # 檢查 IP version 相符性
+            detail = ""
+            if isp.ip_version == 'ipv4' and not instance.ipv4_prefix_list:
+                detail = "缺少 IPv4 prefix"
+            elif isp.ip_version == 'ipv6' and not instance.ipv6_prefix_list:
+                detail = "缺少 IPv6 prefix"
+            elif isp.ip_version == 'ipv4&ipv6' and not (instance.ipv4_prefix_list or instance.ipv6_prefix_list):
+                detail = "需要同時有 IPv4 與 IPv6 prefix"
+            if detail:
+                skipped_isps.append(f"{isp.name}({isp.to}) - {detail}")
+                mails.append(PrefixListUpdateTaskMail(task=instance, isp=isp, batch=batch, status="skipped", detail=detail))
+                continue
+
+            context = {
+                "model": model,
+                "task": instance,
+                "isp": isp,
+                "ip_type": ip_type,
+                "ipv4_contents": ipv4_contents,
+                "ipv6_contents": ipv6_contents,
+                "attach_file": attachments.get(isp.pk, []),
+            }
+            if isp == hinet_mail:
+                mail_content = render_to_string(template_name_hinet, context)
+            elif isp.eng_mail_type:
+                mail_content = render_to_string(eng_template_name, context)
+            else:
+                mail_content = render_to_string(template_name, context)
+            outbox_message = handle_task_mail(isp, instance, mail_content, attachments.get(isp.pk, []))
+            if outbox_message is None:
+                mails.append(PrefixListUpdateTaskMail(task=instance, isp=isp, batch=batch, status="failed", detail="無法寫入寄件匣"))
+            else:
+                mails.append(PrefixListUpdateTaskMail(task=instance, isp=isp, batch=batch, outbox_message=outbox_message))
+        PrefixListUpdateTaskMail.objects.bulk_create(mails)
+        # The sent time of the task is recorded once the whole batch is sent.
+        complete_batches({batch: instance.pk})
+
     if skipped_isps:
-        from django.contrib import messages
         messages.warning(
             request,
             f"以下 ISP 因 IP 版本不符未寄出通知:\n" + "\n".join(skipped_isps)
         )
-    
-    time_now = datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')
-    instance.meil_sended_time = time_now
-    instance.save()
     task_list_url = reverse("telecom:prefixlistupdatetask_list")
     return redirect(task_list_url)
 
@@ -649,17 +692,16 @@ def get_archive_queryset(request):
 @permission_required("telecom.view_archive", raise_exception=True, exception=Http404)
 def archive_list(request):
     model = Archive
-    queryset = get_archive_queryset(request)
+    queryset = get_archive_queryset(request).select_related("created_by")
     paginate_by = 5
     template_name = "telecom/archive_list.html"
-    page_number = request.GET.get("page", "")
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != "all" and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         "model": model,
         "page_obj": page_obj,
-        "object_list": page_obj if is_paginated else queryset,
+        "object_list": object_list,
         "is_paginated": is_paginated,
     }
     return render(request, template_name, context)
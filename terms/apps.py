@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TermsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'terms'
+
+    def ready(self):
+        import terms.signals  # noqa
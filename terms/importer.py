@@ -0,0 +1,177 @@
+"""
+The Excel import of the glossary.
+
+The rows are streamed from a read-only openpyxl workbook and handled `batch_size` at a time:
+a batch is validated as a whole, then the terms are matched with the existing ones by
+`Terms.short_name_key` in one query, and created or updated with one `bulk_create` and one
+`bulk_update`. So the memory is bounded by the batch and a re-import updates the terms
+instead of duplicating them.
+
+Only the terms created by the importing user are updated, as in `terms_update`; a row
+matching a term of someone else is reported as an error.
+"""
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+
+from .index import invalidate_available_letters
+from .models import INDEX_FIELDS, Terms, normalize_short_name
+
+# {column: field}
+COLUMNS = {
+    'Short Name': 'short_name',
+    'Full Name': 'full_name',
+    'URL': 'url',
+    'Management Department': 'management_department',
+    'Domain Category': 'domain_category',
+    'Description': 'description',
+}
+FIELD_COLUMNS = {field: column for column, field in COLUMNS.items()}
+REQUIRED_FIELDS = ['short_name', 'full_name']
+UPDATE_FIELDS = ['short_name', 'full_name', 'url', 'management_department', 'domain_category', 'description']
+BATCH_SIZE = 500
+
+
+class InvalidWorkbook(Exception):
+    pass
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        # [(row number, message)]
+        self.errors = []
+
+    def __repr__(self):
+        return f'<ImportReport created={self.created} updated={self.updated} unchanged={self.unchanged} errors={len(self.errors)}>'
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def iter_rows(file):
+    """
+    Yield (row number, {field: text}) of the first sheet of the workbook `file`, skipping the empty rows.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [to_text(value) for value in next(rows, ())]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise InvalidWorkbook(f'缺少欄位：{", ".join(missing)}')
+        positions = {field: header.index(column) for column, field in COLUMNS.items()}
+        for row_number, row in enumerate(rows, start=2):
+            values = {field: to_text(row[i]) if i < len(row) else '' for field, i in positions.items()}
+            if any(values.values()):
+                yield row_number, values
+    finally:
+        workbook.close()
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate_batch(batch):
+    """
+    Validate the rows of `batch` field by field. Return ([(row number, values)], [(row number, message)]).
+    """
+    errors = {}
+
+    def check(field, is_invalid, message):
+        for row_number, values in batch:
+            if row_number not in errors and is_invalid(values[field]):
+                errors[row_number] = message
+
+    for field in REQUIRED_FIELDS:
+        check(field, lambda value: not value, f'{FIELD_COLUMNS[field]} 為必填')
+    for field in UPDATE_FIELDS:
+        max_length = Terms._meta.get_field(field).max_length
+        if max_length:
+            check(field, lambda value: len(value) > max_length, f'{FIELD_COLUMNS[field]} 超過 {max_length} 字')
+    validate_url = URLValidator()
+
+    def is_invalid_url(value):
+        if not value:
+            return False
+        try:
+            validate_url(value)
+        except ValidationError:
+            return True
+        return False
+
+    check('url', is_invalid_url, 'URL 格式錯誤')
+    valid = [(row_number, values) for row_number, values in batch if row_number not in errors]
+    return valid, sorted(errors.items())
+
+
+def import_batch(batch, user, report):
+    valid, errors = validate_batch(batch)
+    report.errors.extend(errors)
+    # The last row of a short name in the file wins.
+    rows = {}
+    for row_number, values in valid:
+        key = normalize_short_name(values['short_name'])
+        if key in rows:
+            report.errors.append((rows[key][0], f'與第 {row_number} 列重複，以第 {row_number} 列為準'))
+        rows[key] = (row_number, values)
+    existing = {}
+    for terms in Terms.objects.filter(short_name_key__in=rows).order_by('id'):
+        existing.setdefault(terms.short_name_key, terms)
+    to_create = []
+    to_update = []
+    for key, (row_number, values) in rows.items():
+        values['url'] = values['url'] or None
+        terms = existing.get(key)
+        if terms is None:
+            terms = Terms(created_by=user, **values)
+            terms.update_index_fields()
+            to_create.append(terms)
+        elif terms.created_by_id != user.pk:
+            report.errors.append((row_number, f'「{terms.short_name}」已由其他使用者建立，無法更新'))
+        elif all(getattr(terms, field) == value for field, value in values.items()):
+            report.unchanged += 1
+        else:
+            for field, value in values.items():
+                setattr(terms, field, value)
+            terms.update_index_fields()
+            to_update.append(terms)
+    Terms.objects.bulk_create(to_create)
+    Terms.objects.bulk_update(to_update, UPDATE_FIELDS + INDEX_FIELDS)
+    report.created += len(to_create)
+    report.updated += len(to_update)
+
+
+def import_terms(file, user, batch_size=BATCH_SIZE):
+    """
+    Import the workbook `file` as `user`. Return an `ImportReport`; raise `InvalidWorkbook` if the columns do not match.
+    """
+    report = ImportReport()
+    with transaction.atomic():
+        for batch in iter_batches(iter_rows(file), batch_size):
+            import_batch(batch, user, report)
+    report.errors.sort()
+    invalidate_available_letters()
+    return report
@@ -0,0 +1,52 @@
+"""
+The glossary index: the letters having terms, cached, and the rebuild of the fields
+computed from `Terms.short_name`.
+"""
+from django.core.cache import cache
+
+from core import versions
+
+from .models import INDEX_FIELDS, Terms
+
+AVAILABLE_LETTERS_CACHE_KEY = 'terms:available_letters'
+VERSION_CACHE_KEY = 'terms:available_letters:version'
+
+
+def get_available_letters():
+    """
+    Return the set of the index letters having at least one term.
+    """
+    key = f'{AVAILABLE_LETTERS_CACHE_KEY}:{versions.get_version(VERSION_CACHE_KEY)}'
+    letters = cache.get(key)
+    if letters is None:
+        letters = set(Terms.objects.order_by().values_list('index_letter', flat=True).distinct())
+        cache.set(key, letters, timeout=None)
+    return letters
+
+
+def invalidate_available_letters():
+    versions.bump_version(VERSION_CACHE_KEY)
+
+
+def rebuild(queryset=None, batch_size=1000):
+    """
+    Recompute the `INDEX_FIELDS` of `queryset`, e.g. after adding the fields.
+    Return the number of the changed terms.
+    """
+    queryset = Terms.objects.all() if queryset is None else queryset
+    changed = []
+    count = 0
+    for terms in queryset.only('id', 'short_name', *INDEX_FIELDS).iterator(chunk_size=batch_size):
+        old = [getattr(terms, field) for field in INDEX_FIELDS]
+        terms.update_index_fields()
+        if [getattr(terms, field) for field in INDEX_FIELDS] != old:
+            changed.append(terms)
+        if len(changed) >= batch_size:
+            Terms.objects.bulk_update(changed, INDEX_FIELDS)
+            count += len(changed)
+            changed = []
+    if changed:
+        Terms.objects.bulk_update(changed, INDEX_FIELDS)
+        count += len(changed)
+    invalidate_available_letters()
+    return count
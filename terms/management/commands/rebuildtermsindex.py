@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from terms import index
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the sort key, the index letter and the short name key of every term. '
+        'Run it after adding the fields or after `bulk_create` of terms.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = index.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} terms updated.'))
@@ -1,8 +1,64 @@
+import unicodedata
+
 from django.conf import settings
 from django.db import models
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from pypinyin import Style, lazy_pinyin
+
+SORT_KEY_MAX_LENGTH = 255
+# The fields computed from `short_name`.
+INDEX_FIELDS = ['sort_key', 'index_letter', 'short_name_key']
+
+
+def is_cjk(char):
+    return '\u4e00' <= char <= '\u9fff'
+
+
+def generate_sort_key(short_name):
+    """
+    Latin names sort first by their lowercase, then the CJK names by their bopomofo.
+    """
+    short_name = unicodedata.normalize('NFKC', short_name or '').strip()
+    if not short_name:
+        return ''
+    if is_cjk(short_name[0]):
+        sort_key = 'z_' + ''.join(lazy_pinyin(short_name, style=Style.BOPOMOFO))
+    else:
+        sort_key = 'a_' + short_name.lower()
+    return sort_key[:SORT_KEY_MAX_LENGTH]
+
+
+def normalize_short_name(short_name):
+    """
+    The key to match the same term: NFKC, casefolded and with the spaces collapsed.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', short_name or '').casefold().split())[:100]
+
+
+def get_first_letter(short_name):
+    """
+    Return the uppercase first letter for index purposes.
+    - ASCII alpha first char -> that letter
+    - CJK first char -> first letter of its pinyin romanization
+    - Anything else -> '#'
+    """
+    short_name = unicodedata.normalize('NFKC', short_name or '').strip()
+    if not short_name:
+        return '#'
+    first = short_name[0]
+    if first.isalpha() and first.isascii():
+        return first.upper()
+    if is_cjk(first):
+        pinyin_list = lazy_pinyin(first)
+        if pinyin_list and pinyin_list[0]:
+            pinyin_first = pinyin_list[0][0].upper()
+            if pinyin_first.isascii() and pinyin_first.isalpha():
+                return pinyin_first
+    return '#'
+
+
 class Terms(models.Model):
     id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
     short_name = models.CharField(max_length=100, verbose_name=_('Short Name'))
@@ -12,13 +68,37 @@ class Terms(models.Model):
     domain_category = models.CharField(max_length=255, default="", verbose_name=_('Domain Category'))
     description = models.TextField(verbose_name=_('Description'))
     created_by = models.ForeignKey(verbose_name=_('Created by'), to=settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    # Computed from `short_name` on save, so the glossary is filtered and sorted in SQL.
+    sort_key = models.CharField(max_length=SORT_KEY_MAX_LENGTH, default='', editable=False, verbose_name=_('Sort key'))
+    index_letter = models.CharField(max_length=1, default='#', editable=False, verbose_name=_('Index letter'))
+    short_name_key = models.CharField(max_length=100, default='', editable=False, db_index=True, verbose_name=_('Short name key'))
 
     class Meta:
-        ordering = ['short_name']
+        ordering = ['sort_key', 'id']
         verbose_name = _('Terms')
         verbose_name_plural = _('Terms')
+        indexes = [
+            models.Index(fields=['sort_key', 'id']),
+            models.Index(fields=['index_letter', 'sort_key', 'id']),
+        ]
+
     def __str__(self):
         return f'{self.short_name} - {self.full_name}'
+
+    def save(self, *args, **kwargs):
+        self.update_index_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'short_name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(INDEX_FIELDS)
+        super().save(*args, **kwargs)
+
+    def update_index_fields(self):
+        """
+        Compute `INDEX_FIELDS`. Call it before `bulk_create`, which skips `save`.
+        """
+        self.sort_key = generate_sort_key(self.short_name)
+        self.index_letter = get_first_letter(self.short_name)
+        self.short_name_key = normalize_short_name(self.short_name)
     
     def get_absolute_url(self):
         return reverse('terms:terms_detail', kwargs={'pk': self.pk})
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Terms
+from .index import invalidate_available_letters
+
+
+@receiver(post_save, sender=Terms, dispatch_uid='terms_post_save')
+@receiver(post_delete, sender=Terms, dispatch_uid='terms_post_delete')
+def terms_changed(sender, **kwargs):
+    invalidate_available_letters()
@@ -1,3 +1,134 @@
+import io
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from . import importer, index
+from .models import Terms, generate_sort_key, get_first_letter
+
+User = get_user_model()
+
+
+class TermsIndexTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_terms'))
+        self.client.force_login(self.user)
+        for short_name in ['BGP', 'asn', '路由', 'ACL', '網路', '5G']:
+            Terms.objects.create(short_name=short_name, full_name=short_name, management_department='I01', description='')
+
+    def get_names(self, **params):
+        response = self.client.get(reverse('terms:terms_list'), params)
+        return [terms.short_name for terms in response.context['object_list']], response
+
+    def test_index_fields(self):
+        self.assertEqual((get_first_letter(' 路由'), get_first_letter('bgp'), get_first_letter('5G'), get_first_letter('')), ('L', 'B', '#', '#'))
+        self.assertTrue(generate_sort_key('路由').startswith('z_ㄌ'))
+        terms = Terms.objects.get(short_name='路由')
+        self.assertEqual((terms.index_letter, terms.sort_key), ('L', generate_sort_key('路由')))
+        terms.short_name = 'BGP 路由'
+        terms.save(update_fields=['short_name'])
+        terms.refresh_from_db()
+        self.assertEqual((terms.index_letter, terms.sort_key), ('B', 'a_bgp 路由'))
+
+    def test_list_without_pinyin(self):
+        with mock.patch('terms.models.lazy_pinyin') as lazy_pinyin:
+            names, response = self.get_names()
+            self.assertEqual(names, ['5G', 'ACL', 'asn', 'BGP', '路由', '網路'])
+            self.assertEqual(response.context['total_count'], 6)
+            self.assertEqual(self.get_names(letter='a')[0], ['ACL', 'asn'])
+            self.assertEqual(self.get_names(letter='#')[0], ['5G'])
+            self.assertEqual(self.get_names(letter='W')[0], ['網路'])
+        lazy_pinyin.assert_not_called()
+        self.assertEqual(response.context['available_letters'], {'#', 'A', 'B', 'L', 'W'})
+
+    def test_pages(self):
+        for i in range(20):
+            Terms.objects.create(short_name=f'X{i:02}', full_name='x', management_department='I01', description='')
+        names, response = self.get_names(letter='X')
+        self.assertEqual(names, [f'X{i:02}' for i in range(12)])
+        self.assertEqual(self.get_names(letter='X', cursor=response.context['page_obj'].next_cursor)[0], [f'X{i:02}' for i in range(12, 20)])
+
+    def test_available_letters_cache(self):
+        # The letters once, and the version shared by the workers on each call.
+        with self.assertNumQueries(3):
+            index.get_available_letters()
+            index.get_available_letters()
+        Terms.objects.get(short_name='BGP').delete()
+        self.assertNotIn('B', index.get_available_letters())
+        Terms.objects.bulk_create([Terms(short_name='Zebra', full_name='z', management_department='I01', description='')])
+        self.assertEqual(index.rebuild(), 1)
+        self.assertIn('Z', index.get_available_letters())
+        self.assertEqual(Terms.objects.get(short_name='Zebra').sort_key, 'a_zebra')
+
+
+class TermsImportTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user')
+        self.other = User.objects.create_user(username='other')
+        self.user.user_permissions.add(Permission.objects.get(codename='add_terms'))
+        self.client.force_login(self.user)
+
+    def make_workbook(self, rows, header=importer.COLUMNS):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(list(header))
+        for row in rows:
+            sheet.append(row)
+        f = io.BytesIO()
+        workbook.save(f)
+        f.seek(0)
+        f.name = 'terms.xlsx'
+        return f
+
+    def test_import(self):
+        Terms.objects.create(short_name='BGP', full_name='old', management_department='I01', description='', created_by=self.user)
+        Terms.objects.create(short_name='OSPF', full_name='theirs', management_department='I01', description='', created_by=self.other)
+        rows = [
+            ['bgp', 'Border Gateway Protocol', 'https://example.com/bgp', 'I01', 'Network', 'desc'],
+            ['ACL', 'Access Control List', None, 'I02', '', ''],
+            ['', 'No short name', None, '', '', ''],
+            ['ＡＣＬ', 'Access Control List', None, 'I02', '', 'again'],
+            ['DNS', 'Domain Name System', 'not a url', '', '', ''],
+            [None, None, None, None, None, None],
+            ['ospf', 'Open Shortest Path First', None, '', '', ''],
+            [5, 'Five', None, '', '', ''],
+        ]
+        # Not counting the bump of the letters version in the shared cache.
+        with self.assertNumQueries(7), mock.patch('terms.importer.invalidate_available_letters') as invalidate:
+            report = importer.import_terms(self.make_workbook(rows), self.user, batch_size=4)
+        invalidate.assert_called_once_with()
+        self.assertEqual((report.created, report.updated, report.unchanged), (2, 1, 0))
+        self.assertEqual([row_number for row_number, message in report.errors], [3, 4, 6, 8])
+        self.assertEqual(Terms.objects.count(), 4)
+        bgp = Terms.objects.get(short_name_key='bgp')
+        self.assertEqual((bgp.short_name, bgp.full_name, bgp.url), ('bgp', 'Border Gateway Protocol', 'https://example.com/bgp'))
+        acl = Terms.objects.get(short_name_key='acl')
+        self.assertEqual((acl.description, acl.index_letter, acl.sort_key), ('again', 'A', 'a_acl'))
+        self.assertEqual(Terms.objects.get(short_name='5').index_letter, '#')
+        self.assertEqual(Terms.objects.get(short_name='OSPF').full_name, 'theirs')
+        # A re-import changes nothing.
+        report = importer.import_terms(self.make_workbook(rows), self.user)
+        self.assertEqual((report.created, report.updated, report.unchanged), (0, 0, 3))
+        self.assertEqual(Terms.objects.count(), 4)
 
-# Create your tests here.
+    def test_view(self):
+        response = self.client.post(reverse('terms:terms_import'), {'excel_file': self.make_workbook([['A', 'a', None, '', '', '']], header=['Short Name'])})
+        self.assertEqual(Terms.objects.count(), 0)
+        rows = [['TCP', 'Transmission Control Protocol', None, '', '', ''], ['', 'x', None, '', '', '']]
+        response = self.client.post(reverse('terms:terms_import'), {'excel_file': self.make_workbook(rows)}, follow=True)
+        self.assertEqual([str(message) for message in response.context['messages']][-2:], [
+            '成功匯入 1 筆專有名詞！（新增 1 筆，更新 0 筆）',
+            '第 3 列：Short Name 為必填',
+        ])
+        self.assertIn('T', index.get_available_letters())
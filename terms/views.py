@@ -1,5 +1,4 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -7,17 +6,19 @@ from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
 
 from core.decorators import permission_required
+from core.pagination import get_keyset_page
 
+from . import importer, index
 from .forms import TermsModelForm
 from .models import Terms
 
-from pypinyin import lazy_pinyin, Style
-
 import pandas as pd
 from django.contrib import messages
 from django.http import HttpResponse
 
 ALPHABET = list('ABCDEFGHIJKLMNOPQRSTUVWXYZ') + ['#']
+# The row errors of an import shown as messages.
+IMPORT_ERRORS_SHOWN = 20
 
 
 def get_all_terms_queryset(request):
@@ -26,39 +27,6 @@ def get_all_terms_queryset(request):
     return queryset
 
 
-def generate_sort_key(term):
-    if not term.short_name:
-        return ""
-    first_char = term.short_name.strip()[0]
-    if '\u4e00' <= first_char <= '\u9fff':
-        bopomofo_list = lazy_pinyin(term.short_name, style=Style.BOPOMOFO)
-        bopomofo_str = "".join(bopomofo_list)
-        return f"z_{bopomofo_str}"
-    else:
-        return f"a_{term.short_name.lower()}"
-
-
-def get_first_letter(short_name):
-    """
-    Return the uppercase first letter for index purposes.
-    - ASCII alpha first char -> that letter
-    - CJK first char -> first letter of its pinyin romanization
-    - Anything else -> '#'
-    """
-    if not short_name:
-        return '#'
-    first = short_name.strip()[0]
-    if first.isalpha() and first.isascii():
-        return first.upper()
-    if '\u4e00' <= first <= '\u9fff':
-        pinyin_list = lazy_pinyin(first)
-        if pinyin_list and pinyin_list[0]:
-            pinyin_first = pinyin_list[0][0].upper()
-            if pinyin_first.isalpha():
-                return pinyin_first
-    return '#'
-
-
 @login_required
 @permission_required('terms.view_terms', raise_exception=True, exception=Http404)
 def terms_list(request):
@@ -72,46 +40,32 @@ def terms_list(request):
     # Mutual exclusion: if both somehow arrive, letter takes priority
     if active_letter:
         search_query = ''
-        if active_letter == '#':
-            terms_qs = [t for t in queryset if get_first_letter(t.short_name) == '#']
-        else:
-            terms_qs = [t for t in queryset if get_first_letter(t.short_name) == active_letter]
+        queryset = queryset.filter(index_letter=active_letter)
     elif search_query:
-        terms_qs = list(
-            queryset.filter(
-                Q(short_name__icontains=search_query) |
-                Q(full_name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(management_department__icontains=search_query) |
-                Q(domain_category__icontains=search_query)
-            )
+        queryset = queryset.filter(
+            Q(short_name__icontains=search_query) |
+            Q(full_name__icontains=search_query) |
+            Q(description__icontains=search_query) |
+            Q(management_department__icontains=search_query) |
+            Q(domain_category__icontains=search_query)
         )
-    else:
-        terms_qs = list(queryset)
-
-    sorted_terms_list = sorted(terms_qs, key=generate_sort_key)
-
-    # Letters that have at least one term in the full DB
-    all_short_names = list(queryset.values_list('short_name', flat=True))
-    available_letters = set(get_first_letter(n) for n in all_short_names)
 
     paginate_by = 12  # 12 cards = 6 rows × 2 columns
     template_name = 'terms/terms_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(sorted_terms_list, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    total_count, is_total_exact = page_obj.paginator.get_count()
 
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else sorted_terms_list,
+        'object_list': page_obj,
         'is_paginated': is_paginated,
         'alphabet': ALPHABET,
-        'available_letters': available_letters,
+        'available_letters': index.get_available_letters(),
         'active_letter': active_letter,
         'search_query': search_query,
-        'total_count': len(sorted_terms_list),
+        'total_count': total_count if is_total_exact else f'{total_count}+',
     }
     return render(request, template_name, context)
 
@@ -197,31 +151,21 @@ def terms_import(request):
             messages.error(request, '檔案格式錯誤，請上傳 .xlsx 檔案。')
             return redirect('terms:terms_list')
         try:
-            df = pd.read_excel(excel_file, engine='openpyxl')
-            expected_columns = ['Short Name', 'Full Name', 'URL', 'Management Department', 'Domain Category', 'Description']
-            if not all(col in df.columns for col in expected_columns):
-                messages.error(request, 'Excel 欄位不符，請下載最新範本使用。')
-                return redirect('terms:terms_list')
-            df = df.fillna('')
-            terms_to_create = []
-            for index, row in df.iterrows():
-                if row['Short Name'] and row['Full Name']:
-                    terms_to_create.append(
-                        Terms(
-                            short_name=str(row['Short Name']).strip(),
-                            full_name=str(row['Full Name']).strip(),
-                            url=str(row['URL']).strip() if row['URL'] else None,
-                            management_department=str(row['Management Department']).strip(),
-                            domain_category=str(row['Domain Category']).strip(),
-                            description=str(row['Description']).strip(),
-                            created_by=request.user
-                        )
-                    )
-            if terms_to_create:
-                Terms.objects.bulk_create(terms_to_create)
-                messages.success(request, f'成功匯入 {len(terms_to_create)} 筆專有名詞！')
-            else:
-                messages.warning(request, '沒有找到有效的資料可以匯入，請確認 Excel 內容。')
+            report = importer.import_terms(excel_file, request.user)
+        except importer.InvalidWorkbook as e:
+            messages.error(request, f'Excel 欄位不符，請下載最新範本使用。（{e}）')
+            return redirect('terms:terms_list')
         except Exception as e:
             messages.error(request, f'匯入失敗，發生錯誤：{str(e)}')
+            return redirect('terms:terms_list')
+        if report.imported:
+            messages.success(request, f'成功匯入 {report.imported} 筆專有名詞！（新增 {report.created} 筆，更新 {report.updated} 筆）')
+        if report.unchanged:
+            messages.info(request, f'{report.unchanged} 筆專有名詞無變更。')
+        if not (report.imported or report.unchanged or report.errors):
+            messages.warning(request, '沒有找到有效的資料可以匯入，請確認 Excel 內容。')
+        for row_number, message in report.errors[:IMPORT_ERRORS_SHOWN]:
+            messages.error(request, f'第 {row_number} 列：{message}')
+        if len(report.errors) > IMPORT_ERRORS_SHOWN:
+            messages.error(request, f'另有 {len(report.errors) - IMPORT_ERRORS_SHOWN} 列錯誤未列出。')
     return redirect('terms:terms_list')
\ No newline at end of file
@@ -1,10 +1,11 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
+from accounts.perms import prefetch_obj_perms
 from core.decorators import permission_required
+from core.pagination import get_keyset_page
 
 from .forms import ToolModelForm
 from .models import Tool
@@ -24,17 +25,16 @@ def get_all_tool_queryset(request):
 @permission_required('tool.view_tool', raise_exception=True, exception=Http404)
 def tool_list(request):
     model = Tool
-    queryset = get_all_tool_queryset(request)
+    queryset = get_all_tool_queryset(request).select_related('created_by')
     paginate_by = 5
     template_name = 'tool/tool_list.html'
-    page_number = request.GET.get('page', '')
-    paginator = Paginator(queryset, paginate_by)
-    page_obj = paginator.get_page(page_number)
-    is_paginated = page_number.lower() != 'all' and page_obj.has_other_pages()
+    page_obj = get_keyset_page(request, queryset, paginate_by)
+    is_paginated = page_obj.has_other_pages()
+    object_list = prefetch_obj_perms(request.user, page_obj)
     context = {
         'model': model,
         'page_obj': page_obj,
-        'object_list': page_obj if is_paginated else queryset,
+        'object_list': object_list,
         'is_paginated': is_paginated,
     }
     return render(request, template_name, context)